@@ -62,6 +62,18 @@ CONSOLE_ENCODING = None
 PREFETCHING = True
 MAX_FETCH_COUNT = None
 
+# query cache options (None means unlimited size)
+TRANSLATOR_CACHE_SIZE = 1000    # per Database instance
+CONSTRUCTED_SQL_CACHE_SIZE = 5000  # per Database instance
+AST_CACHE_SIZE = 5000  # shared by all Database instances
+QUERY_RESULT_CACHE_SIZE = 1000  # per Database instance, used by query.cache()
+JSON_CANONICAL_CACHE_SIZE = 1000  # per Json attribute, parsed values of stored JSON used for comparison
+
+# N+1 detection options
+NPLUS1_DETECTION = False  # record attribute loads caused by objects of query results, see db.nplus1_report()
+AUTO_PREFETCH = False  # prefetch such attributes automatically on subsequent executions of the same query
+AUTO_PREFETCH_RATIO = 0.5  # minimal ratio of separately loaded values to the number of fetched objects
+
 # used for select(...).show()
 CONSOLE_WIDTH = 80
 
@@ -5,7 +5,8 @@ from functools import update_wrapper
 
 from pony.thirdparty.compiler import ast
 
-from pony.utils import HashableDict, throw, copy_ast
+from pony import options
+from pony.utils import HashableDict, throw, copy_ast, LRUCache
 
 class TranslationError(Exception): pass
 
@@ -300,8 +301,8 @@ class PreTranslator(ASTTranslator):
                 if node.dstar_args is not None and not node.dstar_args.constant: return
                 node.constant = True
 
-getattr_cache = {}
-extractors_cache = {}
+getattr_cache = LRUCache(options.AST_CACHE_SIZE)
+extractors_cache = LRUCache(options.AST_CACHE_SIZE)
 
 def create_extractors(code_key, tree, globals, locals, special_functions, const_functions, additional_internal_names=()):
     result = None
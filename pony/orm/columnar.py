@@ -0,0 +1,42 @@
+from __future__ import absolute_import, print_function, division
+from pony.py23compat import int_types
+
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+
+try: import numpy
+except ImportError: numpy = None
+
+from pony.utils import throw
+
+def get_dtype(py_type, has_nones):
+    if py_type is bool: return object if has_nones else numpy.bool_
+    if py_type in int_types: return numpy.float64 if has_nones else numpy.int64
+    if py_type is float: return numpy.float64
+    if py_type is datetime: return 'datetime64[us]'
+    if py_type is date: return 'datetime64[D]'
+    if py_type is timedelta: return 'timedelta64[us]'
+    return object
+
+def column_to_array(py_type, values):
+    dtype = get_dtype(py_type, None in values)
+    if dtype is not object:
+        if dtype is numpy.float64: values = [ numpy.nan if value is None else value for value in values ]
+        return numpy.array(values, dtype=dtype)
+    array = numpy.empty(len(values), dtype=object)
+    array[:] = values  # tuples of composite keys must not become nested dimensions
+    return array
+
+def columns_to_arrays(column_types, batches):
+    if numpy is None: throw(ImportError, 'NumPy package is required for query.to_arrays() method')
+    chunks = OrderedDict((name, []) for name in column_types)
+    for batch in batches:
+        for name, py_type in column_types.items():
+            chunks[name].append(column_to_array(py_type, batch[name]))
+    result = OrderedDict()
+    for name, py_type in column_types.items():
+        arrays = chunks[name]
+        if not arrays: result[name] = column_to_array(py_type, [])
+        elif len(arrays) == 1: result[name] = arrays[0]
+        else: result[name] = numpy.concatenate(arrays)
+    return result
@@ -10,7 +10,7 @@ from decimal import Decimal
 from random import shuffle, randint, random
 from threading import Lock, RLock, currentThread as current_thread, _MainThread
 from contextlib import contextmanager
-from collections import defaultdict
+from collections import defaultdict, namedtuple, OrderedDict
 from hashlib import md5
 from inspect import isgeneratorfunction
 
@@ -18,17 +18,18 @@ from pony.thirdparty.compiler import ast, parse
 
 import pony
 from pony import options
+from pony.orm import decompiling, asttranslation
 from pony.orm.decompiling import decompile
 from pony.orm.ormtypes import LongStr, LongUnicode, numeric_types, RawSQL, get_normalized_type_of, Json, TrackedValue
 from pony.orm.asttranslation import ast2src, create_extractors, TranslationError
 from pony.orm.dbapiprovider import (
     DBAPIProvider, DBException, Warning, Error, InterfaceError, DatabaseError, DataError,
-    OperationalError, IntegrityError, InternalError, ProgrammingError, NotSupportedError
+    OperationalError, IntegrityError, InternalError, ProgrammingError, NotSupportedError, PoolTimeoutError, Converter
     )
 from pony import utils
 from pony.utils import localbase, decorator, cut_traceback, cut_traceback_depth, throw, reraise, truncate_repr, \
-     get_lambda_args, pickle_ast, unpickle_ast, deprecated, import_module, parse_expr, is_ident, tostring, strjoin, \
-     between, concat, coalesce, HashableDict
+     get_lambda_args, pickle_ast, unpickle_ast, copy_ast, deprecated, import_module, parse_expr, is_ident, tostring, strjoin, \
+     between, concat, coalesce, HashableDict, LRUCache
 
 __all__ = [
     'pony',
@@ -36,7 +37,7 @@ __all__ = [
     'DBException', 'RowNotFound', 'MultipleRowsFound', 'TooManyRowsFound',
 
     'Warning', 'Error', 'InterfaceError', 'DatabaseError', 'DataError', 'OperationalError',
-    'IntegrityError', 'InternalError', 'ProgrammingError', 'NotSupportedError',
+    'IntegrityError', 'InternalError', 'ProgrammingError', 'NotSupportedError', 'PoolTimeoutError',
 
     'OrmError', 'ERDiagramError', 'DBSchemaError', 'MappingError',
     'TableDoesNotExist', 'TableIsNotEmpty', 'ConstraintError', 'CacheIndexError',
@@ -63,9 +64,10 @@ __all__ = [
 
     'buffer', 'unicode',
 
-    'get_current_user', 'set_current_user', 'perm', 'has_perm',
+    'get_current_user', 'set_current_user', 'perm', 'has_perm', 'filter_viewable',
     'get_user_groups', 'get_user_roles', 'get_object_labels',
-    'user_groups_getter', 'user_roles_getter', 'obj_labels_getter'
+    'user_groups_getter', 'user_roles_getter', 'obj_labels_getter',
+    'user_role_condition', 'obj_label_condition'
 ]
 
 suppress_debug_change = False
@@ -126,8 +128,8 @@ def args2str(args):
     elif isinstance(args, dict):
         return '{%s}' % ', '.join('%s:%s' % (repr(key), repr(val)) for key, val in sorted(iteritems(args)))
 
-adapted_sql_cache = {}
-string2ast_cache = {}
+adapted_sql_cache = LRUCache(options.AST_CACHE_SIZE)
+string2ast_cache = LRUCache(options.AST_CACHE_SIZE)
 
 class OrmError(Exception): pass
 
@@ -367,9 +369,10 @@ select_re = re.compile(r'\s*select\b', re.IGNORECASE)
 class DBSessionContextManager(object):
     __slots__ = 'retry', 'retry_exceptions', 'allowed_exceptions', \
                 'immediate', 'ddl', 'serializable', 'strict', 'optimistic', \
-                'sql_debug', 'show_values'
+                'sql_debug', 'show_values', 'max_objects'
     def __init__(db_session, retry=0, immediate=False, ddl=False, serializable=False, strict=False, optimistic=True,
-                 retry_exceptions=(TransactionError,), allowed_exceptions=(), sql_debug=None, show_values=None):
+                 retry_exceptions=(TransactionError,), allowed_exceptions=(), sql_debug=None, show_values=None,
+                 max_objects=None):
         if retry is not 0:
             if type(retry) is not int: throw(TypeError,
                 "'retry' parameter of db_session must be of integer type. Got: %s" % type(retry))
@@ -389,8 +392,11 @@ class DBSessionContextManager(object):
         db_session.optimistic = optimistic and not serializable
         db_session.retry_exceptions = retry_exceptions
         db_session.allowed_exceptions = allowed_exceptions
+        if max_objects is not None and (type(max_objects) is not int or max_objects < 1): throw(TypeError,
+            "'max_objects' parameter of db_session must be positive integer. Got: %r" % max_objects)
         db_session.sql_debug = sql_debug
         db_session.show_values = show_values
+        db_session.max_objects = max_objects
     def __call__(db_session, *args, **kwargs):
         if not args and not kwargs: return db_session
         if len(args) > 1: throw(TypeError,
@@ -631,6 +637,7 @@ def db_decorator(func, *args, **kwargs):
         raise
 
 class Database(object):
+    query_cache_cls = LRUCache
     def __deepcopy__(self, memo):
         return self  # Database cannot be cloned by deepcopy()
     @cut_traceback
@@ -640,8 +647,15 @@ class Database(object):
         self._insert_cache = {}
 
         # ER-diagram related stuff:
-        self._translator_cache = {}
-        self._constructed_sql_cache = {}
+        self._translator_cache = self.query_cache_cls(options.TRANSLATOR_CACHE_SIZE)
+        self._constructed_sql_cache = self.query_cache_cls(options.CONSTRUCTED_SQL_CACHE_SIZE)
+        self._persistent_query_cache = None
+        self._second_level_cache = None
+        self._query_result_cache = self.query_cache_cls(options.QUERY_RESULT_CACHE_SIZE)
+        self._read_tables_cache = self.query_cache_cls(options.TRANSLATOR_CACHE_SIZE)
+        self._table_versions = {}  # table name -> number of committed writes, None key counts unknown writes
+        self._table_versions_lock = Lock()
+        self._nplus1_stats = {}  # query key -> NPlusOneStat
         self.entities = {}
         self.schema = None
         self.Entity = type.__new__(EntityMeta, 'Entity', (Entity,), {})
@@ -652,6 +666,7 @@ class Database(object):
         self._global_stats_lock = RLock()
         self._dblocal = DbLocal()
 
+        self.json_codec = json
         self.provider = None
         if args or kwargs: self._bind(*args, **kwargs)
     @cut_traceback
@@ -673,6 +688,14 @@ class Database(object):
             provider_module = import_module('pony.orm.dbproviders.' + provider)
             provider_cls = provider_module.provider_cls
         self.provider = provider_cls(*args, **kwargs)
+        self.provider.json_codec = self.json_codec
+    @cut_traceback
+    def set_json_codec(database, codec=None):
+        if codec is None: codec = json
+        elif not callable(getattr(codec, 'dumps', None)) or not callable(getattr(codec, 'loads', None)):
+            throw(TypeError, 'JSON codec should have dumps() and loads() functions. Got: %r' % codec)
+        database.json_codec = codec
+        if database.provider is not None: database.provider.json_codec = codec
     @property
     def last_sql(database):
         return database._dblocal.last_sql
@@ -702,6 +725,82 @@ class Database(object):
         deprecated(3, "global_stats_lock is deprecated, just use global_stats property without any locking")
         return database._global_stats_lock
     @cut_traceback
+    def set_query_cache_size(database, **kwargs):
+        for name, size in iteritems(kwargs):
+            if name == 'translator_cache_size': database._translator_cache.resize(size)
+            elif name == 'sql_cache_size': database._constructed_sql_cache.resize(size)
+            elif name == 'result_cache_size': database._query_result_cache.resize(size)
+            else: throw(TypeError, 'Unknown query cache option: %r' % name)
+    @property
+    def query_cache_stats(database):
+        return {'translator_cache': database._translator_cache.stats,
+                'sql_cache': database._constructed_sql_cache.stats,
+                'result_cache': database._query_result_cache.stats,
+                'ast_cache': decompiling.ast_cache.stats,
+                'string2ast_cache': string2ast_cache.stats,
+                'extractors_cache': asttranslation.extractors_cache.stats}
+    @cut_traceback
+    def nplus1_report(database):
+        stats = [ stat for stat in database._nplus1_stats.values() if stat.nplus1_attrs ]
+        stats.sort(key=lambda stat: -builtins.sum(stat.loads[attr] for attr in stat.nplus1_attrs))
+        return stats
+    @cut_traceback
+    def clear_nplus1_stats(database):
+        database._nplus1_stats.clear()
+    @property
+    def pool_stats(database):
+        provider = database.provider
+        if provider is None: throw(MappingError, 'Database object is not bound with a provider yet')
+        return provider.pool.stats
+    @cut_traceback
+    def compile(database, func):
+        return PreparedQuery(database, func)
+    @cut_traceback
+    def set_persistent_query_cache(database, filename, autosave=True):
+        if filename is None:
+            database._persistent_query_cache = None
+            return None
+        from pony.orm.querycache import PersistentQueryCache
+        cache = database._persistent_query_cache = PersistentQueryCache(database, filename, autosave)
+        return cache
+    @property
+    def persistent_query_cache(database):
+        return database._persistent_query_cache
+    def _get_translator(database, query_key, build):
+        translator = database._translator_cache.get(query_key)
+        if translator is not None: return translator
+        persistent_cache = database._persistent_query_cache
+        if persistent_cache is not None: translator = persistent_cache.get_translator(query_key, build)
+        if translator is None:
+            translator = build()
+            if persistent_cache is not None: persistent_cache.put_translator(query_key, translator)
+        database._translator_cache[query_key] = translator
+        return translator
+    @cut_traceback
+    def set_second_level_cache(database, backend=None, ttl=None, maxsize=10000):
+        from pony.orm.entitycache import SecondLevelCache
+        cache = database._second_level_cache = SecondLevelCache(backend, ttl, maxsize)
+        return cache
+    @property
+    def second_level_cache(database):
+        cache = database._second_level_cache
+        if cache is None:
+            from pony.orm.entitycache import SecondLevelCache
+            cache = database._second_level_cache = SecondLevelCache()
+        return cache
+    @cut_traceback
+    def clear_query_caches(database, global_caches=True):
+        database._translator_cache.clear()
+        database._constructed_sql_cache.clear()
+        database._query_result_cache.clear()
+        database._read_tables_cache.clear()
+        if global_caches:
+            decompiling.ast_cache.clear()
+            string2ast_cache.clear()
+            adapted_sql_cache.clear()
+            asttranslation.getattr_cache.clear()
+            asttranslation.extractors_cache.clear()
+    @cut_traceback
     def get_connection(database):
         cache = database._get_cache()
         if not cache.in_transaction:
@@ -719,6 +818,29 @@ class Database(object):
         cache = local.db2cache.get(database)
         if cache is not None: cache.rollback()
         provider.disconnect()
+    def _get_table_versions(database, tables):
+        versions = database._table_versions
+        return tuple(versions.get(table, 0) for table in (None,) + tables)
+    def _invalidate_tables(database, tables):
+        with database._table_versions_lock:
+            versions = database._table_versions
+            for table in tables: versions[table] = versions.get(table, 0) + 1
+    def _get_cached_query_rows(database, query_key, tables):
+        entry = database._query_result_cache.get(query_key)
+        if entry is None: return None
+        versions, expires, rows = entry
+        if versions != database._get_table_versions(tables) or expires is not None and expires < time():
+            database._query_result_cache.pop(query_key)
+            return None
+        return rows
+    def _put_cached_query_rows(database, query_key, versions, ttl, rows):
+        expires = None if ttl is None else time() + ttl
+        database._query_result_cache[query_key] = versions, expires, rows
+    def _count_cached_query(database, sql):
+        stats = database._dblocal.stats
+        stat = stats.get(sql)
+        if stat is not None: stat.cache_count += 1
+        else: stats[sql] = QueryStat(sql)
     def _get_cache(database):
         if database.provider is None: throw(MappingError, 'Database object is not bound with a provider yet')
         cache = local.db2cache.get(database)
@@ -744,7 +866,11 @@ class Database(object):
             except: transact_reraise(RollbackException, [sys.exc_info()])
     @cut_traceback
     def execute(database, sql, globals=None, locals=None):
-        return database._exec_raw_sql(sql, globals, locals, frame_depth=cut_traceback_depth+1, start_transaction=True)
+        cursor = database._exec_raw_sql(sql, globals, locals, frame_depth=cut_traceback_depth+1, start_transaction=True)
+        cache = database._get_cache()
+        cache.all_tables_written = True  # raw SQL can modify any table
+        cache.second_level_cleared = True
+        return cursor
     def _exec_raw_sql(database, sql, globals, locals, frame_depth, start_transaction=False):
         provider = database.provider
         if provider is None: throw(MappingError, 'Database object is not bound with a provider yet')
@@ -802,6 +928,7 @@ class Database(object):
             database._insert_cache[query_key] = cached_sql
         else: sql, adapter = cached_sql
         arguments = adapter(values_list(kwargs))  # order of values same as order of keys
+        database._get_cache().written_tables.add(table_name)
         if returning is not None:
             return database._exec_sql(sql, arguments, returning_id=True, start_transaction=True)
         cursor = database._exec_sql(sql, arguments, start_transaction=True)
@@ -809,18 +936,18 @@ class Database(object):
     def _ast2sql(database, sql_ast):
         sql, adapter = database.provider.ast2sql(sql_ast)
         return sql, adapter
-    def _exec_sql(database, sql, arguments=None, returning_id=False, start_transaction=False):
+    def _exec_sql(database, sql, arguments=None, returning_id=False, start_transaction=False, server_side_cursor=False):
         cache = database._get_cache()
         if start_transaction: cache.immediate = True
         connection = cache.prepare_connection_for_query_execution()
-        cursor = connection.cursor()
-        if local.debug: log_sql(sql, arguments)
         provider = database.provider
+        cursor = provider.server_side_cursor(connection) if server_side_cursor else connection.cursor()
+        if local.debug: log_sql(sql, arguments)
         t = time()
         try: new_id = provider.execute(cursor, sql, arguments, returning_id)
         except Exception as e:
             connection = cache.reconnect(e)
-            cursor = connection.cursor()
+            cursor = provider.server_side_cursor(connection) if server_side_cursor else connection.cursor()
             if local.debug: log_sql(sql, arguments)
             t = time()
             new_id = provider.execute(cursor, sql, arguments, returning_id)
@@ -843,6 +970,11 @@ class Database(object):
             entity._link_reverse_attrs_()
         for entity in entities:
             entity._check_table_options_()
+        for entity in entities:
+            entity._assign_value_indexes_()
+        for entity in entities:
+            if entity._root_ is entity and entity._compact_values_:
+                entity._compact_values_class_ = make_compact_values_class(entity._value_attrs_)
 
         def get_columns(table, column_names):
             column_dict = table.column_dict
@@ -1057,6 +1189,7 @@ class Database(object):
         for table_name in existed_tables:
             if local.debug: log_orm('DROPPING TABLE %s' % provider.format_table_name(table_name))
             provider.drop_table(connection, table_name)
+        cache.written_tables.update(existed_tables)
     @cut_traceback
     @db_session(ddl=True)
     def create_tables(database, check_tables=False):
@@ -1087,6 +1220,8 @@ class Database(object):
         finally:
             assert local.perms_context and local.perms_context[0] is database
             local.perms_context = None
+    def _clear_perm_matrix(database):
+        for entity in itervalues(database.entities): entity._perm_matrix_.clear()
     def _get_schema_dict(database):
         result = []
         user = get_current_user()
@@ -1116,11 +1251,22 @@ class Database(object):
             result.append(d)
         return result
     def _get_schema_json(database):
+        # the standard json module is used here, so schema_hash does not depend on the configured codec
         schema_json = json.dumps(database._get_schema_dict(), default=basic_converter, sort_keys=True)
         schema_hash = md5(schema_json.encode('utf-8')).hexdigest()
         return schema_json, schema_hash
     @cut_traceback
     def to_json(database, data, include=(), exclude=(), converter=None, with_schema=True, schema_hash=None):
+        return ''.join(database._iter_json(data, include, exclude, converter, with_schema, schema_hash))
+    @cut_traceback
+    def iter_json(database, data, include=(), exclude=(), converter=None, with_schema=True, schema_hash=None):
+        return database._iter_json(data, include, exclude, converter, with_schema, schema_hash)
+    @cut_traceback
+    def dump_json(database, data, fp, include=(), exclude=(), converter=None, with_schema=True, schema_hash=None):
+        for chunk in database._iter_json(data, include, exclude, converter, with_schema, schema_hash):
+            fp.write(chunk)
+    def _iter_json(database, data, include, exclude, converter, with_schema, schema_hash):
+        # objects are collected and checked eagerly, so errors are raised before the first chunk is produced
         for attrs, param_name in ((include, 'include'), (exclude, 'exclude')):
             for attr in attrs:
                 if not isinstance(attr, Attribute): throw(TypeError,
@@ -1137,6 +1283,7 @@ class Database(object):
                                    % (user, sorted(user_groups), obj))
 
         object_set = set()
+        object_list = []
         caches = set()
         def obj_converter(obj):
             if not isinstance(obj, Entity): return converter(obj)
@@ -1144,71 +1291,111 @@ class Database(object):
             if cache is not None: caches.add(cache)
             if len(caches) > 1: throw(TransactionError,
                 'An attempt to serialize objects belonging to different transactions')
-            if not can_view(user, obj):
-                user_has_no_rights_to_see(obj)
-            object_set.add(obj)
+            if obj not in object_set:
+                if not can_view(user, obj):
+                    user_has_no_rights_to_see(obj)
+                object_set.add(obj)
+                object_list.append(obj)
             pkval = obj._get_raw_pkval_()
             if len(pkval) == 1: pkval = pkval[0]
             return { 'class': obj.__class__.__name__, 'pk': pkval }
 
-        data_json = json.dumps(data, default=obj_converter)
+        codec = database.json_codec
+        data_json = codec.dumps(data, default=obj_converter)
+
+        def get_json_attrs(entity):
+            result = []
+            for attr in entity._attrs_:
+                if attr in exclude: continue
+                if attr in include: pass
+                elif attr.is_collection: continue
+                elif attr.lazy: continue
+                if attr.is_collection and not isinstance(attr, Set): throw(NotImplementedError)
+                result.append(attr)
+            return result
 
-        objects = {}
         if caches:
             cache = caches.pop()
             if cache.database is not database:
                 throw(TransactionError, 'An object does not belong to specified database')
-            object_list = list(object_set)
-            objects = {}
-            for obj in object_list:
-                if obj in cache.seeds[obj._pk_attrs_]: obj._load_()
-                entity = obj.__class__
-                if not can_view(user, obj):
-                    user_has_no_rights_to_see(obj)
-                d = objects.setdefault(entity.__name__, {})
-                for val in obj._get_raw_pkval_(): d = d.setdefault(val, {})
-                assert not d, d
-                for attr in obj._attrs_:
-                    if attr in exclude: continue
-                    if attr in include: pass
-                        # if attr not in entity_perms.can_read: user_has_no_rights_to_see(obj, attr)
-                    elif attr.is_collection: continue
-                    elif attr.lazy: continue
-                    # elif attr not in entity_perms.can_read: continue
-
-                    if attr.is_collection:
-                        if not isinstance(attr, Set): throw(NotImplementedError)
-                        value = []
-                        for item in attr.__get__(obj):
-                            if item not in object_set:
+            # objects are loaded and related objects are discovered by batches, level by level
+            start = 0
+            while start < len(object_list):
+                batch = object_list[start:]
+                start = len(object_list)
+                groups = OrderedDict()
+                for obj in batch: groups.setdefault(obj.__class__, []).append(obj)
+                for entity, objects in iteritems(groups):
+                    entity._load_many_(objects)
+                    attrs = get_json_attrs(entity)
+                    for attr in attrs:
+                        if attr.is_collection or attr.lazy or not attr.columns: attr.load_many(objects)
+                    related_attrs = [ attr for attr in attrs if attr.is_relation and attr in include ]
+                    for obj in objects:
+                        for attr in related_attrs:
+                            value = attr.__get__(obj)
+                            items = value if attr.is_collection else () if value is None else (value,)
+                            for item in items:
+                                if item in object_set: continue
+                                if not can_view(user, item): user_has_no_rights_to_see(item)
                                 object_set.add(item)
                                 object_list.append(item)
-                            pkval = item._get_raw_pkval_()
-                            value.append(pkval[0] if len(pkval) == 1 else pkval)
-                        value.sort()
-                    else:
-                        value = attr.__get__(obj)
-                        if value is not None and attr.is_relation:
-                            if attr in include and value not in object_set:
-                                object_set.add(value)
-                                object_list.append(value)
-                            pkval = value._get_raw_pkval_()
-                            value = pkval[0] if len(pkval) == 1 else pkval
-
-                    d[attr.name] = value
-        objects_json = json.dumps(objects, default=converter)
-        if not with_schema:
-            return '{"data": %s, "objects": %s}' % (data_json, objects_json)
-        schema_json, new_schema_hash = database._get_schema_json()
-        if schema_hash is not None and schema_hash == new_schema_hash:
-            return '{"data": %s, "objects": %s, "schema_hash": "%s"}' \
-                   % (data_json, objects_json, new_schema_hash)
-        return '{"data": %s, "objects": %s, "schema": %s, "schema_hash": "%s"}' \
-               % (data_json, objects_json, schema_json, new_schema_hash)
+
+        def get_object_json(obj):
+            d = {}
+            for attr in get_json_attrs(obj.__class__):
+                if attr.is_collection:
+                    value = []
+                    for item in attr.__get__(obj):
+                        pkval = item._get_raw_pkval_()
+                        value.append(pkval[0] if len(pkval) == 1 else pkval)
+                    value.sort()
+                else:
+                    value = attr.__get__(obj)
+                    if value is not None and attr.is_relation:
+                        pkval = value._get_raw_pkval_()
+                        value = pkval[0] if len(pkval) == 1 else pkval
+                d[attr.name] = value
+            return codec.dumps(d, default=converter)
+
+        def iter_objects_json():
+            # produces the same JSON as {entity_name: {pk_part1: {pk_part2: {..., attr_name: value}}}} dict
+            groups = OrderedDict()
+            for obj in object_list: groups.setdefault(obj.__class__.__name__, []).append(obj)
+            yield '{'
+            for i, (entity_name, objects) in enumerate(iteritems(groups)):
+                if i: yield ', '
+                yield '%s: {' % codec.dumps(entity_name)
+                prev_pkval = ()
+                for pkval, obj in sorted(((obj._get_raw_pkval_(), obj) for obj in objects), key=itemgetter(0)):
+                    if prev_pkval:
+                        common = 0
+                        while prev_pkval[common] == pkval[common]: common += 1
+                        yield '}' * (len(pkval) - 1 - common) + ', '
+                    else: common = 0
+                    yield ''.join(json_key(val) + ': {' for val in pkval[common:-1])
+                    yield json_key(pkval[-1]) + ': ' + get_object_json(obj)
+                    prev_pkval = pkval
+                yield '}' * len(prev_pkval)
+            yield '}'
+
+        def iter_chunks():
+            yield '{"data": '
+            yield data_json
+            yield ', "objects": '
+            for chunk in iter_objects_json(): yield chunk
+            if with_schema:
+                schema_json, new_schema_hash = database._get_schema_json()
+                if schema_hash is None or schema_hash != new_schema_hash:
+                    yield ', "schema": '
+                    yield schema_json
+                yield ', "schema_hash": "%s"' % new_schema_hash
+            yield '}'
+        return iter_chunks()
     @cut_traceback
     @db_session
     def from_json(database, changes, observer=None):
-        changes = json.loads(changes)
+        changes = database.json_codec.loads(changes)
 
         import pprint; pprint.pprint(changes)
 
@@ -1319,6 +1506,10 @@ class Database(object):
 
         return deserialize(changes['data'])
 
+def json_key(key):
+    # encodes the key of JSON object exactly as json.dumps() does it
+    return json.dumps({key: 0})[1:-4]
+
 def basic_converter(x):
     if isinstance(x, (datetime.datetime, datetime.date, Decimal)):
         return str(x)
@@ -1378,6 +1569,7 @@ class AccessRule(object):
         for entity in entities:
             for perm in rule.permissions:
                 entity._access_rules_[perm].add(rule)
+        database._clear_perm_matrix()
     def exclude(rule, *args):
         for arg in args:
             if isinstance(arg, EntityMeta):
@@ -1389,6 +1581,7 @@ class AccessRule(object):
                 if attr.pk_offset is not None: throw(TypeError, 'Primary key attribute %s cannot be excluded' % attr)
                 rule.attrs_to_exclude.add(attr)
             else: throw(TypeError, 'Entity or attribute expected. Got: %r' % arg)
+        rule.database._clear_perm_matrix()
 
 @cut_traceback
 def has_perm(user, perm, x):
@@ -1401,50 +1594,37 @@ def has_perm(user, perm, x):
         entity = x.entity
     else: throw(TypeError, "The third parameter of 'has_perm' function should be entity class, entity instance "
                            "or attribute. Got: %r" % x)
-    access_rules = entity._access_rules_.get(perm)
-    if not access_rules: return False
+    if not entity._access_rules_.get(perm): return False
+    allowed, attrs, row_rules = entity._get_perm_entry_(perm, get_user_groups(user))
+    if isinstance(x, EntityMeta): return allowed
+    if isinstance(x, Attribute): return x in attrs
+    if not allowed: return False
+    if row_rules is None: return True
     cache = entity._database_._get_cache()
     perm_cache = cache.perm_cache[user][perm]
     result = perm_cache.get(x)
-    if result is not None: return result
+    if result is None: result = perm_cache[x] = check_row_rules(user, x, row_rules)
+    return result
+
+def check_row_rules(user, obj, row_rules):
+    user_roles = get_user_roles(user, obj)
+    obj_labels = get_object_labels(obj)
+    for roles, labels in row_rules:
+        if user_roles.issuperset(roles) and obj_labels.issuperset(labels): return True
+    return False
+
+@cut_traceback
+def filter_viewable(user, objects):
     user_groups = get_user_groups(user)
-    result = False
-    if isinstance(x, EntityMeta):
-        for rule in access_rules:
-            if user_groups.issuperset(rule.groups) and entity not in rule.entities_to_exclude:
-                result = True
-                break
-    elif isinstance(x, Attribute):
-        attr = x
-        for rule in access_rules:
-            if user_groups.issuperset(rule.groups) and entity not in rule.entities_to_exclude \
-                                                   and attr not in rule.attrs_to_exclude:
-                result = True
-                break
-            reverse = attr.reverse
-            if reverse:
-                reverse_rules = reverse.entity._access_rules_.get(perm)
-                if not reverse_rules: return False
-                for reverse_rule in access_rules:
-                    if user_groups.issuperset(reverse_rule.groups) \
-                            and reverse.entity not in reverse_rule.entities_to_exclude \
-                            and reverse not in reverse_rule.attrs_to_exclude:
-                        result = True
-                        break
-                if result: break
-    else:
-        obj = x
-        user_roles = get_user_roles(user, obj)
-        obj_labels = get_object_labels(obj)
-        for rule in access_rules:
-            if x in rule.entities_to_exclude: continue
-            elif not user_groups.issuperset(rule.groups): pass
-            elif not user_roles.issuperset(rule.roles): pass
-            elif not obj_labels.issuperset(rule.labels): pass
-            else:
-                result = True
-                break
-    perm_cache[perm] = result
+    entity_rules = {}
+    result = []
+    for obj in objects:
+        if not isinstance(obj, Entity): throw(TypeError, 'Entity instance expected. Got: %r' % obj)
+        entity = obj.__class__
+        row_rules = entity_rules.get(entity, NOT_LOADED)
+        if row_rules is NOT_LOADED:
+            row_rules = entity_rules[entity] = entity._get_view_rules_(user_groups)
+        if row_rules is None or row_rules and check_row_rules(user, obj, row_rules): result.append(obj)
     return result
 
 def can_view(user, x):
@@ -1545,6 +1725,97 @@ def obj_labels_getter(cls=None):
         return func
     return decorator
 
+userrole_conditions = []
+objlabel_conditions = []
+row_rules_condition_cache = {}
+row_condition_counter = itertools.count()
+
+def user_role_condition(user_cls, obj_cls, role, condition):
+    # condition is a lambda or its text which receives an object and can refer to the current user as `user`
+    if not is_ident(role): throw(TypeError, 'Role name should be identifier. Got: %s' % role)
+    globals, locals = sys._getframe(1).f_globals, sys._getframe(1).f_locals
+    userrole_conditions.append((user_cls, role, parse_row_condition(obj_cls, condition, globals, locals)))
+    row_rules_condition_cache.clear()
+
+def obj_label_condition(obj_cls, label, condition):
+    if not is_ident(label): throw(TypeError, 'Label name should be identifier. Got: %s' % label)
+    globals, locals = sys._getframe(1).f_globals, sys._getframe(1).f_locals
+    objlabel_conditions.append((label, parse_row_condition(obj_cls, condition, globals, locals)))
+    row_rules_condition_cache.clear()
+
+def parse_row_condition(obj_cls, condition, globals, locals):
+    if not isinstance(obj_cls, EntityMeta): throw(TypeError, 'Entity class expected. Got: %r' % obj_cls)
+    if isinstance(condition, basestring):
+        tree = string2ast(condition)
+        if not isinstance(tree, ast.Lambda): throw(TypeError, 'Condition text should represent lambda. Got: %s' % condition)
+        argnames = get_lambda_args(tree)
+        tree = tree.code
+        cells = {}
+    elif type(condition) is types.FunctionType:
+        argnames = get_lambda_args(condition)
+        tree, external_names, cells = decompile(condition)
+        globals = condition.func_globals if PY2 else condition.__globals__
+        locals = {}
+    else: throw(TypeError, 'Condition should be a lambda function or its text. Got: %r' % condition)
+    if len(argnames) != 1: throw(TypeError, 'Condition lambda should have exactly one argument. Got: %s' % len(argnames))
+    tree = copy_ast(tree)
+    # external names get a per-condition prefix, so closures from the same factory do not share a namespace
+    prefix = 'c%d_' % next(row_condition_counter)
+    names = {}  # new name -> original name
+    def rename(node):
+        if isinstance(node, ast.Name):
+            name = node.name
+            if name == argnames[0]: node.name = 'obj_'
+            elif name != 'user' and (name in cells or name in locals or name in globals):
+                node.name = prefix + name
+                names[node.name] = name
+        for child in node.getChildNodes(): rename(child)
+    rename(tree)
+    return obj_cls, tree, names, globals, locals, cells
+
+def make_row_rules_condition(user, entity, row_rules):
+    # returns text of lambda which checks roles and labels of row_rules on the database side, and names used in it
+    key = entity, row_rules, user.__class__
+    cached = row_rules_condition_cache.get(key)
+    if cached is None:
+        conditions = []
+        alternatives = []
+        def get_tree(kind, name, items):
+            trees = []
+            for obj_cls, tree, names, globals, locals, cells in items:
+                if not issubclass(entity, obj_cls): continue
+                trees.append(tree)
+                conditions.append((names, globals, locals, cells))
+            if not trees: throw(TypeError, '%s %r cannot be checked in SQL for entity %s. '
+                                           'Use %s_condition() to declare it' % (kind.capitalize(), name, entity.__name__,
+                                           'user_role' if kind == 'role' else 'obj_label'))
+            return trees[0] if len(trees) == 1 else ast.Or(trees)
+        for roles, labels in row_rules:
+            trees = []
+            for role in sorted(roles):
+                if role == 'self':
+                    trees.append(ast.Compare(ast.Name('obj_'), [ ('==', ast.Name('user')) ])
+                                 if isinstance(user, entity) else ast.Name('False'))
+                    continue
+                trees.append(get_tree('role', role, [ item for user_cls, role_name, item in userrole_conditions
+                    if role_name == role and (user_cls is None or isinstance(user, user_cls)) ]))
+            for label in sorted(labels):
+                trees.append(get_tree('label', label, [ item for label_name, item in objlabel_conditions
+                                                        if label_name == label ]))
+            alternatives.append(trees[0] if len(trees) == 1 else ast.And(trees))
+        if not alternatives: tree = ast.Name('False')
+        else: tree = alternatives[0] if len(alternatives) == 1 else ast.Or(alternatives)
+        cached = row_rules_condition_cache[key] = 'lambda obj_: %s' % ast2src(tree), conditions
+    text, conditions = cached
+    namespace = {}
+    for names, globals, locals, cells in conditions:
+        for new_name, name in iteritems(names):
+            if name in cells: namespace[new_name] = cells[name].cell_contents
+            elif name in locals: namespace[new_name] = locals[name]
+            elif name in globals: namespace[new_name] = globals[name]
+    namespace['user'] = user
+    return text, namespace
+
 class DbLocal(localbase):
     def __init__(dblocal):
         dblocal.stats = {}
@@ -1594,6 +1865,28 @@ class QueryStat(object):
         if not stat.db_count: return None
         return stat.sum_time / stat.db_count
 
+class NPlusOneStat(object):
+    def __init__(stat, entity, sql):
+        stat.entity = entity
+        stat.sql = sql
+        stat.executions = 0
+        stat.objects = 0
+        stat.loads = {}  # attr -> number of queries which loaded attribute for a single object
+        stat.prefetched = set()
+    def __repr__(stat):
+        return '<NPlusOneStat %s: %s>' % (stat.entity.__name__, ', '.join(
+            '%s (%d loads)' % (attr.name, stat.loads[attr]) for attr in stat.nplus1_attrs))
+    def is_nplus1_attr(stat, attr):
+        count = stat.loads.get(attr, 0)
+        return count > 1 and count >= stat.objects * options.AUTO_PREFETCH_RATIO
+    @property
+    def nplus1_attrs(stat):
+        return sorted(attr for attr in stat.loads if attr in stat.prefetched or stat.is_nplus1_attr(attr))
+    def get_prefetch_attrs(stat):
+        for attr in stat.loads:
+            if attr not in stat.prefetched and stat.is_nplus1_attr(attr): stat.prefetched.add(attr)
+        return stat.prefetched
+
 class SessionCache(object):
     def __init__(cache, database):
         cache.is_alive = True
@@ -1604,16 +1897,28 @@ class SessionCache(object):
         cache.seeds = defaultdict(set)
         cache.max_id_cache = {}
         cache.collection_statistics = {}
+        cache.count_statistics = {}
         cache.for_update = set()
         cache.noflush_counter = 0
         cache.modified_collections = defaultdict(set)
         cache.objects_to_save = []
         cache.saved_objects = []
+        cache.cascade_deletes = {}  # obj -> collections whose items should be deleted by set-based DELETE
+        cache.second_level_updates = {}  # key -> (entry, ttl), rows read in the current transaction
+        cache.second_level_invalidated = set()  # keys of objects saved in the current transaction
+        cache.second_level_cleared = False
+        cache.second_level_version = cache.get_second_level_version()  # taken before the transaction starts
+        cache.written_tables = set()  # tables modified in the current transaction
+        cache.all_tables_written = False
         cache.query_results = {}
+        cache.object_origins = {} if options.NPLUS1_DETECTION or options.AUTO_PREFETCH else None  # obj -> NPlusOneStat
         cache.modified = False
         cache.db_session = db_session = local.db_session
         cache.immediate = db_session is not None and db_session.immediate
+        cache.max_objects = db_session.max_objects if db_session is not None else None
+        cache.recently_used = OrderedDict() if cache.max_objects is not None else None  # obj -> None, LRU order
         cache.connection = None
+        cache.blocking_cursor = None  # server-side cursor which should be read before the next command
         cache.in_transaction = False
         cache.saved_fk_state = None
         cache.perm_cache = defaultdict(lambda : defaultdict(dict))  # user -> perm -> cls_or_attr_or_obj -> bool
@@ -1643,7 +1948,13 @@ class SessionCache(object):
             provider.drop(connection, cache)
         else: assert cache.connection is None
         return cache.connect()
+    def check_blocking_cursor(cache):
+        if cache.blocking_cursor is not None: throw(TransactionError,
+            'Cannot execute SQL command while results of a streaming query are being read: %s connection '
+            'cannot be used until the server-side cursor is exhausted or closed. Lazy attributes, collections '
+            'and related objects cannot be loaded inside the loop' % cache.database.provider.dialect)
     def prepare_connection_for_query_execution(cache):
+        if cache.blocking_cursor is not None: cache.check_blocking_cursor()
         db_session = local.db_session
         if db_session is not None and cache.db_session is None:
             # This situation can arise when a transaction was started
@@ -1672,11 +1983,14 @@ class SessionCache(object):
         except: transact_reraise(CommitException, [sys.exc_info()])
     def commit(cache):
         assert cache.is_alive
+        if cache.blocking_cursor is not None: cache.check_blocking_cursor()
         try:
             if cache.modified: cache.flush()
             if cache.in_transaction:
                 assert cache.connection is not None
                 cache.database.provider.commit(cache.connection, cache)
+            cache.sync_second_level_cache(committed=True)
+            cache.sync_query_result_cache(committed=True)
             cache.for_update.clear()
             cache.query_results.clear()
             cache.max_id_cache.clear()
@@ -1688,13 +2002,48 @@ class SessionCache(object):
         cache.close(rollback=True)
     def release(cache):
         cache.close(rollback=False)
+    def get_second_level_version(cache):
+        second_level_cache = cache.database._second_level_cache
+        return second_level_cache.version if second_level_cache is not None else 0
+    def sync_second_level_cache(cache, committed):
+        updates = cache.second_level_updates
+        invalidated = cache.second_level_invalidated
+        cleared = committed and cache.second_level_cleared
+        version = cache.second_level_version
+        cache.second_level_updates = {}
+        cache.second_level_invalidated = set()
+        cache.second_level_cleared = False
+        # rows read in a rolled back transaction are not published, they could be read before a concurrent change
+        if committed and (updates or invalidated or cleared):
+            second_level_cache = cache.database.second_level_cache
+            # rows were deleted by a bulk query or modified by raw SQL, so any cached row can be stale
+            if cleared: second_level_cache.clear()
+            else:
+                if invalidated: second_level_cache.delete_many(invalidated)
+                # rows of objects saved in this transaction can contain uncommitted changes
+                if invalidated: updates = { key: item for key, item in iteritems(updates) if key not in invalidated }
+                if updates: second_level_cache.set_many(updates, version)
+        cache.second_level_version = cache.get_second_level_version()
+    def sync_query_result_cache(cache, committed):
+        written_tables = cache.written_tables
+        if not written_tables and not cache.all_tables_written: return
+        if committed:
+            if cache.all_tables_written: written_tables = written_tables | {None}
+            cache.database._invalidate_tables(written_tables)
+        cache.written_tables = set()
+        cache.all_tables_written = False
     def close(cache, rollback=True):
         assert cache.is_alive
         if not rollback: assert not cache.in_transaction
+        cache.sync_second_level_cache(committed=False)
+        cache.sync_query_result_cache(committed=False)
         database = cache.database
         x = local.db2cache.pop(database); assert x is cache
         cache.is_alive = False
         provider = database.provider
+        if cache.blocking_cursor is not None:
+            cursor, cache.blocking_cursor = cache.blocking_cursor, None
+            cursor.close()
         connection = cache.connection
         if connection is None: return
         cache.connection = None
@@ -1722,7 +2071,116 @@ class SessionCache(object):
 
             cache.objects = cache.objects_to_save = cache.saved_objects = cache.query_results \
                 = cache.indexes = cache.seeds = cache.for_update = cache.max_id_cache \
-                = cache.modified_collections = cache.collection_statistics = None
+                = cache.modified_collections = cache.collection_statistics = cache.cascade_deletes \
+                = cache.second_level_updates = cache.second_level_invalidated = cache.written_tables = None
+    @cut_traceback
+    def evict(cache, obj):
+        return bool(cache._evict_objects((obj,)))
+    @cut_traceback
+    def evict_entity(cache, entity):
+        return len(cache._evict_objects([ obj for obj in cache.objects if isinstance(obj, entity) ]))
+    def touch(cache, obj):
+        recently_used = cache.recently_used
+        recently_used.pop(obj, None)
+        recently_used[obj] = None
+    def enforce_max_objects(cache, keep=()):
+        max_objects = cache.max_objects
+        if max_objects is None: return
+        excess = len(cache.objects) - max_objects
+        if excess <= 0: return
+        keep = set(keep)
+        objects = []
+        for obj in cache.recently_used:
+            if obj._status_ != 'loaded' or obj in keep: continue
+            objects.append(obj)
+            if len(objects) >= excess: break
+        cache._evict_objects(objects)
+    def _evict_objects(cache, objects):
+        evicted = [ obj for obj in objects if cache._evict_object(obj) ]
+        if not evicted: return evicted
+        cache.query_results.clear()
+        evicted_set = set(evicted)
+        for obj in cache.objects:
+            # loaded collections should not contain detached objects, such collections will be reloaded
+            for attr, setdata in iteritems(obj._vals_):
+                if not attr.is_collection or not setdata or evicted_set.isdisjoint(setdata): continue
+                setdata -= evicted_set
+                setdata.is_fully_loaded = False
+        cache._replace_evicted_references(evicted_set)
+        return evicted
+    def _replace_evicted_references(cache, evicted_set):
+        # references to evicted objects are replaced with new instances of the same rows,
+        # otherwise the next load of the referring object sees a different instance and fails
+        replacements = {}
+        def replace(val):
+            new_val = replacements.get(val)
+            if new_val is None:
+                new_val = replacements[val] = val.__class__._get_by_raw_pkval_(val._get_raw_pkval_())
+            return new_val
+        indexes = cache.indexes
+        for obj in list(cache.objects):  # new instances are added to cache.objects
+            vals = obj._vals_
+            dbvals = obj._dbvals_
+            attrs = set(attr for attr, val in items_list(vals)
+                        if attr.reverse and not attr.is_collection and val is not None and val in evicted_set)
+            dbattrs = [ attr for attr, val in items_list(dbvals)
+                        if attr.reverse and val is not None and val in evicted_set ]
+            if not attrs and not dbattrs: continue
+            pk_changed = not attrs.isdisjoint(obj._pk_attrs_)
+            if pk_changed and indexes[obj._pk_attrs_].get(obj._pkval_) is obj: del indexes[obj._pk_attrs_][obj._pkval_]
+            for attr in obj._simple_keys_:
+                if attr in attrs and indexes[attr].get(vals[attr]) is obj: del indexes[attr][vals[attr]]
+            composite_keys = [ key_attrs for key_attrs in obj._composite_keys_ if not attrs.isdisjoint(key_attrs) ]
+            for key_attrs in composite_keys:
+                keyval = tuple(vals.get(attr) for attr in key_attrs)
+                if indexes[key_attrs].get(keyval) is obj: del indexes[key_attrs][keyval]
+            for attr in attrs: vals[attr] = replace(vals[attr])
+            for attr in dbattrs:
+                dbvals[attr] = new_dbval = replace(dbvals[attr])
+                attr.db_update_reverse(obj, NOT_LOADED, new_dbval)
+                if obj._rbits_: obj._rbits_ &= ~obj._bits_except_volatile_[attr]
+            if pk_changed:
+                pkval = tuple(vals[attr] for attr in obj._pk_attrs_)
+                obj._pkval_ = pkval if obj._pk_is_composite_ else pkval[0]
+                indexes[obj._pk_attrs_][obj._pkval_] = obj
+            for attr in obj._simple_keys_:
+                if attr in attrs: indexes[attr][vals[attr]] = obj
+            for key_attrs in composite_keys:
+                keyval = tuple(vals.get(attr) for attr in key_attrs)
+                if None not in keyval: indexes[key_attrs][keyval] = obj
+    def _evict_object(cache, obj):
+        if obj._session_cache_ is not cache: return False
+        if obj._status_ != 'loaded' or obj in cache.for_update: return False
+        for objects in itervalues(cache.modified_collections):
+            if obj in objects: return False
+        cache.objects.discard(obj)
+        indexes = cache.indexes
+        pk_attrs = obj._pk_attrs_
+        pk_index = indexes[pk_attrs]
+        if pk_index.get(obj._pkval_) is obj: del pk_index[obj._pkval_]
+        cache.seeds[pk_attrs].discard(obj)
+        vals = obj._vals_
+        for attr in obj._simple_keys_:
+            val = vals.get(attr)
+            if val is not None and indexes[attr].get(val) is obj: del indexes[attr][val]
+        for attrs in obj._composite_keys_:
+            keyval = tuple(vals.get(attr) for attr in attrs)
+            if indexes[attrs].get(keyval) is obj: del indexes[attrs][keyval]
+        cache.obj_labels_cache.pop(obj, None)
+        local.user_groups_cache.pop(obj, None)
+        local.user_roles_cache.pop(obj, None)
+        for roles in itervalues(local.user_roles_cache): roles.pop(obj, None)
+        for user_perms in itervalues(cache.perm_cache):
+            for perm_cache in itervalues(user_perms): perm_cache.pop(obj, None)
+        if cache.object_origins: cache.object_origins.pop(obj, None)
+        if cache.recently_used is not None: cache.recently_used.pop(obj, None)
+        obj._session_cache_ = None
+        return True
+    def register_attr_load(cache, obj, attr):
+        origins = cache.object_origins
+        if not origins: return
+        stat = origins.get(obj)
+        if stat is not None: stat.loads[attr] = stat.loads.get(attr, 0) + 1
     @contextmanager
     def flush_disabled(cache):
         cache.noflush_counter += 1
@@ -1745,8 +2203,7 @@ class SessionCache(object):
                 for attr, (added, removed) in iteritems(modified_m2m):
                     if not removed: continue
                     attr.remove_m2m(removed)
-                for obj in cache.objects_to_save:
-                    if obj is not None: obj._save_()
+                cache._save_objects()
                 for attr, (added, removed) in iteritems(modified_m2m):
                     if not added: continue
                     attr.add_m2m(added)
@@ -1760,6 +2217,76 @@ class SessionCache(object):
         else:
             if cache.modified: throw(TransactionError,
                 'Recursion depth limit reached in obj._after_save_() call')
+    def _save_objects(cache):
+        objects_to_save = cache.objects_to_save
+        bulk_id_allocation = cache.database.provider.bulk_id_allocation
+        precalculated = {}
+        def get_values(obj):
+            values = precalculated.pop(obj, None)
+            if values is not None: return values
+            if obj._status_ == 'created': return obj._get_insert_values_()
+            return obj._get_update_values_()
+        def is_batchable(obj, values):
+            if obj._status_ == 'created':
+                auto_pk, attrs = values[:2]
+                return bool(attrs) and (not auto_pk or bulk_id_allocation and obj._bulk_id_allocation_)
+            return values[0] is not None
+        i = 0
+        while i < len(objects_to_save):  # can grow during iteration
+            obj = objects_to_save[i]
+            i += 1
+            if obj is None: continue
+            status = obj._status_
+            if status == 'marked_to_delete' and obj in cache.cascade_deletes:
+                entity = obj.__class__
+                attrs = cache.cascade_deletes.pop(obj)
+                objects = [ obj ]
+                while i < len(objects_to_save):
+                    obj2 = objects_to_save[i]
+                    if obj2 is None:
+                        i += 1
+                        continue
+                    if obj2.__class__ is not entity or obj2._status_ != status: break
+                    if cache.cascade_deletes.get(obj2) != attrs: break
+                    del cache.cascade_deletes[obj2]
+                    objects.append(obj2)
+                    i += 1
+                for attr in attrs: entity._delete_collection_rows_(attr, objects)
+                for obj in objects: obj._save_()
+                continue
+            if status not in ('created', 'modified') or obj._has_unsaved_principals_():
+                precalculated.pop(obj, None)
+                obj._save_()
+                continue
+            entity = obj.__class__
+            values = get_values(obj)
+            objects, values_list = [ obj ], [ values ]
+            if is_batchable(obj, values):
+                key = values[:2] if status == 'created' else values[0]
+                while i < len(objects_to_save):
+                    obj2 = objects_to_save[i]
+                    if obj2 is None:
+                        i += 1
+                        continue
+                    if obj2.__class__ is not entity or obj2._status_ != status: break
+                    if obj2._has_unsaved_principals_(): break
+                    values2 = get_values(obj2)
+                    key2 = values2[:2] if status == 'created' else values2[0]
+                    if key2 != key:
+                        precalculated[obj2] = values2
+                        break
+                    objects.append(obj2)
+                    values_list.append(values2)
+                    i += 1
+            if len(objects) == 1:
+                if status == 'created': obj._save_created_(values)
+                else: obj._save_updated_(values)
+            elif status == 'created':
+                auto_pk, attrs = values[:2]
+                entity._save_created_many_(objects, auto_pk, attrs,
+                                           [ v[2] for v in values_list ], [ v[3] for v in values_list ])
+            else: entity._save_updated_many_(objects, values_list)
+            for obj in objects: obj._remove_from_objects_to_save_()
     def call_after_save_hooks(cache):
         saved_objects = cache.saved_objects
         cache.saved_objects = []
@@ -1867,7 +2394,7 @@ class Attribute(object):
                 'lazy', 'lazy_sql_cache', 'args', 'auto', 'default', 'reverse', 'composite_keys', \
                 'column', 'columns', 'col_paths', '_columns_checked', 'converters', 'kwargs', \
                 'cascade_delete', 'index', 'original_default', 'sql_default', 'py_check', 'hidden', \
-                'optimistic', 'fk_name'
+                'optimistic', 'fk_name', 'value_index'
     def __deepcopy__(attr, memo):
         return attr  # Attribute cannot be cloned by deepcopy()
     @cut_traceback
@@ -1887,6 +2414,7 @@ class Attribute(object):
         if attr.is_pk: attr.pk_offset = 0
         else: attr.pk_offset = None
         attr.id = next(attr_id_counter)
+        attr.value_index = None
         if not isinstance(py_type, (type, basestring, types.FunctionType)):
             if py_type is datetime: throw(TypeError,
                 'datetime is the module and cannot be used as attribute type. Use datetime.datetime instead')
@@ -2080,6 +2608,7 @@ class Attribute(object):
         if not attr.columns:
             reverse = attr.reverse
             assert reverse is not None and reverse.columns
+            cache.register_attr_load(obj, attr)
             dbval = reverse.entity._find_in_db_({reverse : obj})
             if dbval is None: obj._vals_[attr] = None
             else: assert obj._vals_[attr] == dbval
@@ -2100,6 +2629,7 @@ class Attribute(object):
                 offsets = tuple(xrange(len(attr.columns)))
                 attr.lazy_sql_cache = sql, adapter, offsets
             else: sql, adapter, offsets = attr.lazy_sql_cache
+            cache.register_attr_load(obj, attr)
             arguments = adapter(obj._get_raw_pkval_())
             cursor = database._exec_sql(sql, arguments)
             row = cursor.fetchone()
@@ -2107,6 +2637,23 @@ class Attribute(object):
             attr.db_set(obj, dbval)
         else: obj._load_()
         return obj._vals_[attr]
+    def load_many(attr, objects):
+        objects = [ obj for obj in objects if attr not in obj._vals_ and obj._status_ not in created_or_deleted_statuses ]
+        if not objects: return
+        entity = attr.entity
+        database = entity._database_
+        if attr.columns: batch_entity, reverse, lazy_attrs = entity, None, (attr,)  # lazy attribute
+        else: batch_entity, reverse, lazy_attrs = attr.reverse.entity, attr.reverse, ()
+        max_batch_size = database.provider.max_params_count // len(entity._pk_columns_)
+        for i in xrange(0, len(objects), max_batch_size):
+            batch = objects[i:i+max_batch_size]
+            sql, adapter, attr_offsets = batch_entity._construct_batchload_sql_(
+                len(batch), reverse, lazy_attrs=lazy_attrs)
+            cursor = database._exec_sql(sql, adapter(batch))
+            batch_entity._fetch_objects(cursor, attr_offsets)
+            if reverse is None: continue
+            for obj in batch:
+                if attr not in obj._vals_: obj._vals_[attr] = None
     @cut_traceback
     def __get__(attr, obj, cls=None):
         if obj is None: return attr
@@ -2121,7 +2668,15 @@ class Attribute(object):
             throw_object_was_deleted(obj)
         vals = obj._vals_
         if vals is None: throw_db_session_is_over('read value of', obj, attr)
-        val = vals[attr] if attr in vals else attr.load(obj)
+        if vals.__class__ is dict: val = vals.get(attr, NOT_LOADED)
+        else: val = list_getitem(vals, attr.value_index)  # CompactValues
+        if val is NOT_LOADED: val = attr.load(obj)
+        if val is not None and attr.reverse and val._session_cache_ is None:
+            cache = obj._session_cache_
+            if cache is not None and cache.is_alive:  # referenced object was evicted from the session cache
+                evicted = val
+                val = vals[attr] = evicted.__class__._get_by_raw_pkval_(evicted._get_raw_pkval_())
+                if obj._dbvals_.get(attr) is evicted: obj._dbvals_[attr] = val
         if val is not None and attr.reverse and val._subclasses_ and val._status_ not in ('deleted', 'cancelled'):
             cache = obj._session_cache_
             if cache is not None and val in cache.seeds[val._pk_attrs_]:
@@ -2519,7 +3074,7 @@ class PrimaryKey(Required):
 class Collection(Attribute):
     __slots__ = 'table', 'wrapper_class', 'symmetric', 'reverse_column', 'reverse_columns', \
                 'nplus1_threshold', 'cached_load_sql', 'cached_add_m2m_sql', 'cached_remove_m2m_sql', \
-                'cached_count_sql', 'cached_empty_sql', 'reverse_fk_name'
+                'cached_count_sql', 'cached_count_many_sql', 'cached_empty_sql', 'reverse_fk_name'
     def __init__(attr, py_type, *args, **kwargs):
         if attr.__class__ is Collection: throw(TypeError, "'Collection' is abstract type")
         table = kwargs.pop('table', None)  # TODO: rename table to link_table or m2m_table
@@ -2559,6 +3114,7 @@ class Collection(Attribute):
         attr.cached_add_m2m_sql = None
         attr.cached_remove_m2m_sql = None
         attr.cached_count_sql = None
+        attr.cached_count_many_sql = {}
         attr.cached_empty_sql = None
     def _init_(attr, entity, name):
         Attribute._init_(attr, entity, name)
@@ -2591,6 +3147,79 @@ class SetData(set):
         setdata.added = setdata.removed = setdata.absent = None
         setdata.count = None
 
+list_getitem = list.__getitem__
+list_setitem = list.__setitem__
+
+class CompactValues(list):
+    # dict-like storage of attribute values, the value of attribute is kept at attr.value_index position;
+    # each root entity has a subclass with `attrs` and `empty` class attributes, see make_compact_values_class()
+    __slots__ = ()
+    attrs = empty = ()
+    def __getitem__(values, attr):
+        i = attr.value_index
+        val = NOT_LOADED if i is None else list_getitem(values, i)
+        if val is NOT_LOADED: raise KeyError(attr)
+        return val
+    def __setitem__(values, attr, val):
+        list_setitem(values, attr.value_index, val)
+    def __delitem__(values, attr):
+        if attr not in values: raise KeyError(attr)
+        list_setitem(values, attr.value_index, NOT_LOADED)
+    def __contains__(values, attr):
+        i = attr.value_index
+        return i is not None and list_getitem(values, i) is not NOT_LOADED
+    def __len__(values):
+        return builtins.sum(1 for val in list.__iter__(values) if val is not NOT_LOADED)
+    def __iter__(values):
+        attrs = values.attrs
+        return (attrs[i] for i, val in enumerate(list.__iter__(values)) if val is not NOT_LOADED)
+    def __eq__(values, other):
+        return dict(values.items()) == other
+    def __ne__(values, other):
+        return not values.__eq__(other)
+    __hash__ = None
+    def __repr__(values):
+        return repr(dict(values.items()))
+    def __reduce__(values):
+        return dict, (values.items(),)
+    def get(values, attr, default=None):
+        i = attr.value_index
+        if i is None: return default
+        val = list_getitem(values, i)
+        return default if val is NOT_LOADED else val
+    def setdefault(values, attr, default=None):
+        val = values.get(attr, NOT_LOADED)
+        if val is NOT_LOADED: values[attr] = val = default
+        return val
+    def pop(values, attr, *args):
+        val = values.get(attr, NOT_LOADED)
+        if val is not NOT_LOADED:
+            list_setitem(values, attr.value_index, NOT_LOADED)
+            return val
+        if args: return args[0]
+        raise KeyError(attr)
+    def update(values, other):
+        for attr, val in iteritems(other) if isinstance(other, (dict, CompactValues)) else other:
+            values[attr] = val
+    def copy(values):
+        return values.__class__(list.__iter__(values))
+    def clear(values):
+        list_setitem(values, slice(None), values.empty)
+    def items(values):
+        attrs = values.attrs
+        return [ (attrs[i], val) for i, val in enumerate(list.__iter__(values)) if val is not NOT_LOADED ]
+    def keys(values):
+        return list(values.__iter__())
+    def values(values):
+        return [ val for val in list.__iter__(values) if val is not NOT_LOADED ]
+    iteritems = items
+    iterkeys = keys
+    itervalues = values
+
+def make_compact_values_class(attrs):
+    return type(str('CompactValues'), (CompactValues,),
+                dict(__slots__=(), attrs=tuple(attrs), empty=(NOT_LOADED,) * len(attrs)))
+
 def construct_batchload_criteria_list(alias, columns, converters, batch_size, row_value_syntax, start=0, from_seeds=True):
     assert batch_size > 0
     def param(i, j, converter):
@@ -2619,6 +3248,136 @@ def construct_batchload_criteria_list(alias, columns, converters, batch_size, ro
                        for i in xrange(batch_size) ]
         return [ [ 'OR' ] + conditions ]
 
+def make_row_value_parser(attr, offsets):
+    # returns function which converts row columns to attribute value exactly like Attribute.parse_value() does
+    assert len(attr.columns) == len(offsets)
+    if attr.reverse:
+        get_by_raw_pkval = attr.py_type._get_by_raw_pkval_
+        if len(offsets) == 1:
+            offset = offsets[0]
+            return lambda row: None if row[offset] is None else get_by_raw_pkval((row[offset],))
+        def parse(row):
+            vals = [ row[offset] for offset in offsets ]
+            if None in vals:
+                assert len(set(vals)) == 1
+                return None
+            return get_by_raw_pkval(vals)
+        return parse
+    if len(offsets) > 1: throw(NotImplementedError)
+    offset = offsets[0]
+    entity = attr.entity
+    validate = attr.validate
+    validate_func = getattr(attr.__class__.validate, '__func__', attr.__class__.validate)
+    if validate_func is getattr(Attribute.validate, '__func__', Attribute.validate): is_required = False
+    elif validate_func is getattr(Required.validate, '__func__', Required.validate): is_required = True
+    else: return lambda row: validate(row[offset], None, entity, from_db=True)
+    if len(attr.converters) != 1 or attr.converters[0] is None or attr.py_check is not None:
+        return lambda row: validate(row[offset], None, entity, from_db=True)
+    sql2py = attr.converters[0].sql2py
+    def parse(row):
+        val = row[offset]
+        if val is None:
+            if is_required: validate(val, None, entity, from_db=True)  # issues warning if necessary
+            return None
+        try: result = sql2py(val)
+        except UnicodeDecodeError: return validate(val, None, entity, from_db=True)
+        if is_required and result == '': validate(val, None, entity, from_db=True)
+        return result
+    return parse
+
+def make_tuple_value_decoder(attr, offsets):
+    # converts column values like Attribute.parse_value() does, but references are returned as primary keys
+    converters = attr.converters
+    if attr.reverse:
+        if len(offsets) == 1:
+            offset = offsets[0]
+            sql2py = converters[0].sql2py
+            return lambda row: None if row[offset] is None else sql2py(row[offset])
+        def decode(row):
+            vals = [ row[offset] for offset in offsets ]
+            if None in vals: return None
+            return tuple(converter.sql2py(val) for converter, val in izip(converters, vals))
+        return decode
+    assert len(offsets) == 1  # only references can span several columns
+    offset = offsets[0]
+    dbval2val = get_dbval2val(converters[0] if converters else None)
+    if converters and converters[0] is not None and attr.py_check is None:
+        sql2py = converters[0].sql2py
+        if dbval2val is None: return lambda row: None if row[offset] is None else sql2py(row[offset])
+        return lambda row: None if row[offset] is None else dbval2val(sql2py(row[offset]))
+    entity = attr.entity
+    if dbval2val is None: return lambda row: attr.validate(row[offset], None, entity, from_db=True)
+    def decode(row):
+        val = attr.validate(row[offset], None, entity, from_db=True)
+        return None if val is None else dbval2val(val)
+    return decode
+
+def is_default_converter_method(converter, name):
+    method = getattr(type(converter), name)
+    default_method = getattr(Converter, name)
+    return getattr(method, '__func__', method) is getattr(default_method, '__func__', default_method)
+
+def get_dbval2val(converter):
+    # returns converter.dbval2val if it converts values, the same conversion is done when objects are loaded
+    if converter is None or is_default_converter_method(converter, 'dbval2val'): return None
+    return converter.dbval2val
+
+def make_column_decoder(offsets, converters, validate=None, dbval2val=None):
+    if validate is not None:
+        offset = offsets[0]
+        if dbval2val is None: return lambda columns: [ validate(value) for value in columns[offset] ]
+        def decode(columns):
+            result = []
+            for value in columns[offset]:
+                value = validate(value)
+                result.append(None if value is None else dbval2val(value))
+            return result
+        return decode
+    if len(offsets) > 1:
+        def decode(columns):
+            result = []
+            for vals in izip(*[ columns[offset] for offset in offsets ]):
+                if None in vals: result.append(None)
+                else: result.append(tuple(converter.sql2py(val) for converter, val in izip(converters, vals)))
+            return result
+        return decode
+    offset = offsets[0]
+    sql2py = converters[0].sql2py
+    if is_default_converter_method(converters[0], 'sql2py'):
+        if dbval2val is None: return lambda columns: list(columns[offset])  # values do not require conversion
+        return lambda columns: [ None if value is None else dbval2val(value) for value in columns[offset] ]
+    if dbval2val is None: return lambda columns: [ None if value is None else sql2py(value) for value in columns[offset] ]
+    return lambda columns: [ None if value is None else dbval2val(sql2py(value)) for value in columns[offset] ]
+
+def get_sql_ast_tables(sql_ast, result=None):
+    if result is None: result = set()
+    if len(sql_ast) >= 3 and sql_ast[1] == 'TABLE': result.add(sql_ast[2])
+    for item in sql_ast:
+        if isinstance(item, list): get_sql_ast_tables(item, result)
+    return result
+
+def get_cascade_delete_entities(entity, plan):
+    result = []
+    for attr, subplan in plan: result.extend(get_cascade_delete_entities(attr.reverse.entity, subplan))
+    result.append(entity._root_)
+    return result
+
+def construct_cascade_delete_sql_asts(sql_asts, entity, plan, criteria, level=1):
+    # rows of collection items are deleted before rows they refer to
+    alias = 'T%d' % level
+    for attr, subplan in plan:
+        reverse = attr.reverse
+        def subcriteria(alias2, reverse=reverse):
+            columns = [ [ 'COLUMN', alias2, column ] for column in reverse.columns ]
+            expr = columns[0] if len(columns) == 1 else [ 'ROW' ] + columns
+            pk_columns = [ [ 'COLUMN', alias, column ] for column in entity._pk_columns_ ]
+            subquery = [ 'SELECT', [ 'ALL' ] + pk_columns, [ 'FROM', [ alias, 'TABLE', entity._table_ ] ],
+                         [ 'WHERE' ] + criteria(alias) ]
+            return [ [ 'IN', expr, subquery ] ]
+        construct_cascade_delete_sql_asts(sql_asts, reverse.entity, subplan, subcriteria, level+1)
+    from_ast = [ 'FROM', [ None, 'TABLE', entity._table_ ] ]
+    sql_asts.append([ 'DELETE', None, from_ast, [ 'WHERE' ] + criteria(None) ])
+
 class Set(Collection):
     __slots__ = []
     def validate(attr, val, obj=None, entity=None, from_db=False):
@@ -2689,6 +3448,7 @@ class Set(Collection):
             reverse.db_reverse_add(loaded_items, obj)
             return setdata
 
+        cache.register_attr_load(obj, attr)
         counter = cache.collection_statistics.setdefault(attr, 0)
         nplus1_threshold = attr.nplus1_threshold
         prefetching = options.PREFETCHING and not attr.lazy and nplus1_threshold is not None \
@@ -2709,6 +3469,29 @@ class Set(Collection):
                 setdata_list.append(setdata2)
                 if len(objects) >= max_batch_size: break
 
+        attr.load_batch(objects, setdata_list)
+        cache.collection_statistics[attr] = counter + 1
+        return setdata
+    def load_many(attr, objects):
+        setdata_list = []
+        objects_to_load = []
+        for obj in objects:
+            if obj._status_ in created_or_deleted_statuses: continue
+            setdata = obj._vals_.get(attr)
+            if setdata is None: setdata = obj._vals_[attr] = SetData()
+            elif setdata.is_fully_loaded: continue
+            objects_to_load.append(obj)
+            setdata_list.append(setdata)
+        if not objects_to_load: return
+        entity = attr.entity
+        max_batch_size = entity._database_.provider.max_params_count // len(entity._pk_columns_)
+        for i in xrange(0, len(objects_to_load), max_batch_size):
+            attr.load_batch(objects_to_load[i:i+max_batch_size], setdata_list[i:i+max_batch_size])
+    def load_batch(attr, objects, setdata_list):
+        entity = attr.entity
+        reverse = attr.reverse
+        rentity = reverse.entity
+        database = entity._database_
         if not reverse.is_collection:
             sql, adapter, attr_offsets = rentity._construct_batchload_sql_(len(objects), reverse)
             arguments = adapter(objects)
@@ -2727,16 +3510,16 @@ class Set(Collection):
                     items = d.get(obj2)
                     if items is None: items = d[obj2] = set()
                     items.add(item)
-            else: d[obj] = {rentity._get_by_raw_pkval_(row) for row in cursor.fetchall()}
+            else: d[objects[0]] = {rentity._get_by_raw_pkval_(row) for row in cursor.fetchall()}
             for obj2, items in iteritems(d):
                 setdata2 = obj2._vals_.get(attr)
-                if setdata2 is None: setdata2 = obj._vals_[attr] = SetData()
+                if setdata2 is None: setdata2 = obj2._vals_[attr] = SetData()
                 else:
                     phantoms = setdata2 - items
                     if setdata2.added: phantoms -= setdata2.added
                     if phantoms: throw(UnrepeatableReadError,
                         'Phantom object %s disappeared from collection %s.%s'
-                        % (safe_repr(phantoms.pop()), safe_repr(obj), attr.name))
+                        % (safe_repr(phantoms.pop()), safe_repr(obj2), attr.name))
                 items -= setdata2
                 if setdata2.removed: items -= setdata2.removed
                 setdata2 |= items
@@ -2746,8 +3529,60 @@ class Set(Collection):
             setdata2.is_fully_loaded = True
             setdata2.absent = None
             setdata2.count = len(setdata2)
-        cache.collection_statistics[attr] = counter + 1
-        return setdata
+    @cut_traceback
+    def count_many(attr, objects):
+        entity = attr.entity
+        objects = list(objects)
+        objects_to_count = []
+        for obj in objects:
+            if not isinstance(obj, entity): throw(TypeError,
+                'Object of %s type expected. Got: %s' % (entity.__name__, safe_repr(obj)))
+            if obj._status_ in del_statuses: throw_object_was_deleted(obj)
+            if obj._vals_ is None: throw_db_session_is_over('read value of', obj, attr)
+            setdata = obj._vals_.get(attr)
+            if setdata is None: setdata = obj._vals_[attr] = SetData()
+            elif setdata.count is not None: continue
+            elif setdata.is_fully_loaded:
+                setdata.count = len(setdata)
+                continue
+            objects_to_count.append(obj)
+        if objects_to_count:
+            max_batch_size = entity._database_.provider.max_params_count // len(entity._pk_columns_)
+            for i in xrange(0, len(objects_to_count), max_batch_size):
+                attr.count_batch(objects_to_count[i:i+max_batch_size])
+        return dict((obj, obj._vals_[attr].count) for obj in objects)
+    def count_batch(attr, objects):
+        entity = attr.entity
+        database = entity._database_
+        cache = database._get_cache()
+        sql, adapter = attr.construct_sql_count_many(len(objects))
+        arguments = adapter(objects)
+        with cache.flush_disabled():
+            cursor = database._exec_sql(sql, arguments)
+        pk_len = len(entity._pk_columns_)
+        counts = {}
+        for row in cursor.fetchall(): counts[entity._get_by_raw_pkval_(row[:pk_len])] = row[pk_len]
+        for obj in objects:
+            setdata = obj._vals_[attr]
+            setdata.count = counts.get(obj, 0)
+            if setdata.added: setdata.count += len(setdata.added)
+            if setdata.removed: setdata.count -= len(setdata.removed)
+    def construct_sql_count_many(attr, batch_size):
+        cached_sql = attr.cached_count_many_sql.get(batch_size)
+        if cached_sql is not None: return cached_sql
+        reverse = attr.reverse
+        database = attr.entity._database_
+        if not reverse.is_collection: table_name = reverse.entity._table_
+        else: table_name = attr.table
+        columns = [ [ 'COLUMN', None, column ] for column in reverse.columns ]
+        row_value_syntax = database.provider.translator_cls.row_value_syntax
+        criteria_list = construct_batchload_criteria_list(
+            None, reverse.columns, reverse.converters, batch_size, row_value_syntax)
+        sql_ast = [ 'SELECT', [ 'ALL' ] + columns + [ [ 'COUNT', 'ALL' ] ],
+                              [ 'FROM', [ None, 'TABLE', table_name ] ],
+                              [ 'WHERE' ] + criteria_list, [ 'GROUP_BY' ] + columns ]
+        cached_sql = attr.cached_count_many_sql[batch_size] = database._ast2sql(sql_ast)
+        return cached_sql
     def construct_sql_m2m(attr, batch_size=1, items_count=0):
         if items_count:
             assert batch_size == 1
@@ -2989,6 +3824,7 @@ class Set(Collection):
         arguments_list = [ adapter(obj._get_raw_pkval_() + robj._get_raw_pkval_())
                            for obj, robj in removed ]
         database._exec_sql(sql, arguments_list)
+        database._get_cache().written_tables.add(attr.table)
     def add_m2m(attr, added):
         assert added
         entity = attr.entity
@@ -3010,6 +3846,7 @@ class Set(Collection):
         arguments_list = [ adapter(obj._get_raw_pkval_() + robj._get_raw_pkval_())
                            for obj, robj in added ]
         database._exec_sql(sql, arguments_list)
+        database._get_cache().written_tables.add(attr.table)
     @cut_traceback
     @db_session(ddl=True)
     def drop_table(attr, with_all_data=False):
@@ -3129,6 +3966,22 @@ class SetInstance(object):
         entity = attr.entity
         reverse = attr.reverse
         database = entity._database_
+        counter = cache.count_statistics.get(attr, 0)
+        cache.count_statistics[attr] = counter + 1
+        nplus1_threshold = attr.nplus1_threshold
+        if options.PREFETCHING and nplus1_threshold is not None and counter >= nplus1_threshold:
+            objects = [ obj ]
+            max_batch_size = database.provider.max_params_count // len(entity._pk_columns_)
+            for obj2 in itervalues(cache.indexes[entity._pk_attrs_]):
+                if len(objects) >= max_batch_size: break
+                if obj2 is obj or not isinstance(obj2, entity): continue
+                if obj2._status_ in created_or_deleted_statuses: continue
+                setdata2 = obj2._vals_.get(attr)
+                if setdata2 is None: setdata2 = obj2._vals_[attr] = SetData()
+                elif setdata2.count is not None or setdata2.is_fully_loaded: continue
+                objects.append(obj2)
+            attr.count_batch(objects)
+            return setdata.count
         cached_sql = attr.cached_count_sql
         if cached_sql is None:
             where_list = [ 'WHERE' ]
@@ -3549,6 +4402,7 @@ class EntityMeta(type):
                     % (attr, prev, entity._root_.__name__))
                 base._subclass_attrs_.append(attr)
         entity._attrnames_cache_ = {}
+        entity._serializers_ = {}
 
         try: table_name = entity.__dict__['_table_']
         except KeyError: entity._table_ = None
@@ -3569,8 +4423,14 @@ class EntityMeta(type):
         entity._load_sql_cache_ = {}
         entity._batchload_sql_cache_ = {}
         entity._insert_sql_cache_ = {}
+        entity._insert_many_sql_cache_ = {}
+        entity._bulk_id_allocation_ = True  # becomes False if the primary key column has no sequence
         entity._update_sql_cache_ = {}
         entity._delete_sql_cache_ = {}
+        entity._cascade_delete_sql_cache_ = {}
+        entity._cascade_delete_plan_ = NOT_LOADED
+        entity._tuple_row_classes_ = {}
+        entity._row_parsers_ = {}
 
         entity._propagation_mixin_ = None
         entity._set_wrapper_subclass_ = None
@@ -3578,6 +4438,23 @@ class EntityMeta(type):
 
         if '_discriminator_' not in entity.__dict__:
             entity._discriminator_ = None
+        if '_second_level_cache_' not in entity.__dict__:
+            if entity._root_ is entity: entity._second_level_cache_ = False
+        elif entity._root_ is not entity: throw(TypeError,
+            'Second-level cache can be configured for root entity %s only' % entity._root_.__name__)
+        else:
+            value = entity._second_level_cache_
+            if value is None: entity._second_level_cache_ = False
+            elif value is not True and value is not False and (not isinstance(value, (int, float)) or value <= 0):
+                throw(TypeError, '_second_level_cache_ value should be True, False or positive number of seconds. '
+                                 'Got: %r' % value)
+        if '_compact_values_' not in entity.__dict__:
+            if entity._root_ is entity: entity._compact_values_ = False
+        elif entity._root_ is not entity: throw(TypeError,
+            'Compact value storage can be configured for root entity %s only' % entity._root_.__name__)
+        elif entity._compact_values_ not in (True, False):
+            throw(TypeError, '_compact_values_ value should be True or False. Got: %r' % entity._compact_values_)
+        if entity._root_ is entity: entity._value_attrs_ = []
         if entity._discriminator_ is not None and not entity._discriminator_attr_:
             Discriminator.create_default_attr(entity)
         if entity._discriminator_attr_:
@@ -3592,6 +4469,7 @@ class EntityMeta(type):
         entity._default_genexpr_ = inner_expr
 
         entity._access_rules_ = defaultdict(set)
+        entity._perm_matrix_ = {}
     def _initialize_bits_(entity):
         entity._bits_ = {}
         entity._bits_except_volatile_ = {}
@@ -3816,6 +4694,10 @@ class EntityMeta(type):
             if attr.is_collection:
                 throw(TypeError, 'Collection attribute %s cannot be specified as search criteria' % attr)
         obj, unique = entity._find_in_cache_(pkval, avdict, for_update)
+        if obj is None and entity._second_level_cache_ and pkval is not None and not for_update \
+                and len(avdict) == len(entity._pk_attrs_):
+            obj = entity._find_in_second_level_cache_(pkval)
+            if obj is not None and not isinstance(obj, entity): throw(ObjectNotFound, entity, pkval)
         if obj is None: obj = entity._find_in_db_(avdict, unique, for_update, nowait)
         if obj is None: throw(ObjectNotFound, entity, pkval)
         return obj
@@ -3877,6 +4759,7 @@ class EntityMeta(type):
         if for_update: database._get_cache().immediate = True
         cursor = database._exec_sql(sql, arguments)
         objects = entity._fetch_objects(cursor, attr_offsets, 1, for_update, avdict)
+        database._get_cache().enforce_max_objects(keep=objects)
         return objects[0] if objects else None
     def _find_by_sql_(entity, max_fetch_count, sql, globals, locals, frame_depth):
         if not isinstance(sql, basestring): throw(TypeError)
@@ -3927,11 +4810,70 @@ class EntityMeta(type):
         discr_values = [ [ 'VALUE', cls._discriminator_ ] for cls in entity._subclasses_ ]
         discr_values.append([ 'VALUE', entity._discriminator_])
         return [ 'IN', [ 'COLUMN', alias, discr_attr.column ], discr_values ]
-    def _construct_batchload_sql_(entity, batch_size, attr=None, from_seeds=True):
-        query_key = batch_size, attr, from_seeds
+    def _get_cascade_delete_plan_(entity, visited=frozenset()):
+        root = entity._root_
+        plan = root._cascade_delete_plan_
+        if plan is not NOT_LOADED: return plan
+        if root in visited: return None  # cyclic cascades are deleted object by object
+        visited = visited | {root}
+        row_value_syntax = root._database_.provider.translator_cls.row_value_syntax
+        plan = [] if not root._second_level_cache_ else None  # rows deleted in bulk cannot be invalidated
+        for cls in chain([ root ], root._subclasses_):
+            for base in cls.__mro__:
+                if base is Entity: break
+                if 'before_delete' in base.__dict__ or 'after_delete' in base.__dict__: plan = None
+        for attr in chain(root._attrs_, root._subclass_attrs_):
+            if plan is None: break
+            reverse = attr.reverse
+            if not reverse: continue
+            if not attr.is_collection:
+                if attr.lazy or not isinstance(reverse, Set): plan = None
+                elif len(attr.columns) > 1 and not row_value_syntax: plan = None
+            elif not isinstance(attr, Set) or reverse.is_collection or not attr.cascade_delete: plan = None
+            else:
+                subplan = reverse.entity._get_cascade_delete_plan_(visited)
+                if subplan is None: plan = None
+                else: plan.append((attr, subplan))
+        if plan is not None: plan = tuple(plan)
+        root._cascade_delete_plan_ = plan
+        return plan
+    def _construct_cascade_delete_sql_(entity, attr, batch_size):
+        query_key = attr, batch_size
+        cached_sql = entity._cascade_delete_sql_cache_.get(query_key)
+        if cached_sql is not None: return cached_sql
+        database = entity._database_
+        row_value_syntax = database.provider.translator_cls.row_value_syntax
+        reverse = attr.reverse
+        def criteria(alias):
+            return construct_batchload_criteria_list(
+                alias, reverse.columns, reverse.converters, batch_size, row_value_syntax)
+        sql_asts = []
+        construct_cascade_delete_sql_asts(sql_asts, reverse.entity, reverse.entity._get_cascade_delete_plan_(), criteria)
+        cached_sql = [ database._ast2sql(sql_ast) for sql_ast in sql_asts ]
+        entity._cascade_delete_sql_cache_[query_key] = cached_sql
+        return cached_sql
+    def _delete_collection_rows_(entity, attr, objects):
+        database = entity._database_
+        max_batch_size = database.provider.max_params_count // len(entity._pk_columns_)
+        for i in xrange(0, len(objects), max_batch_size):
+            batch = objects[i:i+max_batch_size]
+            for sql, adapter in entity._construct_cascade_delete_sql_(attr, len(batch)):
+                database._exec_sql(sql, adapter(batch), start_transaction=True)
+        reverse = attr.reverse
+        database._get_cache().written_tables.update(
+            item_entity._table_ for item_entity in get_cascade_delete_entities(
+                reverse.entity, reverse.entity._get_cascade_delete_plan_()))
+    def _assign_value_indexes_(entity):
+        value_attrs = entity._root_._value_attrs_
+        for attr in entity._attrs_:
+            if attr.value_index is not None: continue
+            attr.value_index = len(value_attrs)
+            value_attrs.append(attr)
+    def _construct_batchload_sql_(entity, batch_size, attr=None, from_seeds=True, lazy_attrs=()):
+        query_key = batch_size, attr, from_seeds, lazy_attrs
         cached_sql = entity._batchload_sql_cache_.get(query_key)
         if cached_sql is not None: return cached_sql
-        select_list, attr_offsets = entity._construct_select_clause_(all_attributes=True)
+        select_list, attr_offsets = entity._construct_select_clause_(all_attributes=True, attrs_to_prefetch=lazy_attrs)
         from_list = [ 'FROM', [ None, 'TABLE', entity._table_ ]]
         if attr is None:
             columns = entity._pk_columns_
@@ -3990,6 +4932,9 @@ class EntityMeta(type):
         entity._find_sql_cache_[query_key] = cached_sql
         return cached_sql
     def _fetch_objects(entity, cursor, attr_offsets, max_fetch_count=None, for_update=False, used_attrs=()):
+        rows = entity._fetch_rows_(cursor, max_fetch_count)
+        return entity._objects_from_rows_(rows, attr_offsets, for_update, used_attrs)
+    def _fetch_rows_(entity, cursor, max_fetch_count=None):
         if max_fetch_count is None: max_fetch_count = options.MAX_FETCH_COUNT
         if max_fetch_count is not None:
             rows = cursor.fetchmany(max_fetch_count + 1)
@@ -3999,19 +4944,105 @@ class EntityMeta(type):
                 throw(TooManyObjectsFoundError,
                     'Found more then pony.options.MAX_FETCH_COUNT=%d objects' % options.MAX_FETCH_COUNT)
         else: rows = cursor.fetchall()
+        return rows
+    def _objects_from_rows_(entity, rows, attr_offsets, for_update=False, used_attrs=()):
         objects = []
         if attr_offsets is None:
             objects = [ entity._get_by_raw_pkval_(row, for_update) for row in rows ]
             entity._load_many_(objects)
         else:
+            second_level_layouts = {} if entity._second_level_cache_ else None
+            parse_row = entity._get_row_parser_(attr_offsets)
             for row in rows:
-                real_entity_subclass, pkval, avdict = entity._parse_row_(row, attr_offsets)
+                real_entity_subclass, pkval, avdict = parse_row(row)
                 obj = real_entity_subclass._get_from_identity_map_(pkval, 'loaded', for_update)
                 if obj._status_ in del_statuses: continue
                 obj._db_set_(avdict)
                 objects.append(obj)
+                if second_level_layouts is not None:
+                    layout = second_level_layouts.get(real_entity_subclass, NOT_LOADED)
+                    if layout is NOT_LOADED:
+                        layout = second_level_layouts[real_entity_subclass] = \
+                            real_entity_subclass._get_second_level_layout_(attr_offsets)
+                    if layout is not None: obj._add_to_second_level_cache_(row, layout)
         if used_attrs: entity._set_rbits(objects, used_attrs)
         return objects
+    def _tuples_from_rows_(entity, rows, attr_offsets):
+        if attr_offsets is None: rows, attr_offsets = entity._load_rows_by_raw_pkvals_(rows)
+        names = []
+        decoders = []
+        for attr in entity._attrs_:
+            if attr.is_collection: continue
+            offsets = attr_offsets.get(attr)
+            if offsets is None: continue
+            names.append(attr.name)
+            decoders.append(make_tuple_value_decoder(attr, offsets))
+        names = tuple(names)
+        row_class = entity._tuple_row_classes_.get(names)
+        if row_class is None:
+            row_class = entity._tuple_row_classes_[names] = namedtuple(entity.__name__ + 'Row', names, rename=True)
+        return [ row_class(*[ decode(row) for decode in decoders ]) for row in rows ]
+    def _load_rows_by_raw_pkvals_(entity, pk_rows):
+        # query selects primary key columns only, the other columns are loaded without creating objects
+        database = entity._database_
+        pk_rows = [ tuple(row) for row in pk_rows ]
+        max_batch_size = database.provider.max_params_count // len(entity._pk_columns_)
+        attr_offsets = None
+        rows = {}
+        for i in xrange(0, len(pk_rows), max_batch_size):
+            batch = pk_rows[i:i+max_batch_size]
+            sql, adapter, attr_offsets = entity._construct_batchload_sql_(len(batch), from_seeds=False)
+            cursor = database._exec_sql(sql, adapter(batch))
+            pk_offsets = [ offset for attr in entity._pk_attrs_ for offset in attr_offsets[attr] ]
+            for row in cursor.fetchall(): rows[tuple(row[offset] for offset in pk_offsets)] = row
+        if attr_offsets is None: attr_offsets = entity._construct_batchload_sql_(1, from_seeds=False)[2]
+        return [ rows[pk_row] for pk_row in pk_rows if pk_row in rows ], attr_offsets
+    def _get_second_level_layout_(entity, attr_offsets):
+        layout = []
+        for attr in entity._attrs_:
+            if attr.is_collection or not attr.columns or attr.lazy: continue
+            offsets = attr_offsets.get(attr)
+            if offsets is None: return None  # the row is incomplete
+            layout.append((attr.name, offsets))
+        return tuple(layout)
+    def _get_second_level_key_(entity, raw_pkval):
+        return (entity._root_.__name__,) + tuple(raw_pkval)
+    def _find_in_second_level_cache_(entity, pkval):
+        if not entity._pk_is_composite_: pkval = (pkval,)
+        raw_pkval = []
+        for attr, val in izip(entity._pk_attrs_, pkval): raw_pkval.extend(attr.get_raw_values(val))
+        key = entity._get_second_level_key_(raw_pkval)
+        entry = entity._database_.second_level_cache.get_many([ key ]).get(key)
+        if entry is None: return None
+        return entity._restore_from_second_level_cache_(entry)
+    def _restore_from_second_level_cache_(entity, entry):
+        entity_name, items = entry
+        real_entity_subclass = entity._database_.entities.get(entity_name)
+        if real_entity_subclass is None or real_entity_subclass._root_ is not entity._root_: return None
+        row = []
+        attr_offsets = {}
+        adict = real_entity_subclass._adict_
+        for attr_name, values in items:
+            attr = adict.get(attr_name)
+            if attr is None: return None
+            attr_offsets[attr] = list(xrange(len(row), len(row) + len(values)))
+            row.extend(values)
+        real_entity_subclass, pkval, avdict = real_entity_subclass._parse_row_(row, attr_offsets)
+        obj = real_entity_subclass._get_from_identity_map_(pkval, 'loaded')
+        if obj._status_ in del_statuses: return None
+        obj._db_set_(avdict)
+        return obj
+    def _load_from_second_level_cache_(entity, objects):
+        cache = entity._database_._get_cache()
+        keys = {}
+        for obj in objects: keys[entity._get_second_level_key_(obj._get_raw_pkval_())] = obj
+        entries = entity._database_.second_level_cache.get_many(list(keys))
+        for key, entry in iteritems(entries):
+            obj = keys[key]
+            obj2 = obj.__class__._restore_from_second_level_cache_(entry)
+            assert obj2 is None or obj2 is obj
+        seeds = cache.seeds[entity._pk_attrs_]
+        return [ obj for obj in objects if obj in seeds ]
     def _set_rbits(entity, objects, attrs):
         rbits_dict = {}
         get_rbits = rbits_dict.get
@@ -4023,33 +5054,91 @@ class EntityMeta(type):
                 rbits = sum(obj._bits_except_volatile_.get(attr, 0) for attr in attrs)
                 rbits_dict[obj.__class__] = rbits
             obj._rbits_ |= rbits & ~wbits
+    def _get_perm_entry_(entity, perm, user_groups):
+        key = perm, user_groups
+        entry = entity._perm_matrix_.get(key)
+        if entry is None: entry = entity._perm_matrix_[key] = entity._compile_perm_entry_(perm, user_groups)
+        return entry
+    def _compile_perm_entry_(entity, perm, user_groups):
+        # returns (entity is allowed, allowed attributes, (roles, labels) pairs required from object or None)
+        access_rules = entity._access_rules_.get(perm, ())
+        rules = [ rule for rule in access_rules
+                  if user_groups.issuperset(rule.groups) and entity not in rule.entities_to_exclude ]
+        attrs = set()
+        for attr in entity._new_attrs_ if access_rules else ():
+            if attr.hidden: continue
+            if any(attr not in rule.attrs_to_exclude for rule in rules): attrs.add(attr)
+            elif attr.reverse:
+                reverse = attr.reverse
+                rentity = reverse.entity
+                for rule in rentity._access_rules_.get(perm, ()):
+                    if user_groups.issuperset(rule.groups) and rentity not in rule.entities_to_exclude \
+                                                           and reverse not in rule.attrs_to_exclude:
+                        attrs.add(attr)
+                        break
+        if any(not rule.roles and not rule.labels for rule in rules): row_rules = None
+        else: row_rules = tuple(set((frozenset(rule.roles), frozenset(rule.labels)) for rule in rules))
+        return bool(rules), frozenset(attrs), row_rules
+    def _get_view_rules_(entity, user_groups):
+        # returns None if all objects are viewable, else (roles, labels) pairs for 'view' and 'edit' permissions
+        row_rules = []
+        for perm in ('view', 'edit'):
+            if not entity._access_rules_.get(perm): continue
+            allowed, attrs, perm_row_rules = entity._get_perm_entry_(perm, user_groups)
+            if not allowed: continue
+            if perm_row_rules is None: return None
+            row_rules.extend(perm_row_rules)
+        return tuple(row_rules)
     def _parse_row_(entity, row, attr_offsets):
+        return entity._get_row_parser_(attr_offsets)(row)
+    def _get_row_parser_(entity, attr_offsets):
+        key = frozenset((attr, tuple(offsets)) for attr, offsets in iteritems(attr_offsets))
+        parse_row = entity._row_parsers_.get(key)
+        if parse_row is None: parse_row = entity._row_parsers_[key] = entity._compile_row_parser_(attr_offsets)
+        return parse_row
+    def _compile_row_parser_(entity, attr_offsets):
+        attr_offsets = dict(attr_offsets)
+        pk_attrs = entity._pk_attrs_
+        pk_is_composite = entity._pk_is_composite_
+        layouts = {}
+        def get_layout(real_entity_subclass):
+            # pk attributes without columns in the row are filled with discriminator value
+            pk_parsers = [ None ] * len(pk_attrs)
+            parsers = []
+            for attr in real_entity_subclass._attrs_:
+                offsets = attr_offsets.get(attr)
+                if offsets is None or attr.is_discriminator: continue
+                parse = make_row_value_parser(attr, offsets)
+                if attr in pk_attrs: pk_parsers[pk_attrs.index(attr)] = parse
+                else: parsers.append((attr, parse))
+            layout = layouts[real_entity_subclass] = tuple(pk_parsers), tuple(parsers)
+            return layout
+        def parse_row(row, real_entity_subclass=entity, discr_value=None):
+            layout = layouts.get(real_entity_subclass)
+            if layout is None: layout = get_layout(real_entity_subclass)
+            pk_parsers, parsers = layout
+            avdict = {}
+            for attr, parse in parsers: avdict[attr] = parse(row)
+            pkval = tuple(discr_value if parse is None else parse(row) for parse in pk_parsers)
+            assert None not in pkval
+            if not pk_is_composite: pkval = pkval[0]
+            return real_entity_subclass, pkval, avdict
         discr_attr = entity._discriminator_attr_
-        if not discr_attr:
-            discr_value = None
-            real_entity_subclass = entity
-        else:
-            discr_offset = attr_offsets[discr_attr][0]
-            discr_value = discr_attr.validate(row[discr_offset], None, entity, from_db=True)
-            real_entity_subclass = discr_attr.code2cls[discr_value]
-            discr_value = real_entity_subclass._discriminator_  # To convert unicode to str in Python 2.x
-
-        avdict = {}
-        for attr in real_entity_subclass._attrs_:
-            offsets = attr_offsets.get(attr)
-            if offsets is None or attr.is_discriminator: continue
-            avdict[attr] = attr.parse_value(row, offsets)
-
-        pkval = tuple(avdict.pop(attr, discr_value) for attr in entity._pk_attrs_)
-        assert None not in pkval
-        if not entity._pk_is_composite_: pkval = pkval[0]
-        return real_entity_subclass, pkval, avdict
+        if not discr_attr: return parse_row
+        parse_discr = make_row_value_parser(discr_attr, attr_offsets[discr_attr])
+        code2cls = discr_attr.code2cls
+        def parse_row_with_discriminator(row):
+            real_entity_subclass = code2cls[parse_discr(row)]
+            # real_entity_subclass._discriminator_ is used to convert unicode to str in Python 2.x
+            return parse_row(row, real_entity_subclass, real_entity_subclass._discriminator_)
+        return parse_row_with_discriminator
     def _load_many_(entity, objects):
         database = entity._database_
         cache = database._get_cache()
         seeds = cache.seeds[entity._pk_attrs_]
         if not seeds: return
         objects = {obj for obj in objects if obj in seeds}
+        if entity._second_level_cache_ and objects: objects = entity._load_from_second_level_cache_(objects)
         objects = sorted(objects, key=attrgetter('_pkval_'))
         max_batch_size = database.provider.max_params_count // len(entity._pk_columns_)
         while objects:
@@ -4123,8 +5212,13 @@ class EntityMeta(type):
                 cache.objects.add(obj)
                 obj._pkval_ = pkval
                 obj._status_ = status
-                obj._vals_ = {}
-                obj._dbvals_ = {}
+                if entity._compact_values_:
+                    values_class = entity._root_._compact_values_class_
+                    obj._vals_ = values_class(values_class.empty)
+                    obj._dbvals_ = values_class(values_class.empty)
+                else:
+                    obj._vals_ = {}
+                    obj._dbvals_ = {}
                 obj._save_pos_ = None
                 obj._session_cache_ = cache
                 if pkval is not None:
@@ -4151,6 +5245,7 @@ class EntityMeta(type):
         if for_update:
             assert cache.in_transaction
             cache.for_update.add(obj)
+        if cache.recently_used is not None: cache.touch(obj)
         return obj
     def _get_by_raw_pkval_(entity, raw_pkval, for_update=False, from_db=True):
         i = 0
@@ -4239,6 +5334,80 @@ class EntityMeta(type):
     @db_session(ddl=True)
     def drop_table(entity, with_all_data=False):
         entity._database_._drop_tables([ entity._table_ ], True, with_all_data)
+    def _get_serializer_(entity, attrs, related_objects=False):
+        key = attrs, related_objects
+        serializer = entity._serializers_.get(key)
+        if serializer is None:
+            serializer = entity._serializers_[key] = entity._compile_serializer_(attrs, related_objects)
+        return serializer
+    def _compile_serializer_(entity, attrs, related_objects):
+        # returns function which converts object to dict, loaded values are taken from obj._vals_ directly
+        def serialize_generic_attr(obj, attr):
+            value = attr.__get__(obj)
+            if attr.is_collection:
+                if related_objects: value = sorted(value)
+                elif len(attr.reverse.entity._pk_columns_) > 1:
+                    value = sorted(item._get_raw_pkval_() for item in value)
+                else: value = sorted(item._get_raw_pkval_()[0] for item in value)
+            elif attr.is_relation and not related_objects and value is not None:
+                value = value._get_raw_pkval_()
+                if len(value) == 1: value = value[0]
+            return value
+        def serialize_generic(obj):
+            return {attr.name: serialize_generic_attr(obj, attr) for attr in attrs}
+
+        # step kinds: 0 - value, 1 - object, 2 - simple pk of object, 3 - raw pk of object,
+        # 4 - collection of objects, 5 - collection of simple pks, 6 - collection of raw pks, 7 - generic descriptor
+        steps = []
+        rbits = 0
+        for attr in attrs:
+            if attr.is_collection:
+                rentity = attr.reverse.entity
+                if related_objects: kind = 4
+                elif len(rentity._pk_columns_) > 1: kind = 6
+                elif not rentity._pk_attrs_[0].reverse: kind = 5
+                else: kind = 7
+            elif attr.is_discriminator: kind = 7
+            else:
+                if attr.pk_offset is None: rbits |= entity._bits_except_volatile_[attr]
+                if not attr.is_relation: kind = 0
+                elif attr.py_type._subclasses_: kind = 7  # object of base class may require loading
+                elif related_objects: kind = 1
+                elif len(attr.py_type._pk_columns_) == 1 and not attr.py_type._pk_attrs_[0].reverse: kind = 2
+                else: kind = 3
+            steps.append((attr.name, attr, kind))
+        steps = tuple(steps)
+
+        def serialize(obj):
+            vals = obj._vals_
+            if vals is None or obj._status_ in del_statuses: return serialize_generic(obj)
+            get = vals.get
+            result = {}
+            for name, attr, kind in steps:
+                if kind == 0:
+                    value = get(attr, NOT_LOADED)
+                    if value is NOT_LOADED: value = attr.get(obj)
+                elif kind <= 3:
+                    value = get(attr, NOT_LOADED)
+                    if value is NOT_LOADED or value is not None and value._session_cache_ is None:
+                        value = attr.get(obj)
+                    if value is None or kind == 1: pass
+                    elif kind == 2: value = value._pkval_
+                    else:
+                        value = value._get_raw_pkval_()
+                        if len(value) == 1: value = value[0]
+                elif kind == 7:
+                    value = serialize_generic_attr(obj, attr)
+                else:
+                    items = attr.copy(obj)
+                    if kind == 4: value = sorted(items)
+                    elif kind == 5: value = sorted(item._pkval_ for item in items)
+                    else: value = sorted(item._get_raw_pkval_() for item in items)
+                result[name] = value
+            wbits = obj._wbits_
+            if wbits is not None: obj._rbits_ |= rbits & ~wbits
+            return result
+        return serialize
     def _get_attrs_(entity, only=None, exclude=None, with_collections=False, with_lazy=False):
         if only and not isinstance(only, basestring): only = tuple(only)
         if exclude and not isinstance(exclude, basestring): exclude = tuple(exclude)
@@ -4436,6 +5605,8 @@ class Entity(with_metaclass(EntityMeta)):
         if cache is not database._get_cache():
             throw(TransactionError, "Object %s doesn't belong to current transaction" % safe_repr(obj))
         seeds = cache.seeds[entity._pk_attrs_]
+        if entity._second_level_cache_ and obj in seeds:
+            if not entity._load_from_second_level_cache_([ obj ]): return
         max_batch_size = database.provider.max_params_count // len(entity._pk_columns_)
         objects = [ obj ]
         if options.PREFETCHING:
@@ -4533,14 +5704,17 @@ class Entity(with_metaclass(EntityMeta)):
         cache.seeds[obj._pk_attrs_].discard(obj)
         if not avdict: return
 
-        get_val = obj._vals_.get
-        get_dbval = obj._dbvals_.get
+        obj_vals = obj._vals_
+        dbvals = obj._dbvals_
+        compact = dbvals.__class__ is not dict  # CompactValues slots are accessed by index directly
+        get_val = obj_vals.get
+        get_dbval = dbvals.get
         rbits = obj._rbits_
         wbits = obj._wbits_
         for attr, new_dbval in items_list(avdict):
             assert attr.pk_offset is None
             assert new_dbval is not NOT_LOADED
-            old_dbval = get_dbval(attr, NOT_LOADED)
+            old_dbval = list_getitem(dbvals, attr.value_index) if compact else get_dbval(attr, NOT_LOADED)
             if old_dbval is not NOT_LOADED:
                 if unpickling or old_dbval == new_dbval or (
                         not attr.reverse and attr.converters[0].dbvals_equal(old_dbval, new_dbval)):
@@ -4557,7 +5731,8 @@ class Entity(with_metaclass(EntityMeta)):
                       % (obj.__class__.__name__, attr.name, obj, old_dbval, new_dbval))
 
             if attr.reverse: attr.db_update_reverse(obj, old_dbval, new_dbval)
-            obj._dbvals_[attr] = new_dbval
+            if compact: list_setitem(dbvals, attr.value_index, new_dbval)
+            else: dbvals[attr] = new_dbval
             if wbits & bit: del avdict[attr]
             if attr.is_unique:
                 old_val = get_val(attr)
@@ -4578,7 +5753,8 @@ class Entity(with_metaclass(EntityMeta)):
                 assert len(attr.converters) == 1, attr
                 converter = attr.converters[0]
                 new_val = converter.dbval2val(new_val, obj)
-            obj._vals_[attr] = new_val
+            if compact: list_setitem(obj_vals, attr.value_index, new_val)
+            else: obj_vals[attr] = new_val
     def _delete_(obj, undo_funcs=None):
         status = obj._status_
         if status in del_statuses: return
@@ -4609,6 +5785,7 @@ class Entity(with_metaclass(EntityMeta)):
                 for attr in obj._attrs_:
                     if not attr.is_collection: continue
                     if isinstance(attr, Set):
+                        if attr.cascade_delete and obj._delete_collection_in_bulk_(attr, undo_funcs): continue
                         set_wrapper = attr.__get__(obj)
                         if not set_wrapper.__nonzero__(): pass
                         elif attr.cascade_delete:
@@ -4680,6 +5857,29 @@ class Entity(with_metaclass(EntityMeta)):
                 if not is_recursive_call:
                     for undo_func in reversed(undo_funcs): undo_func()
                 raise
+    def _delete_collection_in_bulk_(obj, attr, undo_funcs):
+        if obj._status_ == 'created': return False
+        setdata = obj._vals_.get(attr)
+        if setdata is not None and setdata.is_fully_loaded: return False
+        rentity = attr.reverse.entity
+        plan = rentity._get_cascade_delete_plan_()
+        if plan is None: return False
+        cache = obj._session_cache_
+        for entity in get_cascade_delete_entities(rentity, plan):  # seeds can hide objects of the collection
+            seeds = cache.seeds[entity._pk_attrs_]
+            if seeds: entity._load_many_(list(seeds))
+        setdata = obj._vals_.get(attr)
+        if setdata:
+            for robj in list(setdata): robj._delete_(undo_funcs)
+        cascade_deletes = cache.cascade_deletes
+        attrs = cascade_deletes.get(obj)
+        if attrs is None: attrs = cascade_deletes[obj] = []
+        attrs.append(attr)
+        def undo_func():
+            attrs.remove(attr)
+            if not attrs: cascade_deletes.pop(obj, None)
+        undo_funcs.append(undo_func)
+        return True
     @cut_traceback
     def delete(obj):
         cache = obj._session_cache_
@@ -4808,6 +6008,13 @@ class Entity(with_metaclass(EntityMeta)):
             val = obj._vals_[attr]
             if val is not None and val._status_ == 'created':
                 val._save_(dependent_objects)
+    def _has_unsaved_principals_(obj):
+        vals = obj._vals_
+        for attr in obj._attrs_with_columns_:
+            if attr.reverse:
+                val = vals.get(attr)
+                if val is not None and val._status_ == 'created': return True
+        return False
     def _update_dbvals_(obj, after_create, new_dbvals):
         bits = obj._bits_
         vals = obj._vals_
@@ -4834,7 +6041,7 @@ class Entity(with_metaclass(EntityMeta)):
             del vals[attr]
             dbvals.pop(attr, None)
 
-    def _save_created_(obj):
+    def _get_insert_values_(obj):
         auto_pk = (obj._pkval_ is None)
         attrs = []
         values = []
@@ -4852,28 +6059,37 @@ class Entity(with_metaclass(EntityMeta)):
                 else:
                     new_dbvals[attr] = val
                     values.extend(attr.get_raw_values(val))
-        attrs = tuple(attrs)
-
+        return auto_pk, tuple(attrs), values, new_dbvals
+    @classmethod
+    def _get_insert_columns_and_params_(entity, attrs, row_count=1):
+        columns = []
+        converters = []
+        for attr in attrs:
+            columns.extend(attr.columns)
+            converters.extend(attr.converters)
+        assert len(columns) == len(converters)
+        n = len(converters)
+        rows = [ [ [ 'PARAM', (i*n + j, None, None), converter ] for j, converter in enumerate(converters) ]
+                 for i in xrange(row_count) ]
+        return columns, rows
+    @classmethod
+    def _get_insert_sql_(entity, attrs, auto_pk):
+        cached_sql = entity._insert_sql_cache_.get(attrs)
+        if cached_sql is not None: return cached_sql
+        database = entity._database_
+        columns, rows = entity._get_insert_columns_and_params_(attrs)
+        if not columns and database.provider.dialect == 'Oracle':
+            sql_ast = [ 'INSERT', entity._table_, entity._pk_columns_,
+                        [ [ 'DEFAULT' ] for column in entity._pk_columns_ ] ]
+        else: sql_ast = [ 'INSERT', entity._table_, columns, rows[0] ]
+        if auto_pk: sql_ast.append(entity._pk_columns_[0])
+        cached_sql = entity._insert_sql_cache_[attrs] = database._ast2sql(sql_ast)
+        return cached_sql
+    def _save_created_(obj, insert_values=None):
+        if insert_values is None: insert_values = obj._get_insert_values_()
+        auto_pk, attrs, values, new_dbvals = insert_values
         database = obj._database_
-        cached_sql = obj._insert_sql_cache_.get(attrs)
-        if cached_sql is None:
-            columns = []
-            converters = []
-            for attr in attrs:
-                columns.extend(attr.columns)
-                converters.extend(attr.converters)
-            assert len(columns) == len(converters)
-            params = [ [ 'PARAM', (i, None, None),  converter ] for i, converter in enumerate(converters) ]
-            entity = obj.__class__
-            if not columns and database.provider.dialect == 'Oracle':
-                sql_ast = [ 'INSERT', entity._table_, obj._pk_columns_,
-                            [ [ 'DEFAULT' ] for column in obj._pk_columns_ ] ]
-            else: sql_ast = [ 'INSERT', entity._table_, columns, params ]
-            if auto_pk: sql_ast.append(entity._pk_columns_[0])
-            sql, adapter = database._ast2sql(sql_ast)
-            entity._insert_sql_cache_[attrs] = sql, adapter
-        else: sql, adapter = cached_sql
-
+        sql, adapter = obj._get_insert_sql_(attrs, auto_pk)
         arguments = adapter(values)
         try:
             if auto_pk: new_id = database._exec_sql(sql, arguments, returning_id=True,
@@ -4889,20 +6105,66 @@ class Entity(with_metaclass(EntityMeta)):
             throw(UnexpectedError, 'Object %r cannot be stored in the database. %s: %s'
                                    % (obj, e.__class__.__name__, msg), e)
 
-        if auto_pk:
-            pk_attrs = obj._pk_attrs_
-            cache_index = obj._session_cache_.indexes[pk_attrs]
-            obj2 = cache_index.setdefault(new_id, obj)
-            if obj2 is not obj: throw(TransactionIntegrityError,
-                'Newly auto-generated id value %s was already used in transaction cache for another object' % new_id)
-            obj._pkval_ = obj._vals_[pk_attrs[0]] = new_id
-            obj._newid_ = None
-
+        if auto_pk: obj._set_new_id_(new_id)
         obj._status_ = 'inserted'
         obj._rbits_ = obj._all_bits_except_volatile_
         obj._wbits_ = 0
         obj._update_dbvals_(True, new_dbvals)
-    def _save_updated_(obj):
+    def _set_new_id_(obj, new_id):
+        pk_attrs = obj._pk_attrs_
+        cache_index = obj._session_cache_.indexes[pk_attrs]
+        obj2 = cache_index.setdefault(new_id, obj)
+        if obj2 is not obj: throw(TransactionIntegrityError,
+            'Newly auto-generated id value %s was already used in transaction cache for another object' % new_id)
+        obj._pkval_ = obj._vals_[pk_attrs[0]] = new_id
+        obj._newid_ = None
+    @classmethod
+    def _save_created_many_(entity, objects, auto_pk, attrs, values_list, new_dbvals_list):
+        database = entity._database_
+        provider = database.provider
+        try:
+            if not auto_pk:
+                sql, adapter = entity._get_insert_sql_(attrs, auto_pk)
+                arguments = [ adapter(values) for values in values_list ]
+                database._exec_sql(sql, arguments, start_transaction=True)
+            else:
+                # ids are taken from the sequence in advance, because the order of rows
+                # returned by multi-row INSERT ... RETURNING is not guaranteed
+                sql, arguments = provider.get_next_ids_sql(entity._table_, entity._pk_columns_[0], len(objects))
+                cursor = database._exec_sql(sql, arguments, start_transaction=True)
+                new_ids = [ row[0] for row in cursor.fetchall() ]
+                if None in new_ids:
+                    entity._bulk_id_allocation_ = False  # the primary key column has no sequence
+                    for obj, values, new_dbvals in izip(objects, values_list, new_dbvals_list):
+                        obj._save_created_((auto_pk, attrs, values, new_dbvals))
+                    return
+                if PY2: new_ids = [ int(new_id) if type(new_id) is long else new_id for new_id in new_ids ]
+                attrs = entity._pk_attrs_ + attrs
+                values_list = [ [ new_id ] + values for new_id, values in izip(new_ids, values_list) ]
+                max_batch_size = max(1, provider.max_params_count // len(values_list[0]))
+                for start in xrange(0, len(objects), max_batch_size):
+                    batch = values_list[start:start+max_batch_size]
+                    cache_key = attrs, len(batch)
+                    cached_sql = entity._insert_many_sql_cache_.get(cache_key)
+                    if cached_sql is None:
+                        columns, rows = entity._get_insert_columns_and_params_(attrs, len(batch))
+                        sql_ast = [ 'INSERT_MANY', entity._table_, columns, rows ]
+                        cached_sql = entity._insert_many_sql_cache_[cache_key] = database._ast2sql(sql_ast)
+                    sql, adapter = cached_sql
+                    arguments = adapter([ value for values in batch for value in values ])
+                    database._exec_sql(sql, arguments, start_transaction=True)
+        except (IntegrityError, DatabaseError) as e:
+            msg = " ".join(tostring(arg) for arg in e.args)
+            exc_class = TransactionIntegrityError if isinstance(e, IntegrityError) else UnexpectedError
+            throw(exc_class, '%d objects of %s starting from %r cannot be stored in the database. %s: %s'
+                             % (len(objects), entity.__name__, objects[0], e.__class__.__name__, msg), e)
+        for i, obj in enumerate(objects):
+            if auto_pk: obj._set_new_id_(new_ids[i])
+            obj._status_ = 'inserted'
+            obj._rbits_ = obj._all_bits_except_volatile_
+            obj._wbits_ = 0
+            obj._update_dbvals_(True, new_dbvals_list[i])
+    def _get_update_values_(obj):
         update_columns = []
         values = []
         new_dbvals = {}
@@ -4917,37 +6179,45 @@ class Entity(with_metaclass(EntityMeta)):
             else:
                 new_dbvals[attr] = val
                 values.extend(attr.get_raw_values(val))
-        if update_columns:
-            for attr in obj._pk_attrs_:
-                val = obj._vals_[attr]
-                values.extend(attr.get_raw_values(val))
+        if not update_columns: return None, (), values, new_dbvals
+        for attr in obj._pk_attrs_:
+            val = obj._vals_[attr]
+            values.extend(attr.get_raw_values(val))
+        cache = obj._session_cache_
+        optimistic_session = cache.db_session is None or cache.db_session.optimistic
+        if optimistic_session and obj not in cache.for_update:
+            optimistic_ops, optimistic_columns, optimistic_converters, optimistic_values = \
+                obj._construct_optimistic_criteria_()
+            values.extend(optimistic_values)
+        else: optimistic_columns = optimistic_converters = optimistic_ops = ()
+        query_key = tuple(update_columns), tuple(optimistic_columns), tuple(optimistic_ops)
+        return query_key, optimistic_converters, values, new_dbvals
+    def _get_update_sql_(obj, query_key, optimistic_converters):
+        cached_sql = obj._update_sql_cache_.get(query_key)
+        if cached_sql is not None: return cached_sql
+        update_columns, optimistic_columns, optimistic_ops = query_key
+        update_converters = []
+        for attr in obj._attrs_with_bit_(obj._attrs_with_columns_, obj._wbits_):
+            update_converters.extend(attr.converters)
+        assert len(update_columns) == len(update_converters)
+        update_params = [ [ 'PARAM', (i, None, None), converter ] for i, converter in enumerate(update_converters) ]
+        params_count = len(update_params)
+        where_list = [ 'WHERE' ]
+        pk_columns = obj._pk_columns_
+        pk_converters = obj._pk_converters_
+        params_count = populate_criteria_list(where_list, pk_columns, pk_converters, repeat('EQ'), params_count)
+        if optimistic_columns: populate_criteria_list(
+            where_list, optimistic_columns, optimistic_converters, optimistic_ops, params_count, optimistic=True)
+        sql_ast = [ 'UPDATE', obj._table_, list(izip(update_columns, update_params)), where_list ]
+        cached_sql = obj._update_sql_cache_[query_key] = obj._database_._ast2sql(sql_ast)
+        return cached_sql
+    def _save_updated_(obj, update_values=None):
+        if update_values is None: update_values = obj._get_update_values_()
+        query_key, optimistic_converters, values, new_dbvals = update_values
+        if query_key is not None:
             cache = obj._session_cache_
-            optimistic_session = cache.db_session is None or cache.db_session.optimistic
-            if optimistic_session and obj not in cache.for_update:
-                optimistic_ops, optimistic_columns, optimistic_converters, optimistic_values = \
-                    obj._construct_optimistic_criteria_()
-                values.extend(optimistic_values)
-            else: optimistic_columns = optimistic_converters = optimistic_ops = ()
-            query_key = tuple(update_columns), tuple(optimistic_columns), tuple(optimistic_ops)
             database = obj._database_
-            cached_sql = obj._update_sql_cache_.get(query_key)
-            if cached_sql is None:
-                update_converters = []
-                for attr in obj._attrs_with_bit_(obj._attrs_with_columns_, obj._wbits_):
-                    update_converters.extend(attr.converters)
-                assert len(update_columns) == len(update_converters)
-                update_params = [ [ 'PARAM', (i, None, None), converter ] for i, converter in enumerate(update_converters) ]
-                params_count = len(update_params)
-                where_list = [ 'WHERE' ]
-                pk_columns = obj._pk_columns_
-                pk_converters = obj._pk_converters_
-                params_count = populate_criteria_list(where_list, pk_columns, pk_converters, repeat('EQ'), params_count)
-                if optimistic_columns: populate_criteria_list(
-                    where_list, optimistic_columns, optimistic_converters, optimistic_ops, params_count, optimistic=True)
-                sql_ast = [ 'UPDATE', obj._table_, list(izip(update_columns, update_params)), where_list ]
-                sql, adapter = database._ast2sql(sql_ast)
-                obj._update_sql_cache_[query_key] = sql, adapter
-            else: sql, adapter = cached_sql
+            sql, adapter = obj._get_update_sql_(query_key, optimistic_converters)
             arguments = adapter(values)
             cursor = database._exec_sql(sql, arguments, start_transaction=True)
             if cursor.rowcount == 0 and cache.db_session.optimistic:
@@ -4956,10 +6226,46 @@ class Entity(with_metaclass(EntityMeta)):
         obj._rbits_ |= obj._wbits_ & obj._all_bits_except_volatile_
         obj._wbits_ = 0
         obj._update_dbvals_(False, new_dbvals)
+    @classmethod
+    def _save_updated_many_(entity, objects, update_values_list):
+        obj = objects[0]
+        query_key, optimistic_converters = update_values_list[0][:2]
+        sql, adapter = obj._get_update_sql_(query_key, optimistic_converters)
+        database = entity._database_
+        provider = database.provider
+        optimistic = obj._session_cache_.db_session.optimistic
+        batch_size = provider.max_update_batch_size if optimistic else len(objects)
+        rowcount_is_known = True
+        for start in xrange(0, len(objects), batch_size):
+            batch = list(izip(objects[start:start+batch_size], update_values_list[start:start+batch_size]))
+            if not rowcount_is_known:
+                for obj, update_values in batch: obj._save_updated_(update_values)
+                continue
+            arguments = [ adapter(update_values[2]) for obj, update_values in batch ]
+            if not optimistic: database._exec_sql(sql, arguments, start_transaction=True)
+            else:
+                database._exec_sql('SAVEPOINT pony_bulk_update', start_transaction=True)
+                cursor = database._exec_sql(sql, arguments, start_transaction=True)
+                if cursor.rowcount != len(batch):
+                    # the batch is repeated row by row to find the object which was changed concurrently,
+                    # or to check each row if the driver cannot report rowcount of executemany()
+                    if cursor.rowcount < 0: rowcount_is_known = False
+                    database._exec_sql('ROLLBACK TO SAVEPOINT pony_bulk_update')
+                    for obj, update_values in batch: obj._save_updated_(update_values)
+                    continue
+                if provider.release_savepoint_syntax: database._exec_sql('RELEASE SAVEPOINT pony_bulk_update')
+            for obj, update_values in batch:
+                obj._status_ = 'updated'
+                obj._rbits_ |= obj._wbits_ & obj._all_bits_except_volatile_
+                obj._wbits_ = 0
+                obj._update_dbvals_(False, update_values[3])
     def _save_deleted_(obj):
+        cache = obj._session_cache_
+        attrs = cache.cascade_deletes.pop(obj, None)
+        if attrs:
+            for attr in attrs: obj.__class__._delete_collection_rows_(attr, [ obj ])
         values = []
         values.extend(obj._get_raw_pkval_())
-        cache = obj._session_cache_
         optimistic_session = cache.db_session is None or cache.db_session.optimistic
         if optimistic_session and obj not in cache.for_update:
             optimistic_ops, optimistic_columns, optimistic_converters, optimistic_values = \
@@ -4987,6 +6293,11 @@ class Entity(with_metaclass(EntityMeta)):
         cache.indexes[obj._pk_attrs_].pop(obj._pkval_)
 
     def find_updated_attributes(obj):
+        diff = obj._find_db_changes_(obj._dbvals_)
+        if diff is None: return "Object %s was deleted outside of current transaction" % safe_repr(obj)
+        return "Object %s was updated outside of current transaction%s" % (
+            safe_repr(obj), ('. Changes: %s' % ', '.join(diff) if diff else ''))
+    def _find_db_changes_(obj, dbvals):
         entity = obj.__class__
         attrs_to_select = []
         attrs_to_select.extend(entity._pk_attrs_)
@@ -5019,20 +6330,17 @@ class Entity(with_metaclass(EntityMeta)):
         arguments = adapter(obj._get_raw_pkval_())
         cursor = database._exec_sql(sql, arguments)
         row = cursor.fetchone()
-        if row is None:
-            return "Object %s was deleted outside of current transaction" % safe_repr(obj)
+        if row is None: return None
 
         real_entity_subclass, pkval, avdict = entity._parse_row_(row, attr_offsets)
         diff = []
         for attr, new_dbval in avdict.items():
-            old_dbval = obj._dbvals_[attr]
+            old_dbval = dbvals[attr]
             converter = attr.converters[0]
             if old_dbval != new_dbval and (
                     attr.reverse or not converter.dbvals_equal(old_dbval, new_dbval)):
                 diff.append('%s (%r -> %r)' % (attr.name, old_dbval, new_dbval))
-
-        return "Object %s was updated outside of current transaction%s" % (
-            safe_repr(obj), ('. Changes: %s' % ', '.join(diff) if diff else ''))
+        return diff
 
     def _save_(obj, dependent_objects=None):
         status = obj._status_
@@ -5044,10 +6352,23 @@ class Entity(with_metaclass(EntityMeta)):
         elif status == 'marked_to_delete': obj._save_deleted_()
         else: assert False, "_save_() called for object %r with incorrect status %s" % (obj, status)  # pragma: no cover
 
+        obj._remove_from_objects_to_save_()
+    def _add_to_second_level_cache_(obj, row, layout):
+        entity = obj.__class__
+        ttl = entity._second_level_cache_
+        if ttl is True: ttl = entity._database_.second_level_cache.ttl
+        entry = entity.__name__, tuple((attr_name, tuple(row[offset] for offset in offsets))
+                                       for attr_name, offsets in layout)
+        key = entity._get_second_level_key_(obj._get_raw_pkval_())
+        obj._session_cache_.second_level_updates[key] = entry, ttl
+    def _remove_from_objects_to_save_(obj):
         assert obj._status_ in saved_statuses
         cache = obj._session_cache_
         assert cache is not None and cache.is_alive
         cache.saved_objects.append((obj, obj._status_))
+        cache.written_tables.add(obj._table_)
+        if obj._second_level_cache_:
+            cache.second_level_invalidated.add(obj.__class__._get_second_level_key_(obj._get_raw_pkval_()))
         objects_to_save = cache.objects_to_save
         save_pos = obj._save_pos_
         if save_pos == len(objects_to_save) - 1:
@@ -5092,20 +6413,9 @@ class Entity(with_metaclass(EntityMeta)):
     def to_dict(obj, only=None, exclude=None, with_collections=False, with_lazy=False, related_objects=False):
         cache = obj._session_cache_
         if cache is not None and cache.is_alive and cache.modified: cache.flush()
-        attrs = obj.__class__._get_attrs_(only, exclude, with_collections, with_lazy)
-        result = {}
-        for attr in attrs:
-            value = attr.__get__(obj)
-            if attr.is_collection:
-                if related_objects: value = sorted(value)
-                elif len(attr.reverse.entity._pk_columns_) > 1:
-                    value = sorted(item._get_raw_pkval_() for item in value)
-                else: value = sorted(item._get_raw_pkval_()[0] for item in value)
-            elif attr.is_relation and not related_objects and value is not None:
-                value = value._get_raw_pkval_()
-                if len(value) == 1: value = value[0]
-            result[attr.name] = value
-        return result
+        entity = obj.__class__
+        attrs = entity._get_attrs_(only, exclude, with_collections, with_lazy)
+        return entity._get_serializer_(attrs, related_objects)(obj)
     def to_json(obj, include=(), exclude=(), converter=None, with_schema=True, schema_hash=None):
         return obj._database_.to_json(obj, include, exclude, converter, with_schema, schema_hash)
 
@@ -5270,6 +6580,15 @@ def extract_vars(filter_num, extractors, globals, locals, cells=None):
         vars[key] = value
     return vars, vartypes
 
+aggregate_func_names = frozenset([ 'count', 'sum', 'avg', 'min', 'max' ])
+aggregate_result_classes = {}
+
+def get_aggregate_result_class(names):
+    result_class = aggregate_result_classes.get(names)
+    if result_class is None:
+        result_class = aggregate_result_classes[names] = namedtuple('AggregateResult', names)
+    return result_class
+
 def unpickle_query(query_result):
     return query_result
 
@@ -5297,8 +6616,7 @@ class Query(object):
         query._key = HashableDict(extractors_key, vartypes=vartypes, left_join=left_join, filters=())
         query._database = database
 
-        translator = database._translator_cache.get(query._key)
-        if translator is None:
+        def build_translator():
             pickled_tree = pickle_ast(tree)
             tree_copy = unpickle_ast(pickled_tree)  # tree = deepcopy(tree)
             translator_cls = database.provider.translator_cls
@@ -5309,8 +6627,8 @@ class Query(object):
                 try: translator = translator_cls(tree_copy, extractors, vartypes, left_join=True, optimize=name_path)
                 except OptimizationFailed: translator.optimization_failed = True
             translator.pickled_tree = pickled_tree
-            database._translator_cache[query._key] = translator
-        query._translator = translator
+            return translator
+        query._translator = database._get_translator(query._key, build_translator)
         query._filters = ()
         query._next_kwarg_id = 0
         query._for_update = query._nowait = False
@@ -5318,6 +6636,9 @@ class Query(object):
         query._prefetch = False
         query._entities_to_prefetch = set()
         query._attrs_to_prefetch_dict = defaultdict(set)
+        query._result_cache = False
+        query._result_cache_ttl = None
+        query._as_tuples = False
     def _clone(query, **kwargs):
         new_query = object.__new__(Query)
         new_query.__dict__.update(query.__dict__)
@@ -5337,13 +6658,20 @@ class Query(object):
         database = query._database
         cache_entry = database._constructed_sql_cache.get(sql_key)
         if cache_entry is None:
-            sql_ast, attr_offsets = translator.construct_sql_ast(
-                range, query._distinct, aggr_func_name, query._for_update, query._nowait, attrs_to_prefetch)
-            cache = database._get_cache()
-            sql, adapter = database.provider.ast2sql(sql_ast)
-            cache_entry = sql, adapter, attr_offsets
+            persistent_cache = database._persistent_query_cache
+            persistent_key = None
+            if persistent_cache is not None and not query._for_update:
+                persistent_key = persistent_cache.make_key(sql_key)
+                if persistent_key is not None: cache_entry = persistent_cache.get(persistent_key)
+            if cache_entry is None:
+                sql_ast, attr_offsets = translator.construct_sql_ast(
+                    range, query._distinct, aggr_func_name, query._for_update, query._nowait, attrs_to_prefetch)
+                cache = database._get_cache()
+                sql, adapter = database.provider.ast2sql(sql_ast)
+                cache_entry = sql, adapter, attr_offsets
+                if persistent_key is not None: persistent_cache.put(persistent_key, sql, adapter, attr_offsets)
             database._constructed_sql_cache[sql_key] = cache_entry
-        else: sql, adapter, attr_offsets = cache_entry
+        sql, adapter, attr_offsets = cache_entry
         arguments = adapter(query._vars)
         if query._translator.query_result_is_cacheable:
             arguments_key = HashableDict(arguments) if type(arguments) is dict else arguments
@@ -5355,42 +6683,151 @@ class Query(object):
     def get_sql(query):
         sql, arguments, attr_offsets, query_key = query._construct_sql_and_arguments()
         return sql
+    def _get_read_tables(query):
+        database = query._database
+        tables = database._read_tables_cache.get(query._key)
+        if tables is None:
+            sql_ast, attr_offsets = query._translator.construct_sql_ast()
+            tables = database._read_tables_cache[query._key] = tuple(sorted(get_sql_ast_tables(sql_ast), key=repr))
+        return tables
+    def _get_result_cache_tables(query, cache, query_key):
+        if not query._result_cache or query_key is None: return None
+        if cache.all_tables_written: return None
+        tables = query._get_read_tables()
+        if not cache.written_tables.isdisjoint(tables): return None  # cached rows cannot see uncommitted changes
+        return tables
+    def _fetch_rows(query, cache, sql, arguments, query_key, fetch_rows):
+        database = query._database
+        tables = query._get_result_cache_tables(cache, query_key)
+        if tables is not None:
+            rows = database._get_cached_query_rows(query_key, tables)
+            if rows is not None:
+                database._count_cached_query(sql)
+                return rows
+            versions = database._get_table_versions(tables)
+        cursor = database._exec_sql(sql, arguments)
+        rows = fetch_rows(cursor)
+        # rows read inside a transaction may belong to a snapshot older than the current table versions
+        if tables is not None and not cache.in_transaction:
+            database._put_cached_query_rows(query_key, versions, query._result_cache_ttl, tuple(rows))
+        return rows
     def _fetch(query, range=None):
+        query = query._apply_auto_prefetch()
         translator = query._translator
         sql, arguments, attr_offsets, query_key = query._construct_sql_and_arguments(range)
         database = query._database
         cache = database._get_cache()
         if query._for_update: cache.immediate = True
         cache.prepare_connection_for_query_execution()  # may clear cache.query_results
-        try: result = cache.query_results[query_key]
+        results_key = query_key if query_key is None or not query._as_tuples else (query_key, 'as_tuples')
+        try: result = cache.query_results[results_key]
         except KeyError:
-            cursor = database._exec_sql(sql, arguments)
             if isinstance(translator.expr_type, EntityMeta):
                 entity = translator.expr_type
-                result = entity._fetch_objects(cursor, attr_offsets, for_update=query._for_update,
-                                               used_attrs=translator.get_used_attrs())
-            elif len(translator.row_layout) == 1:
-                func, slice_or_offset, src = translator.row_layout[0]
-                result = list(starmap(func, cursor.fetchall()))
+                rows = query._fetch_rows(cache, sql, arguments, query_key, entity._fetch_rows_)
+                if query._as_tuples: result = entity._tuples_from_rows_(rows, attr_offsets)
+                else:
+                    result = entity._objects_from_rows_(rows, attr_offsets, for_update=query._for_update,
+                                                        used_attrs=translator.get_used_attrs())
+                    query._register_result_objects(cache, sql, result)
             else:
-                result = [ tuple(func(sql_row[slice_or_offset])
-                                 for func, slice_or_offset, src in translator.row_layout)
-                           for sql_row in cursor.fetchall() ]
-                for i, t in enumerate(translator.expr_type):
-                    if isinstance(t, EntityMeta) and t._subclasses_: t._load_many_(row[i] for row in result)
-            if query_key is not None: cache.query_results[query_key] = result
-        else:
-            stats = database._dblocal.stats
-            stat = stats.get(sql)
-            if stat is not None: stat.cache_count += 1
-            else: stats[sql] = QueryStat(sql)
+                rows = query._fetch_rows(cache, sql, arguments, query_key, lambda cursor: cursor.fetchall())
+                result = query._convert_rows(rows)
+            if query_key is not None: cache.query_results[results_key] = result
+        else: database._count_cached_query(sql)
 
+        if query._as_tuples:
+            return QueryResult(result, query, tuple, list(result[0]._fields) if result else [])
         if query._prefetch: query._do_prefetch(result)
+        if cache.max_objects is not None: cache.enforce_max_objects(keep=query._get_result_objects(result))
         return QueryResult(result, query, translator.expr_type, translator.col_names)
+    def _get_result_objects(query, result):
+        expr_type = query._translator.expr_type
+        if isinstance(expr_type, EntityMeta): return result
+        if type(expr_type) is tuple: return [ item for row in result for item in row if isinstance(item, Entity) ]
+        return ()
+    def _convert_rows(query, rows):
+        translator = query._translator
+        if len(translator.row_layout) == 1:
+            func, slice_or_offset, src = translator.row_layout[0]
+            return list(starmap(func, rows))
+        result = [ tuple(func(sql_row[slice_or_offset])
+                         for func, slice_or_offset, src in translator.row_layout)
+                   for sql_row in rows ]
+        for i, t in enumerate(translator.expr_type):
+            if isinstance(t, EntityMeta) and t._subclasses_: t._load_many_(row[i] for row in result)
+        return result
+    @cut_traceback
+    def iter_chunks(query, size=1000, evict=False):
+        if not isinstance(size, int_types) or size < 1: throw(TypeError,
+            'Chunk size must be positive integer. Got: %r' % size)
+        return query._iter_chunks(size, evict)
+    @cut_traceback
+    def stream(query, chunk_size=1000, evict=False):
+        return query._stream(chunk_size, evict)
+    def _stream(query, chunk_size, evict):
+        for chunk in query.iter_chunks(chunk_size, evict):
+            for item in chunk: yield item
+    def _exec_streaming_sql(query, sql, arguments):
+        database = query._database
+        provider = database.provider
+        start_transaction = query._for_update or provider.server_side_cursor_requires_transaction
+        cursor = database._exec_sql(sql, arguments, start_transaction=start_transaction, server_side_cursor=True)
+        if provider.server_side_cursor_blocks_connection: database._get_cache().blocking_cursor = cursor
+        return cursor
+    def _close_streaming_cursor(query, cache, cursor):
+        if cache.blocking_cursor is cursor: cache.blocking_cursor = None
+        cursor.close()
+    def _fetch_streaming_rows(query, sql, arguments, size, load_rows):
+        database = query._database
+        cache = database._get_cache()
+        cursor = query._exec_streaming_sql(sql, arguments)
+        try:
+            if load_rows and database.provider.server_side_cursor_blocks_connection:
+                # rows are loaded by primary keys later, which is impossible while the cursor is open
+                pk_rows = cursor.fetchall()
+                query._close_streaming_cursor(cache, cursor)
+                for start in xrange(0, len(pk_rows), size): yield pk_rows[start:start+size]
+                return
+            while True:
+                rows = cursor.fetchmany(size)
+                if not rows: break
+                yield rows
+        finally: query._close_streaming_cursor(cache, cursor)
+    def _iter_chunks(query, size, evict):
+        database = query._database
+        if not database.provider.server_side_cursor_blocks_connection: query = query._apply_auto_prefetch()
+        elif query._prefetch: throw(TypeError,
+            'prefetch() cannot be combined with streaming on %s, because related objects cannot be '
+            'loaded while the server-side cursor is open' % database.provider.dialect)
+        translator = query._translator
+        expr_type = translator.expr_type
+        sql, arguments, attr_offsets, query_key = query._construct_sql_and_arguments()
+        load_rows = isinstance(expr_type, EntityMeta) and attr_offsets is None
+        row_batches = query._fetch_streaming_rows(sql, arguments, size, load_rows)
+        cache = database._get_cache()
+        used_attrs = translator.get_used_attrs() if isinstance(expr_type, EntityMeta) else ()
+        try:
+            for rows in row_batches:
+                if query._as_tuples:
+                    yield expr_type._tuples_from_rows_(rows, attr_offsets)
+                    continue
+                if isinstance(expr_type, EntityMeta):
+                    chunk = expr_type._objects_from_rows_(rows, attr_offsets, query._for_update, used_attrs)
+                    query._register_result_objects(cache, sql, chunk)
+                else: chunk = query._convert_rows(rows)
+                if query._prefetch: query._do_prefetch(chunk)
+                if evict or cache.max_objects is not None: objects = query._get_result_objects(chunk)
+                if not evict and cache.max_objects is not None: cache.enforce_max_objects(keep=objects)
+                yield chunk
+                if evict: cache._evict_objects(objects)
+        finally: row_batches.close()
     @cut_traceback
     def prefetch(query, *args):
+        attrs_to_prefetch_dict = defaultdict(set)
+        for entity, attrs in iteritems(query._attrs_to_prefetch_dict): attrs_to_prefetch_dict[entity] = attrs.copy()
         query = query._clone(_entities_to_prefetch=query._entities_to_prefetch.copy(),
-                             _attrs_to_prefetch_dict=query._attrs_to_prefetch_dict.copy())
+                             _attrs_to_prefetch_dict=attrs_to_prefetch_dict)
         query._prefetch = True
         for arg in args:
             if isinstance(arg, EntityMeta):
@@ -5405,68 +6842,89 @@ class Query(object):
                     'Entity of attribute %s belongs to different database and cannot be prefetched' % attr)
                 if isinstance(attr.py_type, EntityMeta) or attr.lazy:
                     query._attrs_to_prefetch_dict[entity].add(attr)
+            elif isinstance(arg, basestring):
+                entity = query._translator.expr_type
+                if not isinstance(entity, EntityMeta): throw(TypeError,
+                    'Attribute path %r can be prefetched only for queries which return entity objects' % arg)
+                attrnames = arg.split('.')
+                for i, attrname in enumerate(attrnames):
+                    attr = entity._adict_.get(attrname)
+                    if attr is None: throw(AttributeError,
+                        'Entity %s does not have attribute %s' % (entity.__name__, attrname))
+                    if isinstance(attr.py_type, EntityMeta) or attr.lazy:
+                        query._attrs_to_prefetch_dict[attr.entity].add(attr)
+                    if i == len(attrnames) - 1: break
+                    if not isinstance(attr.py_type, EntityMeta): throw(TypeError,
+                        'Attribute %s in prefetch path %r is not a relationship' % (attr, arg))
+                    entity = attr.py_type
             else: throw(TypeError, 'Argument of prefetch() query method must be entity class or attribute. '
                                    'Got: %r' % arg)
         return query
+    def _register_result_objects(query, cache, sql, objects):
+        origins = cache.object_origins
+        if origins is None: return
+        stats = query._database._nplus1_stats
+        stat = stats.get(query._key)
+        if stat is None: stat = stats.setdefault(query._key, NPlusOneStat(query._translator.expr_type, sql))
+        stat.executions += 1
+        stat.objects += len(objects)
+        for obj in objects: origins[obj] = stat
+    def _apply_auto_prefetch(query):
+        if not options.AUTO_PREFETCH: return query
+        stat = query._database._nplus1_stats.get(query._key)
+        if stat is None: return query
+        attrs = stat.get_prefetch_attrs()
+        if not attrs: return query
+        if query._prefetch and all(attr in query._attrs_to_prefetch_dict.get(attr.entity, ()) for attr in attrs):
+            return query
+        return query.prefetch(*attrs)
     def _do_prefetch(query, result):
         expr_type = query._translator.expr_type
-        object_list = []
-        object_set = set()
-        append_to_object_list = object_list.append
-        add_to_object_set = object_set.add
-
-        if isinstance(expr_type, EntityMeta):
-            for obj in result:
-                if obj not in object_set:
-                    add_to_object_set(obj)
-                    append_to_object_list(obj)
+        if isinstance(expr_type, EntityMeta): objects_to_process = list(result)
         elif type(expr_type) is tuple:
-            for i, t in enumerate(expr_type):
-                if not isinstance(t, EntityMeta): continue
-                for row in result:
-                    obj = row[i]
-                    if obj not in object_set:
-                        add_to_object_set(obj)
-                        append_to_object_list(obj)
+            objects_to_process = [ row[i] for i, t in enumerate(expr_type) if isinstance(t, EntityMeta)
+                                          for row in result ]
+        else: return
 
-        cache = query._database._get_cache()
         entities_to_prefetch = query._entities_to_prefetch
         attrs_to_prefetch_dict = query._attrs_to_prefetch_dict
         prefetching_attrs_cache = {}
-        for obj in object_list:
-            entity = obj.__class__
-            if obj in cache.seeds[entity._pk_attrs_]: obj._load_()
-
-            all_attrs_to_prefetch = prefetching_attrs_cache.get(entity)
-            if all_attrs_to_prefetch is None:
-                all_attrs_to_prefetch = []
-                append = all_attrs_to_prefetch.append
-                attrs_to_prefetch = attrs_to_prefetch_dict[entity]
-                for attr in obj._attrs_:
+        processed_objects = set()
+        while objects_to_process:
+            # each level of the object graph is loaded by one batched query per entity and attribute
+            objects_by_entity = OrderedDict()
+            for obj in objects_to_process:
+                if obj is None or obj in processed_objects: continue
+                processed_objects.add(obj)
+                objects_by_entity.setdefault(obj.__class__, []).append(obj)
+            objects_to_process = []
+            for entity, objects in iteritems(objects_by_entity):
+                entity._load_many_(objects)
+
+                all_attrs_to_prefetch = prefetching_attrs_cache.get(entity)
+                if all_attrs_to_prefetch is None:
+                    all_attrs_to_prefetch = []
+                    append = all_attrs_to_prefetch.append
+                    attrs_to_prefetch = attrs_to_prefetch_dict[entity]
+                    for attr in entity._attrs_:
+                        if attr.is_collection:
+                            if attr in attrs_to_prefetch: append(attr)
+                        elif attr.is_relation:
+                            if attr in attrs_to_prefetch or attr.py_type in entities_to_prefetch: append(attr)
+                        elif attr.lazy:
+                            if attr in attrs_to_prefetch: append(attr)
+                    prefetching_attrs_cache[entity] = all_attrs_to_prefetch
+
+                for attr in all_attrs_to_prefetch:
                     if attr.is_collection:
-                        if attr in attrs_to_prefetch: append(attr)
+                        if not isinstance(attr, Set): throw(NotImplementedError)
+                        attr.load_many(objects)
+                        for obj in objects: objects_to_process.extend(obj._vals_.get(attr, ()))
                     elif attr.is_relation:
-                        if attr in attrs_to_prefetch or attr.py_type in entities_to_prefetch: append(attr)
-                    elif attr.lazy:
-                        if attr in attrs_to_prefetch: append(attr)
-                prefetching_attrs_cache[entity] = all_attrs_to_prefetch
-
-            for attr in all_attrs_to_prefetch:
-                if attr.is_collection:
-                    if not isinstance(attr, Set): throw(NotImplementedError)
-                    setdata = obj._vals_.get(attr)
-                    if setdata is None or not setdata.is_fully_loaded: setdata = attr.load(obj)
-                    for obj2 in setdata:
-                        if obj2 not in object_set:
-                            add_to_object_set(obj2)
-                            append_to_object_list(obj2)
-                elif attr.is_relation:
-                    obj2 = attr.get(obj)
-                    if obj2 is not None and obj2 not in object_set:
-                        add_to_object_set(obj2)
-                        append_to_object_list(obj2)
-                elif attr.lazy: attr.get(obj)
-                else: assert False  # pragma: no cover
+                        if not attr.columns: attr.load_many(objects)
+                        objects_to_process.extend(attr.get(obj) for obj in objects)
+                    elif attr.lazy: attr.load_many(objects)
+                    else: assert False  # pragma: no cover
     @cut_traceback
     def show(query, width=None):
         query._fetch().show(width)
@@ -5508,6 +6966,9 @@ class Query(object):
             for obj in objects: obj._delete_()
             return len(objects)
         translator = query._translator
+        expr_type = translator.expr_type
+        if isinstance(expr_type, EntityMeta) and expr_type._second_level_cache_:
+            query._database._get_cache().second_level_cleared = True
         sql_key = HashableDict(query._key, sql_command='DELETE')
         database = query._database
         cache = database._get_cache()
@@ -5521,6 +6982,7 @@ class Query(object):
         cache.immediate = True
         cache.prepare_connection_for_query_execution()  # may clear cache.query_results
         cursor = database._exec_sql(sql, arguments)
+        cache.written_tables.add(expr_type._table_)
         return cursor.rowcount
     @cut_traceback
     def __len__(query):
@@ -5541,10 +7003,7 @@ class Query(object):
             tup = (('without_order',),)
             new_key = HashableDict(query._key, filters=query._key['filters'] + tup)
             new_filters = query._filters + tup
-            new_translator = query._database._translator_cache.get(new_key)
-            if new_translator is None:
-                new_translator = query._translator.without_order()
-                query._database._translator_cache[new_key] = new_translator
+            new_translator = query._database._get_translator(new_key, query._translator.without_order)
             return query._clone(_key=new_key, _filters=new_filters, _translator=new_translator)
 
         if isinstance(args[0], (basestring, types.FunctionType)):
@@ -5566,11 +7025,10 @@ class Query(object):
         tup = (('order_by_numbers' if numbers else 'order_by_attributes', args),)
         new_key = HashableDict(query._key, filters=query._key['filters'] + tup)
         new_filters = query._filters + tup
-        new_translator = query._database._translator_cache.get(new_key)
-        if new_translator is None:
-            if numbers: new_translator = query._translator.order_by_numbers(args)
-            else: new_translator = query._translator.order_by_attributes(args)
-            query._database._translator_cache[new_key] = new_translator
+        def build_translator():
+            if numbers: return query._translator.order_by_numbers(args)
+            return query._translator.order_by_attributes(args)
+        new_translator = query._database._get_translator(new_key, build_translator)
         return query._clone(_key=new_key, _filters=new_filters, _translator=new_translator)
     def _process_lambda(query, func, globals, locals, order_by=False, original_names=False):
         prev_translator = query._translator
@@ -5615,8 +7073,7 @@ class Query(object):
         tup = (('order_by' if order_by else 'where' if original_names else 'filter', extractors_key, vartypes),)
         new_key = HashableDict(query._key, filters=query._key['filters'] + tup)
         new_filters = query._filters + (('apply_lambda', filter_num, order_by, func_ast, argnames, original_names, extractors, vartypes),)
-        new_translator = query._database._translator_cache.get(new_key)
-        if new_translator is None:
+        def build_translator():
             prev_optimized = prev_translator.optimize
             new_translator = prev_translator.apply_lambda(filter_num, order_by, func_ast, argnames, original_names, extractors, vartypes)
             if not prev_optimized:
@@ -5625,12 +7082,13 @@ class Query(object):
                     tree_copy = unpickle_ast(prev_translator.pickled_tree)  # tree = deepcopy(tree)
                     prev_extractors = prev_translator.extractors
                     prev_vartypes = prev_translator.vartypes
-                    translator_cls = prev_translator.__class__
+                    translator_cls = query._database.provider.translator_cls
                     new_translator = translator_cls(tree_copy, prev_extractors, prev_vartypes,
                                                     left_join=True, optimize=name_path)
                     new_translator = query._reapply_filters(new_translator)
                     new_translator = new_translator.apply_lambda(filter_num, order_by, func_ast, argnames, original_names, extractors, vartypes)
-            query._database._translator_cache[new_key] = new_translator
+            return new_translator
+        new_translator = query._database._get_translator(new_key, build_translator)
         return query._clone(_vars=new_query_vars, _key=new_key, _filters=new_filters, _translator=new_translator)
     def _reapply_filters(query, translator):
         for tup in query._filters:
@@ -5653,6 +7111,16 @@ class Query(object):
             'Keyword arguments are not allowed: since query result type is not an entity, filter() method can accept only lambda')
         return query._apply_kwargs(kwargs)
     @cut_traceback
+    def filter_viewable(query, user=DEFAULT):
+        entity = query._translator.expr_type
+        if not isinstance(entity, EntityMeta): throw(TypeError,
+            'filter_viewable() method can be applied only to query which returns entity instances')
+        if user is DEFAULT: user = get_current_user()
+        row_rules = entity._get_view_rules_(get_user_groups(user))
+        if row_rules is None: return query
+        text, namespace = make_row_rules_condition(user, entity, row_rules)
+        return query._process_lambda(text, {}, namespace)
+    @cut_traceback
     def where(query, *args, **kwargs):
         if args:
             if isinstance(args[0], RawSQL):
@@ -5695,10 +7163,8 @@ class Query(object):
         tup = (('apply_kwfilters', filterattrs, original_names),)
         new_key = HashableDict(query._key, filters=query._key['filters'] + tup)
         new_filters = query._filters + tup
-        new_translator = query._database._translator_cache.get(new_key)
-        if new_translator is None:
-            new_translator = translator.apply_kwfilters(filterattrs, original_names)
-            query._database._translator_cache[new_key] = new_translator
+        new_translator = query._database._get_translator(
+            new_key, lambda: translator.apply_kwfilters(filterattrs, original_names))
         new_query = query._clone(_key=new_key, _filters=new_filters, _translator=new_translator,
                                  _next_kwarg_id=next_id, _vars=query._vars.copy())
         new_query._vars.update(value_dict)
@@ -5728,24 +7194,101 @@ class Query(object):
         start = (pagenum - 1) * pagesize
         stop = pagenum * pagesize
         return query[start:stop]
+    @cut_traceback
+    def get_page_key(query, obj):
+        entity = query._translator.expr_type
+        if not isinstance(obj, Entity) or not isinstance(obj, entity): throw(TypeError,
+            'Page key can be calculated for instance of %s entity only. Got: %r' % (entity.__name__, obj))
+        return query._get_page_key(obj, query._translator.get_seek_order())
+    def _get_page_key(query, obj, seek_order):
+        key = []
+        for column, attr, i, desc in seek_order:
+            key.append(attr.get_raw_values(attr.get(obj))[i])
+        return tuple(key)
+    @cut_traceback
+    def page_after(query, last=None, pagesize=10):
+        translator = query._translator
+        seek_order = translator.get_seek_order()
+        if last is None: key = None
+        elif isinstance(last, Entity):
+            if not isinstance(last, translator.expr_type): throw(TypeError,
+                'Expected instance of %s entity. Got: %r' % (translator.expr_type.__name__, last))
+            key = query._get_page_key(last, seek_order)
+        elif isinstance(last, tuple):
+            if len(last) != len(seek_order): throw(TypeError,
+                'Page key should be a tuple of %d values. Got: %r' % (len(seek_order), last))
+            key = last
+        else: throw(TypeError, 'Page key or instance of %s entity expected. Got: %r'
+                               % (translator.expr_type.__name__, last))
+        null_positions = ()
+        if key is not None:
+            null_positions = tuple(i for i, value in enumerate(key) if value is None)
+            for i in null_positions:
+                attr = seek_order[i][1]
+                if not attr.nullable: throw(ValueError,
+                    'Page key value for non-nullable attribute %s cannot be None. Got: %r' % (attr, key))
+        next_id = query._next_kwarg_id
+        if key is None: param_id = None
+        else:
+            param_id = next_id
+            next_id += 1
+        tup = (('apply_seek', param_id, null_positions),)
+        new_key = HashableDict(query._key, filters=query._key['filters'] + tup)
+        new_filters = query._filters + tup
+        new_translator = query._database._get_translator(new_key, lambda: translator.apply_seek(param_id, null_positions))
+        new_query = query._clone(_key=new_key, _filters=new_filters, _translator=new_translator,
+                                 _next_kwarg_id=next_id, _vars=query._vars.copy())
+        if key is not None: new_query._vars[param_id] = key
+        return new_query[:pagesize]
     def _aggregate(query, aggr_func_name):
         translator = query._translator
         sql, arguments, attr_offsets, query_key = query._construct_sql_and_arguments(aggr_func_name=aggr_func_name)
         cache = query._database._get_cache()
+        cache.prepare_connection_for_query_execution()  # may clear cache.query_results
         try: result = cache.query_results[query_key]
         except KeyError:
-            cursor = query._database._exec_sql(sql, arguments)
-            row = cursor.fetchone()
-            if row is not None: result = row[0]
+            rows = query._fetch_rows(cache, sql, arguments, query_key, lambda cursor: cursor.fetchmany(1))
+            if rows: result = rows[0][0]
             else: result = None
-            if result is None and aggr_func_name == 'SUM': result = 0
-            if result is None: pass
-            elif aggr_func_name == 'COUNT': pass
-            else:
-                expr_type = float if aggr_func_name == 'AVG' else translator.expr_type
-                provider = query._database.provider
-                converter = provider.get_converter_by_py_type(expr_type)
-                result = converter.sql2py(result)
+            result = query._convert_aggregate_value(aggr_func_name, translator.expr_type, result)
+            if query_key is not None: cache.query_results[query_key] = result
+        return result
+    def _convert_aggregate_value(query, aggr_func_name, expr_type, value):
+        if value is None and aggr_func_name == 'SUM': value = 0
+        if value is None: return None
+        if aggr_func_name == 'COUNT': return value
+        if aggr_func_name == 'AVG': expr_type = float
+        converter = query._database.provider.get_converter_by_py_type(expr_type)
+        return converter.sql2py(value)
+    @cut_traceback
+    def aggregate(query, **kwargs):
+        if not kwargs: throw(TypeError, 'aggregate() method requires at least one keyword argument')
+        translator = query._translator
+        names = sorted(kwargs)
+        aggregates = []
+        for name in names:
+            spec = kwargs[name]
+            if isinstance(spec, tuple) and len(spec) == 2: func, pos = spec
+            else: func, pos = spec, None
+            func_name = func if isinstance(func, basestring) else getattr(func, '__name__', None)
+            if not isinstance(func_name, basestring) or func_name.lower() not in aggregate_func_names: throw(TypeError,
+                'Aggregate function should be one of count, sum, avg, min or max. Got: %s=%r' % (name, spec))
+            if pos is not None and (not isinstance(pos, int_types) or isinstance(pos, bool)): throw(TypeError,
+                'Element number should be integer. Got: %s=%r' % (name, spec))
+            aggregates.append((func_name.upper(), pos))
+        aggregates = tuple(aggregates)
+        sql, arguments, attr_offsets, query_key = query._construct_sql_and_arguments(aggr_func_name=aggregates)
+        cache = query._database._get_cache()
+        cache.prepare_connection_for_query_execution()  # may clear cache.query_results
+        try: result = cache.query_results[query_key]
+        except KeyError:
+            rows = query._fetch_rows(cache, sql, arguments, query_key, lambda cursor: cursor.fetchmany(1))
+            row = rows[0] if rows else (None,) * len(aggregates)
+            values = []
+            for (aggr_func_name, pos), value in izip(aggregates, row):
+                target_type, offset = translator.get_aggregate_target(aggr_func_name, pos)
+                values.append(query._convert_aggregate_value(aggr_func_name, target_type, value))
+            result = get_aggregate_result_class(tuple(names))(*values)
             if query_key is not None: cache.query_results[query_key] = result
         return result
     @cut_traceback
@@ -5764,7 +7307,89 @@ class Query(object):
     def count(query):
         return query._aggregate('COUNT')
     @cut_traceback
+    def as_tuples(query):
+        if not isinstance(query._translator.expr_type, EntityMeta): throw(TypeError,
+            'as_tuples() method can be applied only to queries which return entity objects')
+        return query._clone(_as_tuples=True)
+    @cut_traceback
+    def to_columns(query, batch_size=1000):
+        if not isinstance(batch_size, int_types) or batch_size < 1: throw(TypeError,
+            'Batch size must be positive integer. Got: %r' % batch_size)
+        layout, batches = query._get_column_batches(batch_size)
+        result = OrderedDict((name, []) for name, py_type, decode in layout)
+        for batch in batches:
+            for name, values in iteritems(batch): result[name].extend(values)
+        return result
+    @cut_traceback
+    def to_arrays(query, batch_size=1000):
+        from pony.orm.columnar import columns_to_arrays
+        if not isinstance(batch_size, int_types) or batch_size < 1: throw(TypeError,
+            'Batch size must be positive integer. Got: %r' % batch_size)
+        layout, batches = query._get_column_batches(batch_size)
+        column_types = OrderedDict((name, py_type) for name, py_type, decode in layout)
+        return columns_to_arrays(column_types, batches)
+    def _get_column_batches(query, batch_size):
+        expr_type = query._translator.expr_type
+        sql, arguments, attr_offsets, query_key = query._construct_sql_and_arguments()
+        load_rows = isinstance(expr_type, EntityMeta) and attr_offsets is None
+        if load_rows: attr_offsets = expr_type._construct_batchload_sql_(1, from_seeds=False)[2]
+        layout = query._get_column_layout(attr_offsets)
+        return layout, query._iter_column_batches(sql, arguments, layout, load_rows, batch_size)
+    def _get_column_layout(query, attr_offsets):
+        translator = query._translator
+        expr_type = translator.expr_type
+        layout = []
+        if isinstance(expr_type, EntityMeta):
+            for attr in expr_type._attrs_:
+                if attr.is_collection: continue
+                offsets = attr_offsets.get(attr)
+                if offsets is None: continue
+                converters = attr.converters
+                if attr.reverse:
+                    py_type = tuple if len(offsets) > 1 else converters[0].py_type
+                    decode = make_column_decoder(offsets, converters)
+                elif converters and converters[0] is not None and attr.py_check is None:
+                    decode = make_column_decoder(offsets, converters, dbval2val=get_dbval2val(converters[0]))
+                    py_type = attr.py_type
+                else:
+                    validate = lambda value, attr=attr: attr.validate(value, None, attr.entity, from_db=True)
+                    dbval2val = get_dbval2val(converters[0] if converters else None)
+                    decode = make_column_decoder(offsets, converters, validate, dbval2val)
+                    py_type = attr.py_type
+                layout.append((attr.name, py_type, decode))
+            return layout
+        types = expr_type if type(expr_type) is tuple else (expr_type,)
+        names = set()
+        for i, (t, (func, slice_or_offset, src)) in enumerate(izip(types, translator.row_layout)):
+            if isinstance(t, EntityMeta):
+                offsets = list(xrange(slice_or_offset.start, slice_or_offset.stop))
+                py_type = tuple if len(offsets) > 1 else t._pk_converters_[0].py_type
+                decode = make_column_decoder(offsets, t._pk_converters_)
+            else:
+                py_type = t
+                decode = lambda columns, func=func, offset=slice_or_offset: [ func(value) for value in columns[offset] ]
+            name = src if src not in names else '%s_%d' % (src, i)
+            names.add(name)
+            layout.append((name, py_type, decode))
+        return layout
+    def _iter_column_batches(query, sql, arguments, layout, load_rows, batch_size):
+        row_batches = query._fetch_streaming_rows(sql, arguments, batch_size, load_rows)
+        try:
+            for rows in row_batches:
+                if load_rows: rows = query._translator.expr_type._load_rows_by_raw_pkvals_(rows)[0]
+                if not rows: continue
+                columns = list(izip(*rows))
+                yield OrderedDict((name, decode(columns)) for name, py_type, decode in layout)
+        finally: row_batches.close()
+    @cut_traceback
+    def cache(query, ttl=None):
+        if query._for_update: throw(TypeError, 'Query with for_update() option cannot be cached')
+        if ttl is not None and (not isinstance(ttl, int_types + (float,)) or isinstance(ttl, bool) or ttl <= 0):
+            throw(TypeError, 'Cache ttl must be positive number of seconds. Got: %r' % ttl)
+        return query._clone(_result_cache=True, _result_cache_ttl=ttl)
+    @cut_traceback
     def for_update(query, nowait=False):
+        if query._result_cache: throw(TypeError, 'Query with for_update() option cannot be cached')
         provider = query._database.provider
         if nowait and not provider.select_for_update_nowait_syntax: throw(TranslationError,
             '%s provider does not support SELECT FOR UPDATE NOWAIT syntax' % provider.dialect)
@@ -5774,6 +7399,89 @@ class Query(object):
     def to_json(query, include=(), exclude=(), converter=None, with_schema=True, schema_hash=None):
         return query._database.to_json(query[:], include, exclude, converter, with_schema, schema_hash)
 
+def normalize_var(value):
+    try: return value, get_normalized_type_of(value)
+    except TypeError:
+        if isinstance(value, dict): raise
+        value = tuple(value)
+        return value, get_normalized_type_of(value)
+
+class PreparedQuery(object):
+    def __init__(prepared, database, func):
+        if type(func) is not types.FunctionType: throw(TypeError,
+            'Function or lambda expected. Got: %r' % func)
+        codeobject = func.func_code if PY2 else func.__code__
+        prepared._database = database
+        prepared._func = func
+        prepared._globals = func.func_globals if PY2 else func.__globals__
+        prepared._argnames = codeobject.co_varnames[:codeobject.co_argcount]
+        prepared._freevars = codeobject.co_freevars
+        defaults = (func.func_defaults if PY2 else func.__defaults__) or ()
+        prepared._defaults = dict(izip(prepared._argnames[len(prepared._argnames)-len(defaults):], defaults))
+        prepared._query = None
+        prepared._extractors = None
+        prepared._vartypes = None
+    def _get_locals(prepared, args, kwargs):
+        argnames = prepared._argnames
+        if len(args) > len(argnames): throw(TypeError, 'Prepared query accepts at most %d positional argument%s (%d given)'
+                                            % (len(argnames), len(argnames) != 1 and 's' or '', len(args)))
+        locals = prepared._defaults.copy()
+        func = prepared._func
+        closure = func.func_closure if PY2 else func.__closure__
+        if closure: locals.update(izip(prepared._freevars, (cell.cell_contents for cell in closure)))
+        locals.update(izip(argnames, args))
+        for name, value in iteritems(kwargs):
+            if name not in argnames: throw(TypeError, 'Unexpected keyword argument %r' % name)
+            locals[name] = value
+        for name in argnames:
+            if name not in locals: throw(TypeError, 'Missing value for argument %r' % name)
+        return locals
+    def _prepare(prepared, locals):
+        query = prepared._func(**{name: locals[name] for name in prepared._argnames})
+        if not isinstance(query, Query): throw(TypeError,
+            'Prepared query function must return Query object. Got: %r' % query)
+        if query._database is not prepared._database: throw(TypeError,
+            'Query %r does not belong to database %r' % (query, prepared._database))
+        prepared._query = query
+        prepared._extractors = prepared._vartypes = None
+        extractors = []
+        vartypes = {}
+        globals = prepared._globals
+        for key, value in iteritems(query._vars):
+            if type(key) is not tuple: return query  # keyword filters cannot be rebound
+            filter_num, src = key
+            if src == '.0': continue
+            code = compile(src, src, 'eval')
+            try: new_value, vartype = normalize_var(eval(code, globals, locals))
+            except Exception: return query  # the query is constructed not inside the prepared function
+            if new_value is not value and new_value != value: return query
+            extractors.append((key, code))
+            vartypes[key] = vartype
+        prepared._extractors = extractors
+        prepared._vartypes = vartypes
+        return query
+    def _bind(prepared, locals):
+        query = prepared._query
+        extractors = prepared._extractors
+        if query is None or extractors is None: return prepared._prepare(locals)
+        globals = prepared._globals
+        vars = query._vars.copy()
+        vartypes = {}
+        try:
+            for key, code in extractors:
+                vars[key], vartypes[key] = normalize_var(eval(code, globals, locals))
+        except Exception: return prepared._prepare(locals)
+        query._database.provider.normalize_vars(vars, vartypes)
+        if vartypes != prepared._vartypes: return prepared._prepare(locals)
+        return query._clone(_vars=vars)
+    @cut_traceback
+    def __call__(prepared, *args, **kwargs):
+        query = prepared._bind(prepared._get_locals(args, kwargs))
+        return query._fetch()
+    @cut_traceback
+    def get_query(prepared, *args, **kwargs):
+        return prepared._bind(prepared._get_locals(args, kwargs))
+
 def strcut(s, width):
     if len(s) <= width:
         return s + ' ' * (width - len(s))
@@ -2,12 +2,15 @@ from __future__ import absolute_import, print_function, division
 from pony.py23compat import PY2, basestring, unicode, buffer, int_types
 
 import os, re, json
+from time import time as current_time
+from threading import Condition, Lock
 from decimal import Decimal, InvalidOperation
 from datetime import datetime, date, time, timedelta
 from uuid import uuid4, UUID
 
 import pony
-from pony.utils import is_utf8, decorator, throw, localbase, deprecated
+from pony import options
+from pony.utils import is_utf8, decorator, throw, localbase, deprecated, LRUCache
 from pony.converting import str2date, str2time, str2datetime, str2timedelta
 from pony.orm.ormtypes import LongStr, LongUnicode, RawSQLType, TrackedValue, Json
 
@@ -86,12 +89,17 @@ class DBAPIProvider(object):
     paramstyle = 'qmark'
     quote_char = '"'
     max_params_count = 200
+    max_update_batch_size = 100  # rows of executemany() UPDATE which are rechecked one by one on failure
+    release_savepoint_syntax = True
     max_name_len = 128
     table_if_not_exists_syntax = True
     index_if_not_exists_syntax = True
     max_time_precision = default_time_precision = 6
     uint64_support = False
     select_for_update_nowait_syntax = True
+    server_side_cursor_requires_transaction = False
+    server_side_cursor_blocks_connection = False  # no other commands can run until the cursor is read or closed
+    bulk_id_allocation = False  # ids for bulk inserts can be taken in advance, see get_next_ids_sql()
 
     # SQLite and PostgreSQL does not limit varchar max length.
     varchar_default_max_len = None
@@ -101,6 +109,7 @@ class DBAPIProvider(object):
     dbschema_cls = None
     translator_cls = None
     sqlbuilder_cls = None
+    json_codec = json  # any object with json-compatible dumps() and loads(), see Database.set_json_codec()
 
     name_before_table = 'schema_name'
     default_schema_name = None
@@ -109,8 +118,11 @@ class DBAPIProvider(object):
 
     def __init__(provider, *args, **kwargs):
         pool_mockup = kwargs.pop('pony_pool_mockup', None)
+        pool_options = { name[5:]: kwargs.pop(name) for name in pool_option_names if name in kwargs }
         if pool_mockup: provider.pool = pool_mockup
-        else: provider.pool = provider.get_pool(*args, **kwargs)
+        else:
+            provider.pool = provider.get_pool(*args, **kwargs)
+            if pool_options: provider.pool.configure(**pool_options)
         connection = provider.connect()
         provider.inspect_connection(connection)
         provider.release(connection)
@@ -208,6 +220,12 @@ class DBAPIProvider(object):
     def connect(provider):
         return provider.pool.connect()
 
+    def server_side_cursor(provider, connection):
+        return connection.cursor()
+
+    def get_next_ids_sql(provider, table_name, column_name, count):
+        throw(NotImplementedError)
+
     @wrap_dbapi_exceptions
     def set_transaction_mode(provider, connection, cache):
         pass
@@ -305,41 +323,178 @@ class DBAPIProvider(object):
         sql = 'DROP TABLE %s' % provider.quote_name(table_name)
         cursor.execute(sql)
 
-class Pool(localbase):
+pool_option_names = 'pool_min_size', 'pool_max_size', 'pool_timeout', \
+                    'pool_max_idle_time', 'pool_max_lifetime', 'pool_pre_ping'
+
+class PoolTimeoutError(OperationalError): pass
+
+class PoolLocal(localbase):
+    def __init__(local):
+        local.con = local.pid = None
+
+class Pool(object):
     forked_connections = []
-    def __init__(pool, dbapi_module, *args, **kwargs): # called separately in each thread
+    def __init__(pool, dbapi_module, *args, **kwargs):
         pool.dbapi_module = dbapi_module
         pool.args = args
         pool.kwargs = kwargs
-        pool.con = pool.pid = None
+        pool.local = PoolLocal()  # connection of each thread when the pool is not shared
+        pool.shared = False
+        pool.lock = Condition(Lock())
+        pool.pid = os.getpid()
+        pool.connections = {}  # shared connection -> creation time
+        pool.idle = []  # (shared connection, release time), the most recently released is the last
+        pool.pending = pool.waiting = pool.created = pool.dropped = 0
+    def configure(pool, min_size=0, max_size=None, timeout=None,
+                  max_idle_time=None, max_lifetime=None, pre_ping=False):
+        if max_size is not None and max_size < 1: throw(ValueError,
+            'Pool max_size must be positive integer or None. Got: %r' % max_size)
+        if min_size < 0 or max_size is not None and min_size > max_size: throw(ValueError,
+            'Pool min_size must be between 0 and max_size. Got: %r' % min_size)
+        pool.shared = True
+        pool.min_size = min_size
+        pool.max_size = max_size
+        pool.timeout = timeout
+        pool.max_idle_time = max_idle_time
+        pool.max_lifetime = max_lifetime
+        pool.pre_ping = pre_ping
+    @property
+    def stats(pool):
+        with pool.lock:
+            size = len(pool.connections)
+            idle = len(pool.idle)
+            return dict(size=size, idle=idle, checked_out=size - idle, waiting=pool.waiting,
+                        created=pool.created, dropped=pool.dropped)
     def connect(pool):
+        if pool.shared: return pool._connect_shared()
         pid = os.getpid()
-        if pool.con is not None and pool.pid != pid:
-            pool.forked_connections.append((pool.con, pool.pid))
-            pool.con = pool.pid = None
+        local = pool.local
+        if local.con is not None and local.pid != pid:
+            pool.forked_connections.append((local.con, local.pid))
+            local.con = local.pid = None
         core = pony.orm.core
-        if pool.con is None:
+        if local.con is None:
             if core.local.debug: core.log_orm('GET NEW CONNECTION')
-            pool._connect()
-            pool.pid = pid
+            local.con = pool._new_connection()
+            local.pid = pid
+            with pool.lock: pool.created += 1
         elif core.local.debug: core.log_orm('GET CONNECTION FROM THE LOCAL POOL')
-        return pool.con
-    def _connect(pool):
-        pool.con = pool.dbapi_module.connect(*pool.args, **pool.kwargs)
+        return local.con
+    def _connect_shared(pool):
+        core = pony.orm.core
+        deadline = None if pool.timeout is None else current_time() + pool.timeout
+        while True:
+            con = None
+            with pool.lock:
+                pool._check_pid()
+                while True:
+                    if pool.idle:
+                        con, released_at = pool.idle.pop()
+                        break
+                    if pool.max_size is None or len(pool.connections) + pool.pending < pool.max_size:
+                        pool.pending += 1
+                        break
+                    remaining = None if deadline is None else deadline - current_time()
+                    if remaining is not None and remaining <= 0: throw(PoolTimeoutError, None,
+                        'Cannot get connection from the pool in %s seconds: all %d connections are in use'
+                        % (pool.timeout, pool.max_size))
+                    pool.waiting += 1
+                    try: pool.lock.wait(remaining)
+                    finally: pool.waiting -= 1
+            if con is None:
+                if core.local.debug: core.log_orm('GET NEW CONNECTION')
+                try: con = pool._new_connection()
+                except:
+                    with pool.lock:
+                        pool.pending -= 1
+                        pool.lock.notify()
+                    raise
+                with pool.lock:
+                    pool.pending -= 1
+                    pool.connections[con] = current_time()
+                    pool.created += 1
+                return con
+            if pool._is_expired(con, current_time()) or pool.pre_ping and not pool._ping(con):
+                pool._close(con)
+                continue
+            if core.local.debug: core.log_orm('GET CONNECTION FROM THE SHARED POOL')
+            return con
+    def _check_pid(pool):
+        pid = os.getpid()
+        if pool.pid == pid: return
+        # connections of the parent process cannot be used or closed in the child process
+        pool.forked_connections.extend((con, pool.pid) for con in pool.connections)
+        pool.connections = {}
+        pool.idle = []
+        pool.pending = 0
+        pool.pid = pid
+    def _is_expired(pool, con, now):
+        created_at = pool.connections.get(con)
+        if created_at is None: return True
+        return pool.max_lifetime is not None and now - created_at > pool.max_lifetime
+    def _ping(pool, con):
+        try:
+            cursor = con.cursor()
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+            con.rollback()
+        except Exception: return False
+        return True
+    def _new_connection(pool):
+        return pool.dbapi_module.connect(*pool.args, **pool.kwargs)
+    def _reset_connection(pool, con):
+        con.rollback()
     def release(pool, con):
-        assert con is pool.con
-        try: con.rollback()
+        if not pool.shared: assert con is pool.local.con
+        try: pool._reset_connection(con)
         except:
             pool.drop(con)
             raise
+        if not pool.shared: return
+        now = current_time()
+        with pool.lock:
+            if pool.pid != os.getpid(): return
+            if pool._is_expired(con, now): to_close = [ con ]
+            else:
+                pool.idle.append((con, now))
+                to_close = pool._pop_idle_connections(now)
+            pool.lock.notify()
+        for con in to_close: pool._close(con)
+    def _pop_idle_connections(pool, now):
+        result = []
+        max_idle_time = pool.max_idle_time
+        if max_idle_time is None: return result
+        idle = pool.idle
+        while idle and len(pool.connections) - len(result) > pool.min_size and now - idle[0][1] > max_idle_time:
+            result.append(idle.pop(0)[0])
+        return result
+    def _close(pool, con):
+        with pool.lock:
+            if pool.connections.pop(con, None) is None: return
+            pool.dropped += 1
+            pool.lock.notify()
+        try: con.close()
+        except Exception: pass
     def drop(pool, con):
-        assert con is pool.con, (con, pool.con)
-        pool.con = None
+        if pool.shared:
+            pool._close(con)
+            return
+        assert con is pool.local.con, (con, pool.local.con)
+        pool.local.con = None
+        with pool.lock: pool.dropped += 1
         con.close()
     def disconnect(pool):
-        con = pool.con
-        pool.con = None
-        if con is not None: con.close()
+        if pool.shared:
+            with pool.lock:
+                to_close = [ con for con, released_at in pool.idle ]
+                pool.idle = []
+            for con in to_close: pool._close(con)
+            return
+        con = pool.local.con
+        pool.local.con = None
+        if con is not None:
+            with pool.lock: pool.dropped += 1
+            con.close()
 
 class Converter(object):
     EQ = 'EQ'
@@ -759,13 +914,15 @@ class UuidConverter(Converter):
     def sql_type(converter):
         return "UUID"
 
+def json_default(obj):
+    if isinstance(obj, Json): return obj.wrapped
+    raise TypeError('%r is not JSON serializable' % obj)
+
 class JsonConverter(Converter):
     json_kwargs = {}
-    class JsonEncoder(json.JSONEncoder):
-        def default(converter, obj):
-            if isinstance(obj, Json):
-                return obj.wrapped
-            return json.JSONEncoder.default(converter, obj)
+    def __init__(converter, provider, py_type, attr=None):
+        Converter.__init__(converter, provider, py_type, attr)
+        converter.canonical_cache = LRUCache(options.JSON_CANONICAL_CACHE_SIZE)
     def validate(converter, val, obj=None):
         if obj is None or converter.attr is None:
             return val
@@ -773,18 +930,25 @@ class JsonConverter(Converter):
             return val
         return TrackedValue.make(obj, converter.attr, val)
     def val2dbval(converter, val, obj=None):
-        return json.dumps(val, cls=converter.JsonEncoder, **converter.json_kwargs)
+        return converter.provider.json_codec.dumps(val, default=json_default, **converter.json_kwargs)
     def dbval2val(converter, dbval, obj=None):
         if isinstance(dbval, (int, bool, float, type(None))):
             return dbval
-        val = json.loads(dbval)
+        val = converter.provider.json_codec.loads(dbval)
         if obj is None:
             return val
         return TrackedValue.make(obj, converter.attr, val)
     def dbvals_equal(converter, x, y):
         if x == y: return True  # optimization
-        if isinstance(x, basestring): x = json.loads(x)
-        if isinstance(y, basestring): y = json.loads(y)
+        if isinstance(x, basestring): x = converter.get_canonical_form(x)
+        if isinstance(y, basestring): y = converter.get_canonical_form(y)
         return x == y
+    def get_canonical_form(converter, dbval):
+        # parsed values are used only for comparison and never leave the cache
+        cache = converter.canonical_cache
+        try: return cache[dbval]
+        except KeyError: pass
+        val = cache[dbval] = converter.provider.json_codec.loads(dbval)
+        return val
     def sql_type(converter):
         return "JSON"
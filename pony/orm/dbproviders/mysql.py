@@ -15,6 +15,7 @@ try:
     import MySQLdb as mysql_module
     from MySQLdb import string_literal
     import MySQLdb.converters as mysql_converters
+    import MySQLdb.cursors as mysql_cursors
     from MySQLdb.constants import FIELD_TYPE, FLAG, CLIENT
     mysql_module_name = 'MySQLdb'
 except ImportError:
@@ -24,6 +25,7 @@ except ImportError:
         raise ImportError('In order to use PonyORM with MySQL please install MySQLdb or pymysql')
     from pymysql.converters import escape_str as string_literal
     import pymysql.converters as mysql_converters
+    import pymysql.cursors as mysql_cursors
     from pymysql.constants import FIELD_TYPE, FLAG, CLIENT
     mysql_module_name = 'pymysql'
 
@@ -174,6 +176,12 @@ class MySQLJsonConverter(dbapiprovider.JsonConverter):
             version = '.'.join(imap(str, self.provider.server_version))
             raise NotImplementedError("MySQL %s has no JSON support" % version)
 
+class MySQLPool(Pool):
+    def _ping(pool, con):
+        try: con.ping(False)  # both MySQLdb and PyMySQL accept the reconnect flag
+        except Exception: return False
+        return True
+
 class MySQLProvider(DBAPIProvider):
     dialect = 'MySQL'
     paramstyle = 'format'
@@ -185,6 +193,7 @@ class MySQLProvider(DBAPIProvider):
     max_time_precision = default_time_precision = 0
     varchar_default_max_len = 255
     uint64_support = True
+    server_side_cursor_blocks_connection = True  # SSCursor results are unbuffered
 
     dbapi_module = mysql_module
     dbschema_cls = MySQLSchema
@@ -250,7 +259,10 @@ class MySQLProvider(DBAPIProvider):
         if 'charset' not in kwargs:
             kwargs['charset'] = 'utf8'
         kwargs['client_flag'] = kwargs.get('client_flag', 0) | CLIENT.FOUND_ROWS
-        return Pool(mysql_module, *args, **kwargs)
+        return MySQLPool(mysql_module, *args, **kwargs)
+
+    def server_side_cursor(provider, connection):
+        return connection.cursor(mysql_cursors.SSCursor)
 
     @wrap_dbapi_exceptions
     def set_transaction_mode(provider, connection, cache):
@@ -119,6 +119,7 @@ class OraConstMonad(sqltranslation.ConstMonad):
 class OraTranslator(sqltranslation.SQLTranslator):
     dialect = 'Oracle'
     rowid_support = True
+    nulls_sort_first = False
     json_path_wildcard_syntax = True
     json_values_are_comparable = False
     NoneMonad = OraNoneMonad
@@ -387,6 +388,7 @@ class OraProvider(DBAPIProvider):
     index_if_not_exists_syntax = False
     varchar_default_max_len = 1000
     uint64_support = True
+    release_savepoint_syntax = False
 
     dbapi_module = cx_Oracle
     dbschema_cls = OraSchema
@@ -566,6 +568,13 @@ class OraPool(object):
         pool.kwargs = kwargs
         pool.cx_pool = cx_Oracle.SessionPool(**kwargs)
         pool.pid = os.getpid()
+    def configure(pool, **options):
+        throw(TypeError, 'Oracle provider always uses cx_Oracle.SessionPool, '
+                         'its size can be specified with min, max and increment options')
+    @property
+    def stats(pool):
+        cx_pool = pool.cx_pool
+        return dict(size=cx_pool.opened, checked_out=cx_pool.busy)
     def connect(pool):
         pid = os.getpid()
         if pool.pid != pid:
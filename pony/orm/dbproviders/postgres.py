@@ -2,6 +2,7 @@ from __future__ import absolute_import
 from pony.py23compat import PY2, basestring, unicode, buffer, int_types
 
 from decimal import Decimal
+from itertools import count
 from datetime import datetime, date, time, timedelta
 from uuid import UUID
 
@@ -42,6 +43,7 @@ class PGSchema(dbschema.DBSchema):
 
 class PGTranslator(SQLTranslator):
     dialect = 'PostgreSQL'
+    nulls_sort_first = False
 
 class PGValue(Value):
     __slots__ = []
@@ -146,28 +148,28 @@ class PGJsonConverter(dbapiprovider.JsonConverter):
     def sql_type(self):
         return "JSONB"
 
+cursor_counter = count(1)
+
 class PGPool(Pool):
-    def _connect(pool):
-        pool.con = pool.dbapi_module.connect(*pool.args, **pool.kwargs)
+    def _new_connection(pool):
+        con = pool.dbapi_module.connect(*pool.args, **pool.kwargs)
         if 'client_encoding' not in pool.kwargs:
-            pool.con.set_client_encoding('UTF8')
-    def release(pool, con):
-        assert con is pool.con
-        try:
-            con.rollback()
-            con.autocommit = True
-            cursor = con.cursor()
-            cursor.execute('DISCARD ALL')
-            con.autocommit = False
-        except:
-            pool.drop(con)
-            raise
+            con.set_client_encoding('UTF8')
+        return con
+    def _reset_connection(pool, con):
+        con.rollback()
+        con.autocommit = True
+        cursor = con.cursor()
+        cursor.execute('DISCARD ALL')
+        con.autocommit = False
 
 class PGProvider(DBAPIProvider):
     dialect = 'PostgreSQL'
     paramstyle = 'pyformat'
     max_name_len = 63
     index_if_not_exists_syntax = False
+    server_side_cursor_requires_transaction = True  # named cursors cannot be used in autocommit mode
+    bulk_id_allocation = True
 
     dbapi_module = psycopg2
     dbschema_cls = PGSchema
@@ -192,6 +194,14 @@ class PGProvider(DBAPIProvider):
     def get_pool(provider, *args, **kwargs):
         return PGPool(provider.dbapi_module, *args, **kwargs)
 
+    def server_side_cursor(provider, connection):
+        return connection.cursor(name='pony_cursor_%d' % next(cursor_counter))
+
+    def get_next_ids_sql(provider, table_name, column_name, count):
+        # returns NULLs if the column has no sequence
+        sql = 'SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)'
+        return sql, (provider.quote_name(table_name), column_name, count)
+
     @wrap_dbapi_exceptions
     def set_transaction_mode(provider, connection, cache):
         assert not cache.in_transaction
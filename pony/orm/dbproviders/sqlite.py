@@ -517,16 +517,20 @@ def py_json_array_length(expr, path=None):
     return len(expr) if type(expr) is list else 0
 
 class SQLitePool(Pool):
-    def __init__(pool, filename, create_db, **kwargs): # called separately in each thread
+    def __init__(pool, filename, create_db, **kwargs):
+        Pool.__init__(pool, sqlite, **kwargs)
         pool.filename = filename
         pool.create_db = create_db
-        pool.kwargs = kwargs
-        pool.con = None
-    def _connect(pool):
+    def configure(pool, **options):
+        if pool.filename == ':memory:': throw(TypeError,
+            'Connection pool options cannot be used with in-memory SQLite database')
+        pool.kwargs.setdefault('check_same_thread', False)
+        Pool.configure(pool, **options)
+    def _new_connection(pool):
         filename = pool.filename
         if filename != ':memory:' and not pool.create_db and not os.path.exists(filename):
             throw(IOError, "Database file is not found: %r" % filename)
-        pool.con = con = sqlite.connect(filename, isolation_level=None, **pool.kwargs)
+        con = sqlite.connect(filename, isolation_level=None, **pool.kwargs)
         con.text_factory = _text_factory
 
         def create_function(name, num_params, func):
@@ -545,6 +549,7 @@ class SQLitePool(Pool):
 
         if sqlite.sqlite_version_info >= (3, 6, 19):
             con.execute('PRAGMA foreign_keys = true')
+        return con
     def disconnect(pool):
         if pool.filename != ':memory:':
             Pool.disconnect(pool)
@@ -7,12 +7,13 @@ from opcode import hasconst, hasname, hasjrel, haslocal, hascompare, hasfree
 
 from pony.thirdparty.compiler import ast, parse
 
-from pony.utils import throw, get_codeobject_id
+from pony import options
+from pony.utils import throw, get_codeobject_id, LRUCache
 
 ##ast.And.__repr__ = lambda self: "And(%s: %s)" % (getattr(self, 'endpos', '?'), repr(self.nodes),)
 ##ast.Or.__repr__ = lambda self: "Or(%s: %s)" % (getattr(self, 'endpos', '?'), repr(self.nodes),)
 
-ast_cache = {}
+ast_cache = LRUCache(options.AST_CACHE_SIZE)
 
 def decompile(x):
     cells = {}
@@ -0,0 +1,111 @@
+from __future__ import absolute_import, print_function, division
+from pony.py23compat import iteritems, pickle
+
+from threading import Lock
+from time import time
+
+from pony.utils import LRUCache
+
+class CacheBackend(object):
+    def get(backend, key):
+        raise NotImplementedError
+    def set(backend, key, value, ttl=None):
+        raise NotImplementedError
+    def delete(backend, key):
+        raise NotImplementedError
+    def clear(backend):
+        raise NotImplementedError
+    def get_many(backend, keys):
+        result = {}
+        for key in keys:
+            value = backend.get(key)
+            if value is not None: result[key] = value
+        return result
+    def set_many(backend, items, ttl=None):
+        for key, value in items: backend.set(key, value, ttl)
+    def delete_many(backend, keys):
+        for key in keys: backend.delete(key)
+
+class LocalCacheBackend(CacheBackend):
+    def __init__(backend, maxsize=10000):
+        backend.data = LRUCache(maxsize)
+    def get(backend, key):
+        item = backend.data.get(key)
+        if item is None: return None
+        value, expires = item
+        if expires is not None and expires < time():
+            backend.data.pop(key)
+            return None
+        return value
+    def set(backend, key, value, ttl=None):
+        backend.data[key] = value, None if ttl is None else time() + ttl
+    def delete(backend, key):
+        backend.data.pop(key)
+    def clear(backend):
+        backend.data.clear()
+    @property
+    def stats(backend):
+        return backend.data.stats
+
+class SerializingCacheBackend(LocalCacheBackend):
+    # Behaves like a client of a shared cache server: keys are strings and values are copied through pickle
+    def get(backend, key):
+        value = LocalCacheBackend.get(backend, repr(key))
+        if value is None: return None
+        return pickle.loads(value)
+    def set(backend, key, value, ttl=None):
+        LocalCacheBackend.set(backend, repr(key), pickle.dumps(value, 2), ttl)
+    def delete(backend, key):
+        LocalCacheBackend.delete(backend, repr(key))
+
+class SecondLevelCache(object):
+    # Rows are published together with the version of the cache at the start of the transaction which read them.
+    # Rows of keys invalidated after that version can be stale and are not published. Versions are local
+    # to the process, so with a backend shared by several processes the staleness is bounded by ttl only.
+    def __init__(cache, backend=None, ttl=None, maxsize=10000):
+        if backend is None: backend = LocalCacheBackend(maxsize)
+        cache.backend = backend
+        cache.ttl = ttl
+        cache.hits = cache.misses = cache.skipped = 0
+        cache.lock = Lock()
+        cache.version = 0  # incremented on each invalidation
+        cache.min_version = 0  # rows read before this version are not published
+        cache.invalidations = {}  # key -> version of the last invalidation
+        cache.max_invalidations = maxsize
+    def get_many(cache, keys):
+        result = cache.backend.get_many(keys)
+        cache.hits += len(result)
+        cache.misses += len(keys) - len(result)
+        return result
+    def set_many(cache, items, version):
+        with cache.lock:
+            if version < cache.min_version:
+                cache.skipped += len(items)
+                return
+            invalidations = cache.invalidations
+            by_ttl = {}
+            for key, (entry, ttl) in iteritems(items):
+                if invalidations.get(key, -1) > version: cache.skipped += 1
+                else: by_ttl.setdefault(ttl, []).append((key, entry))
+            for ttl, entries in iteritems(by_ttl): cache.backend.set_many(entries, ttl)
+    def delete_many(cache, keys):
+        with cache.lock:
+            cache.version += 1
+            invalidations = cache.invalidations
+            if len(invalidations) + len(keys) > cache.max_invalidations:
+                invalidations.clear()
+                cache.min_version = cache.version  # forgotten invalidations are older than this version
+            for key in keys: invalidations[key] = cache.version
+            cache.backend.delete_many(keys)
+    def clear(cache):
+        with cache.lock:
+            cache.version += 1
+            cache.min_version = cache.version
+            cache.invalidations.clear()
+            cache.backend.clear()
+    @property
+    def stats(cache):
+        result = dict(hits=cache.hits, misses=cache.misses, skipped=cache.skipped)
+        backend_stats = getattr(cache.backend, 'stats', None)
+        if backend_stats is not None: result['backend'] = backend_stats
+        return result
@@ -0,0 +1,249 @@
+from __future__ import absolute_import, print_function, division
+from pony.py23compat import PY2, basestring, unicode, int_types, iteritems, pickle
+
+import os, sys, atexit, tempfile
+from hashlib import md5
+from threading import Lock
+
+import pony
+from pony.utils import codeobjects
+from pony.orm.ormtypes import SetType, FuncType
+from pony.orm.core import EntityMeta, Attribute, DescWrapper
+from pony.orm.sqlbuilding import make_adapter
+from pony.orm.sqltranslation import make_row_layout_func
+
+class UnstableKey(Exception): pass
+
+def codeobject_hash(codeobject):
+    consts = []
+    for const in codeobject.co_consts:
+        if hasattr(const, 'co_code'): consts.append(codeobject_hash(const))
+        else: consts.append(repr(const))
+    data = repr((codeobject.co_code, tuple(consts), codeobject.co_names, codeobject.co_varnames,
+                 codeobject.co_freevars, codeobject.co_cellvars))
+    return md5(data.encode('utf-8')).hexdigest()
+
+def stable_key(x):
+    if x is None or isinstance(x, (bool, float, basestring) + int_types): return x
+    if isinstance(x, dict):
+        result = []
+        for key, value in sorted(iteritems(x), key=lambda item: repr(item[0])):
+            if key == 'code_key' and isinstance(value, int_types):
+                codeobject = codeobjects.get(value)
+                if codeobject is None: raise UnstableKey(value)
+                value = ('code', codeobject_hash(codeobject))
+            else: value = stable_key(value)
+            result.append((stable_key(key), value))
+        return ('dict', tuple(result))
+    if isinstance(x, (tuple, list)): return tuple(stable_key(item) for item in x)
+    if isinstance(x, EntityMeta): return ('entity', x.__name__)
+    if isinstance(x, Attribute): return ('attr', x.entity.__name__, x.name)
+    if isinstance(x, DescWrapper): return ('desc', stable_key(x.attr))
+    if type(x) is type: return ('type', x.__module__, x.__name__)
+    if type(x) is SetType: return ('set', stable_key(x.item_type))
+    if type(x) is FuncType:
+        func = x.func
+        module = sys.modules.get(getattr(func, '__module__', None))
+        if module is not None and getattr(module, func.__name__, None) is func:
+            return ('func', func.__module__, func.__name__)
+    raise UnstableKey(x)
+
+def pack_type(t):
+    if isinstance(t, EntityMeta): return ('entity', t.__name__)
+    if type(t) is tuple: return ('tuple', tuple(pack_type(item) for item in t))
+    if type(t) is SetType: return ('set', pack_type(t.item_type))
+    if type(t) is type:
+        module = sys.modules.get(t.__module__)
+        if module is not None and getattr(module, t.__name__, None) is t: return ('type', t.__module__, t.__name__)
+    raise UnstableKey(t)
+
+def unpack_type(database, type_ref):
+    kind = type_ref[0]
+    if kind == 'entity': return database.entities[type_ref[1]]
+    if kind == 'tuple': return tuple(unpack_type(database, item) for item in type_ref[1])
+    if kind == 'set': return SetType(unpack_type(database, type_ref[1]))
+    return getattr(sys.modules[type_ref[1]], type_ref[2])
+
+def get_schema_description(database):
+    # unlike Database._get_schema_dict(), it is not filtered by permissions of the current user
+    result = []
+    for entity in sorted(database.entities.values(), key=lambda entity: entity.__name__):
+        attrs = tuple((attr.name, attr.__class__.__name__, attr.py_type.__name__, attr.reverse and attr.reverse.name,
+                       tuple(attr.columns), attr.auto, attr.lazy, attr.nullable) for attr in entity._attrs_)
+        result.append((entity.__name__, entity._table_, tuple(base.__name__ for base in entity._all_bases_),
+                       tuple(attr.name for attr in entity._pk_attrs_),
+                       tuple(tuple(attr.name for attr in key) for key in entity._keys_), attrs))
+    return result
+
+class LazyTranslator(object):
+    # stands in for a translator restored from the persistent cache,
+    # the real translator is built only when something beyond the fetch path is required
+    def __init__(translator, database, state, build):
+        expr_type_ref, layout, col_names, query_result_is_cacheable, used_attrs = state
+        entities = database.entities
+        translator.expr_type = expr_type = unpack_type(database, expr_type_ref)
+        if layout is None: translator.row_layout = None
+        else:
+            provider = database.provider
+            types = expr_type if type(expr_type) is tuple else (expr_type,)
+            row_layout = []
+            for t, (x, src) in zip(types, layout):
+                if type(t) is SetType: t = t.item_type
+                if type(x) is tuple: x = slice(*x)
+                row_layout.append((make_row_layout_func(provider, t), x, src))
+            translator.row_layout = row_layout
+        translator.col_names = col_names
+        translator.query_result_is_cacheable = query_result_is_cacheable
+        translator.used_attrs = set(entities[entity_name]._adict_[attr_name] for entity_name, attr_name in used_attrs)
+        translator.build = build
+        translator.real_translator = None
+    def get_used_attrs(translator):
+        return translator.used_attrs
+    def __getattr__(translator, name):
+        if name.startswith('__'): raise AttributeError(name)
+        real_translator = translator.real_translator
+        if real_translator is None: real_translator = translator.real_translator = translator.build()
+        return getattr(real_translator, name)
+
+class PersistentQueryCache(object):
+    def __init__(cache, database, filename, autosave=True):
+        cache.database = database
+        cache.filename = filename
+        cache.entries = None  # persisted sql key -> constructed SQL
+        cache.translators = None  # persisted query key -> state of LazyTranslator
+        cache.header = None
+        cache.modified = False
+        cache.hits = cache.misses = 0
+        cache.translator_hits = cache.translator_misses = 0
+        cache.lock = Lock()
+        if autosave: atexit.register(cache.save)
+    def _get_header(cache):
+        database = cache.database
+        schema_hash = md5(repr(get_schema_description(database)).encode('utf-8')).hexdigest()
+        tables = sorted((entity.__name__, entity._table_, tuple((attr.name, tuple(attr.columns)) for attr in entity._attrs_))
+                        for entity in database.entities.values())
+        tables_hash = md5(repr(tables).encode('utf-8')).hexdigest()
+        return (pony.__version__, sys.version_info[:3], database.provider.dialect,
+                database.provider.paramstyle, schema_hash, tables_hash)
+    def _load(cache):
+        cache.header = cache._get_header()
+        cache.entries = {}
+        cache.translators = {}
+        try:
+            with open(cache.filename, 'rb') as f: header, entries, translators = pickle.load(f)
+        except Exception: return  # missing or corrupted file is just ignored
+        if header == cache.header: cache.entries, cache.translators = entries, translators
+    def save(cache):
+        if not cache.modified or cache.entries is None: return
+        with cache.lock:
+            dirname = os.path.dirname(os.path.abspath(cache.filename))
+            fd, tmp_filename = tempfile.mkstemp(dir=dirname, prefix='.pony-query-cache-')
+            try:
+                with os.fdopen(fd, 'wb') as f: pickle.dump((cache.header, cache.entries, cache.translators), f, 2)
+                if PY2 and os.name == 'nt' and os.path.exists(cache.filename): os.remove(cache.filename)
+                os.rename(tmp_filename, cache.filename)
+            except:
+                if os.path.exists(tmp_filename): os.remove(tmp_filename)
+                raise
+            cache.modified = False
+    def clear(cache):
+        with cache.lock:
+            if cache.entries or cache.translators: cache.modified = True
+            cache.entries = {}
+            cache.translators = {}
+    @staticmethod
+    def make_key(sql_key):
+        try: key = stable_key(sql_key)
+        except UnstableKey: return None
+        return md5(repr(key).encode('utf-8')).hexdigest()
+    def get(cache, key):
+        entry = cache._get_entries().get(key)
+        if entry is not None:
+            try: result = cache._unpack(entry)
+            except Exception: pass  # entity or attribute was renamed
+            else:
+                cache.hits += 1
+                return result
+        cache.misses += 1
+        return None
+    def _get_entries(cache):
+        if cache.entries is None:
+            with cache.lock:
+                if cache.entries is None: cache._load()
+        return cache.entries
+    def get_translator(cache, query_key, build):
+        key = cache.make_key(('translator', query_key))
+        if key is None: return None
+        cache._get_entries()
+        state = cache.translators.get(key)
+        if state is not None:
+            try: translator = LazyTranslator(cache.database, state, build)
+            except Exception: pass  # entity or attribute was renamed
+            else:
+                cache.translator_hits += 1
+                return translator
+        cache.translator_misses += 1
+        return None
+    def put_translator(cache, query_key, translator):
+        key = cache.make_key(('translator', query_key))
+        if key is None: return
+        try: state = cache._pack_translator(translator)
+        except UnstableKey: return
+        cache._get_entries()
+        with cache.lock:
+            cache.translators[key] = state
+            cache.modified = True
+    def _pack_translator(cache, translator):
+        if translator.row_layout is None: layout = None
+        else: layout = [ ((x.start, x.stop) if type(x) is slice else x, src)  # slices cannot be pickled in Python 2
+                         for func, x, src in translator.row_layout ]
+        used_attrs = sorted((attr.entity.__name__, attr.name) for attr in translator.get_used_attrs())
+        return (pack_type(translator.expr_type), layout, list(translator.col_names),
+                translator.query_result_is_cacheable, used_attrs)
+    def put(cache, key, sql, adapter, attr_offsets):
+        entries = cache._get_entries()
+        try: entry = cache._pack(sql, adapter, attr_offsets)
+        except UnstableKey: return
+        with cache.lock:
+            entries[key] = entry
+            cache.modified = True
+    def _pack(cache, sql, adapter, attr_offsets):
+        param_class = cache.database.provider.sqlbuilder_cls.param_class
+        params = getattr(adapter, 'params', None)
+        if params is None: raise UnstableKey(adapter)
+        param_list = []
+        for param in params:
+            if type(param) is not param_class: raise UnstableKey(param)
+            converter = param.converter
+            if converter is None: converter_ref = None
+            elif converter.attr is not None:
+                attr = converter.attr
+                if not attr.converters or attr.converters[0] is not converter: raise UnstableKey(converter)
+                converter_ref = 'attr', attr.entity.__name__, attr.name
+            elif type(converter.py_type) is type: converter_ref = 'py_type', converter.py_type
+            else: raise UnstableKey(converter)
+            param_list.append((param.id, param.paramkey, converter_ref, param.optimistic))
+        if attr_offsets is None: offsets_list = None
+        else: offsets_list = [ (attr.entity.__name__, attr.name, offsets)
+                               for attr, offsets in iteritems(attr_offsets) ]
+        return unicode(sql), param_list, offsets_list
+    def _unpack(cache, entry):
+        database = cache.database
+        provider = database.provider
+        entities = database.entities
+        sql, param_list, offsets_list = entry
+        param_class = provider.sqlbuilder_cls.param_class
+        params = []
+        for param_id, paramkey, converter_ref, optimistic in param_list:
+            if converter_ref is None: converter = None
+            elif converter_ref[0] == 'attr':
+                converter = entities[converter_ref[1]]._adict_[converter_ref[2]].converters[0]
+            else: converter = provider.get_converter_by_py_type(converter_ref[1])
+            param = param_class(provider.paramstyle, paramkey, converter, optimistic)
+            param.id = param_id
+            params.append(param)
+        adapter = make_adapter(provider.paramstyle, tuple(params))
+        if offsets_list is None: attr_offsets = None
+        else: attr_offsets = { entities[entity_name]._adict_[attr_name]: offsets
+                               for entity_name, attr_name, offsets in offsets_list }
+        return sql, adapter, attr_offsets
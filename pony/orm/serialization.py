@@ -4,8 +4,9 @@ import json
 from datetime import date, datetime
 from decimal import Decimal
 from collections import defaultdict
+from operator import itemgetter
 
-from pony.orm.core import Entity, TransactionError
+from pony.orm.core import Entity, TransactionError, json_key
 from pony.utils import cut_traceback, throw
 
 class Bag(object):
@@ -15,7 +16,6 @@ class Bag(object):
         bag.entity_configs = {}
         bag.objects = defaultdict(set)
         bag.vars = {}
-        bag.dicts = defaultdict(dict)
     @cut_traceback
     def config(bag, entity, only=None, exclude=None, with_collections=True, with_lazy=False, related_objects=True):
         if bag.database.entities.get(entity.__name__) is not entity: throw(TypeError,
@@ -45,68 +45,113 @@ class Bag(object):
         bag.objects[entity].add(obj)
     def _reduce_composite_pk(bag, pk):
         return ','.join(str(item).replace('*', '**').replace(',', '*,') for item in pk)
-    @cut_traceback
-    def to_dict(bag):
-        bag.dicts.clear()
+    def _get_config(bag, entity):
+        try: return bag.entity_configs[entity]
+        except KeyError: return bag.config(entity)
+    def _load_objects(bag, entity, objects, with_collections):
+        entity._load_many_(objects)
+        attrs, related_objects = bag._get_config(entity)
+        for attr in attrs:
+            if attr.is_collection:
+                if with_collections: attr.load_many(objects)
+            elif attr.lazy or not attr.columns: attr.load_many(objects)
+    def _collect_objects(bag):
+        # returns {entity: {obj: process_related}}, related objects are serialized without collections
+        result = defaultdict(dict)
+        related = defaultdict(list)
         for entity, objects in iteritems(bag.objects):
+            objects = list(objects)
+            attrs, related_objects = bag._get_config(entity)
+            bag._load_objects(entity, objects, True)
             for obj in objects:
-                dicts = bag.dicts[entity]
-                if obj not in dicts: bag._process_object(obj)
-        result = defaultdict(dict)
-        for entity, dicts in iteritems(bag.dicts):
-            composite_pk = len(entity._pk_columns_) > 1
-            for obj, d in iteritems(dicts):
-                pk = obj._get_raw_pkval_()
-                if composite_pk: pk = bag._reduce_composite_pk(pk)
-                else: pk = pk[0]
-                result[entity.__name__][pk] = d
-        bag.dicts.clear()
+                result[entity][obj] = True
+                if not related_objects: continue
+                for attr in attrs:
+                    if not attr.is_relation: continue
+                    value = attr.__get__(obj)
+                    if attr.is_collection:
+                        for related_obj in value: related[related_obj.__class__].append(related_obj)
+                    elif value is not None: related[value.__class__].append(value)
+        for entity, objects in iteritems(related):
+            objects = [ obj for obj in set(objects) if obj not in result[entity] ]
+            if not objects: continue
+            bag._load_objects(entity, objects, False)
+            for obj in objects: result[entity][obj] = False
         return result
-    def _process_object(bag, obj, process_related=True):
+    def _get_object_key(bag, obj):
+        pk = obj._get_raw_pkval_()
+        if len(obj._pk_columns_) > 1: return bag._reduce_composite_pk(pk)
+        return pk[0]
+    def _get_object_dict(bag, obj, process_related=True):
         entity = obj.__class__
-        try: attrs, related_objects = bag.entity_configs[entity]
-        except KeyError: attrs, related_objects = bag.config(entity)
-        process_related_objects = process_related and related_objects
-        d = {}
+        attrs, related_objects = bag._get_config(entity)
+        if not process_related: attrs = tuple(attr for attr in attrs if not attr.is_collection)
+        d = entity._get_serializer_(attrs)(obj)
         for attr in attrs:
-            value = attr.__get__(obj)
-            if attr.is_collection:
-                if not process_related:
-                    continue
-                if process_related_objects:
-                    for related_obj in value:
-                        if related_obj not in bag.dicts:
-                            bag._process_object(related_obj, process_related=False)
-                if attr.reverse.entity._pk_is_composite_:
-                    value = sorted(bag._reduce_composite_pk(item._get_raw_pkval_()) for item in value)
-                else: value = sorted(item._get_raw_pkval_()[0] for item in value)
-            elif attr.is_relation:
-                if value is not None:
-                    if process_related_objects:
-                        bag._process_object(value, process_related=False)
-                    value = value._get_raw_pkval_()
-                    if len(value) == 1: value = value[0]
-            d[attr.name] = value
-        bag.dicts[entity][obj] = d
+            if attr.is_collection and attr.reverse.entity._pk_is_composite_:
+                d[attr.name] = sorted(bag._reduce_composite_pk(pkval) for pkval in d[attr.name])
+        return d
+    @cut_traceback
+    def to_dict(bag):
+        result = defaultdict(dict)
+        for entity, objects in iteritems(bag._collect_objects()):
+            for obj, process_related in iteritems(objects):
+                result[entity.__name__][bag._get_object_key(obj)] = bag._get_object_dict(obj, process_related)
+        return result
     @cut_traceback
     def to_json(bag):
-        return json.dumps(bag.to_dict(), default=json_converter, indent=2, sort_keys=True)
+        return ''.join(bag._iter_json())
+    @cut_traceback
+    def iter_json(bag):
+        return bag._iter_json()
+    @cut_traceback
+    def dump_json(bag, fp):
+        for chunk in bag._iter_json(): fp.write(chunk)
+    def _iter_json(bag):
+        # produces the same text as json.dumps(bag.to_dict(), indent=2, sort_keys=True) one object at a time
+        collected = sorted((entity.__name__, objects) for entity, objects in iteritems(bag._collect_objects()))
+        item_separator = json.JSONEncoder(indent=2).item_separator
+        codec = bag.database.json_codec
+        def iter_chunks():
+            if not collected:
+                yield '{}'
+                return
+            yield '{'
+            for i, (entity_name, objects) in enumerate(collected):
+                if i: yield item_separator
+                yield '\n  %s: {' % codec.dumps(entity_name)
+                items = sorted(((bag._get_object_key(obj), obj) for obj in objects), key=itemgetter(0))
+                for j, (key, obj) in enumerate(items):
+                    if j: yield item_separator
+                    obj_json = codec.dumps(bag._get_object_dict(obj, objects[obj]),
+                                           default=json_converter, indent=2, sort_keys=True)
+                    yield '\n    %s: %s' % (json_key(key), obj_json.replace('\n', '\n    '))
+                yield '\n  }'
+            yield '\n}'
+        return iter_chunks()
 
-def to_dict(objects):
+def _make_bag(objects):
     if isinstance(objects, Entity): objects = [ objects ]
     objects = iter(objects)
     try: first_object = next(objects)
-    except StopIteration: return {}
+    except StopIteration: return None
     if not isinstance(first_object, Entity): throw(TypeError,
         'Entity instance or a sequence of instances expected. Got: %r' % first_object)
     database = first_object._database_
     bag = Bag(database)
     bag.put(first_object)
     bag.put(objects)
+    return bag
+
+def to_dict(objects):
+    bag = _make_bag(objects)
+    if bag is None: return {}
     return dict(bag.to_dict())
 
 def to_json(objects):
-    return json.dumps(to_dict(objects), default=json_converter, indent=2, sort_keys=True)
+    bag = _make_bag(objects)
+    if bag is None: return '{}'
+    return bag.to_json()
 
 def json_converter(x):
     if isinstance(x, (datetime, date, Decimal)):
@@ -156,6 +156,20 @@ def indentable(method):
     new_method.__name__ = method.__name__
     return new_method
 
+def make_adapter(paramstyle, params):
+    if paramstyle in ('qmark', 'format'):
+        def adapter(values):
+            return tuple(param.eval(values) for param in params)
+    elif paramstyle == 'numeric':
+        def adapter(values):
+            return tuple(param.eval(values) for param in params)
+    elif paramstyle in ('named', 'pyformat'):
+        def adapter(values):
+            return {'p%d' % param.id: param.eval(values) for param in params}
+    else: throw(NotImplementedError, paramstyle)
+    adapter.params = params
+    return adapter
+
 class SQLBuilder(object):
     dialect = None
     param_class = Param
@@ -179,18 +193,8 @@ class SQLBuilder(object):
             layout.append(param.paramkey)
         builder.layout = layout
         builder.sql = u''.join(imap(unicode, builder.result)).rstrip('\n')
-        if paramstyle in ('qmark', 'format'):
-            def adapter(values):
-                return tuple(param.eval(values) for param in params)
-        elif paramstyle == 'numeric':
-            def adapter(values):
-                return tuple(param.eval(values) for param in params)
-        elif paramstyle in ('named', 'pyformat'):
-            def adapter(values):
-                return {'p%d' % param.id: param.eval(values) for param in params}
-        else: throw(NotImplementedError, paramstyle)
         builder.params = params
-        builder.adapter = adapter
+        builder.adapter = make_adapter(paramstyle, params)
     def __call__(builder, ast):
         if isinstance(ast, basestring):
             throw(AstError, 'An SQL AST list was expected. Got string: %r' % ast)
@@ -215,6 +219,11 @@ class SQLBuilder(object):
         return [ 'INSERT INTO ', builder.quote_name(table_name), ' (',
                  join(', ', [builder.quote_name(column) for column in columns ]),
                  ') VALUES (', join(', ', [builder(value) for value in values]), ')' ]
+    def INSERT_MANY(builder, table_name, columns, rows):
+        return [ 'INSERT INTO ', builder.quote_name(table_name), ' (',
+                 join(', ', [builder.quote_name(column) for column in columns ]),
+                 ') VALUES ', join(', ', [ ('(', join(', ', [builder(value) for value in row]), ')')
+                                           for row in rows ]) ]
     def DEFAULT(builder):
         return 'DEFAULT'
     def UPDATE(builder, table_name, pairs, where=None):
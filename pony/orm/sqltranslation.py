@@ -66,9 +66,24 @@ def type2str(t):
     try: return t.__name__
     except: return str(t)
 
+def make_row_layout_func(provider, expr_type):
+    if isinstance(expr_type, EntityMeta):
+        def func(values, constructor=expr_type._get_by_raw_pkval_):
+            if None in values: return None
+            return constructor(values)
+    else:
+        converter = provider.get_converter_by_py_type(expr_type)
+        def func(value, converter=converter):
+            if value is None: return None
+            value = converter.sql2py(value)
+            value = converter.dbval2val(value)
+            return value
+    return func
+
 class SQLTranslator(ASTTranslator):
     dialect = None
     row_value_syntax = True
+    nulls_sort_first = True  # NULL values precede other values in ascending order
     json_path_wildcard_syntax = False
     json_values_are_comparable = True
     rowid_support = False
@@ -340,21 +355,13 @@ class SQLTranslator(ASTTranslator):
                     translator.distinct = False
                 expr_type = m.type
                 if isinstance(expr_type, SetType): expr_type = expr_type.item_type
+                func = make_row_layout_func(provider, expr_type)
                 if isinstance(expr_type, EntityMeta):
                     next_offset = offset + len(expr_type._pk_columns_)
-                    def func(values, constructor=expr_type._get_by_raw_pkval_):
-                        if None in values: return None
-                        return constructor(values)
                     row_layout.append((func, slice(offset, next_offset), ast2src(m.node)))
                     m.orderby_columns = list(xrange(offset+1, next_offset+1))
                     offset = next_offset
                 else:
-                    converter = provider.get_converter_by_py_type(expr_type)
-                    def func(value, converter=converter):
-                        if value is None: return None
-                        value = converter.sql2py(value)
-                        value = converter.dbval2val(value)
-                        return value
                     row_layout.append((func, offset, ast2src(m.node)))
                     m.orderby_columns = (offset+1,) if not m.disable_ordering else ()
                     offset += 1
@@ -408,7 +415,9 @@ class SQLTranslator(ASTTranslator):
             groupby_monads = translator.expr_monads
 
         select_ast = [ 'DISTINCT' if distinct else 'ALL' ] + translator.expr_columns
-        if aggr_func_name:
+        if isinstance(aggr_func_name, tuple):
+            select_ast, ast_transformer = translator.construct_aggregates_ast(aggr_func_name, distinct, groupby_monads)
+        elif aggr_func_name:
             expr_type = translator.expr_type
             if isinstance(expr_type, EntityMeta):
                 if aggr_func_name is not 'COUNT': throw(TypeError,
@@ -491,6 +500,59 @@ class SQLTranslator(ASTTranslator):
 
         sql_ast = ast_transformer(sql_ast)
         return sql_ast, attr_offsets
+    def get_aggregate_target(translator, aggr_func_name, pos):
+        expr_type = translator.expr_type
+        if pos is None:
+            if isinstance(expr_type, EntityMeta):
+                if aggr_func_name != 'COUNT': throw(TypeError,
+                    'Attribute should be specified for %r aggregate function' % aggr_func_name.lower())
+                return None, None
+            if isinstance(expr_type, tuple):
+                if aggr_func_name != 'COUNT': throw(TypeError,
+                    'Single attribute should be specified for %r aggregate function' % aggr_func_name.lower())
+                return None, None
+            target_type, offset = expr_type, 0
+        else:
+            if not isinstance(expr_type, tuple): throw(TypeError,
+                'Element number can be specified only when query result is list of tuples')
+            if not 1 <= pos <= len(expr_type): throw(IndexError,
+                'Invalid element number %d (query result is list of tuples with only %d elements in each)'
+                % (pos, len(expr_type)))
+            target_type = expr_type[pos-1]
+            offset = 0
+            for monad in translator.expr_monads[:pos-1]: offset += len(monad.getsql())
+            if len(translator.expr_monads[pos-1].getsql()) > 1 and aggr_func_name != 'COUNT': throw(TypeError,
+                'Element %d of query result cannot be used in %r aggregate function' % (pos, aggr_func_name.lower()))
+        if aggr_func_name in ('SUM', 'AVG') and target_type not in numeric_types:
+            throw(TypeError, '%r is valid for numeric attributes only' % aggr_func_name.lower())
+        if aggr_func_name in ('MIN', 'MAX') and isinstance(target_type, EntityMeta): throw(TypeError,
+            '%r is valid for attributes only' % aggr_func_name.lower())
+        return target_type, offset
+    def construct_aggregates_ast(translator, aggregates, distinct, groupby_monads):
+        expr_type = translator.expr_type
+        expr_columns = translator.expr_columns
+        targets = [ (aggr_func_name, translator.get_aggregate_target(aggr_func_name, pos)[1])
+                    for aggr_func_name, pos in aggregates ]
+        if groupby_monads or distinct and isinstance(expr_type, (tuple, EntityMeta)) and len(expr_columns) > 1:
+            # aggregates are calculated over result of inner query, because it has GROUP BY or DISTINCT rows
+            inner_select_ast = [ 'DISTINCT' if distinct else 'ALL' ] + [
+                [ 'AS', column_ast, 'expr%d' % i ] for i, column_ast in enumerate(expr_columns) ]
+            column = lambda offset: [ 'COLUMN', 't', 'expr%d' % offset ]
+            count_all = lambda: [ 'COUNT', 'ALL' ]
+            def ast_transformer(ast):
+                return [ 'SELECT', aggregates_ast, [ 'FROM', [ 't', 'SELECT', ast[1:] ] ] ]
+        else:
+            inner_select_ast = None
+            column = lambda offset: expr_columns[offset]
+            count_all = lambda: [ 'COUNT', 'ALL' ] if not distinct else [ 'COUNT', 'DISTINCT', expr_columns[0] ]
+            ast_transformer = lambda ast: ast
+        aggregates_ast = [ 'AGGREGATES' ]
+        for aggr_func_name, offset in targets:
+            if aggr_func_name != 'COUNT': aggr_ast = [ aggr_func_name, column(offset) ]
+            elif offset is None: aggr_ast = count_all()
+            else: aggr_ast = [ 'COUNT', 'DISTINCT', column(offset) ]
+            aggregates_ast.append(aggr_ast)
+        return inner_select_ast or aggregates_ast, ast_transformer
     def construct_delete_sql_ast(translator):
         entity = translator.expr_type
         expr_monad = translator.tree.expr.monad
@@ -580,6 +642,65 @@ class SQLTranslator(ASTTranslator):
                 new_order.append(desc_wrapper([ 'COLUMN', alias, column]))
         order[:0] = new_order
         return translator
+    def get_seek_order(translator):
+        entity = translator.expr_type
+        if not isinstance(entity, EntityMeta) or translator.aggregated: throw(TypeError,
+            'Keyset pagination is limited to queries which return simple list of objects')
+        alias = translator.alias
+        columns = {}
+        for attr in entity._attrs_:
+            if attr.is_collection or not attr.columns: continue
+            for i, column in enumerate(attr.columns): columns[column] = attr, i
+        seek_order = []
+        used_columns = set()
+        for order_ast in translator.order:
+            desc = order_ast[0] == 'DESC'
+            column_ast = order_ast[1] if desc else order_ast
+            if column_ast[0] != 'COLUMN' or column_ast[1] != alias or column_ast[2] not in columns: throw(TypeError,
+                'Keyset pagination requires query to be ordered by attributes of entity %s' % entity.__name__)
+            column = column_ast[2]
+            if column in used_columns: continue
+            used_columns.add(column)
+            attr, i = columns[column]
+            seek_order.append((column, attr, i, desc))
+        pk_desc = seek_order[-1][3] if seek_order else False  # primary key is a tie-breaker
+        for column in entity._pk_columns_:
+            if column in used_columns: continue
+            attr, i = columns[column]
+            seek_order.append((column, attr, i, pk_desc))
+        return seek_order
+    def apply_seek(translator, param_id, null_positions=()):
+        # null_positions are indexes of page key values which are NULL
+        seek_order = translator.get_seek_order()
+        translator = deepcopy(translator)
+        alias = translator.alias
+        items = []
+        for column, attr, i, desc in seek_order:
+            items.append(([ 'COLUMN', alias, column ], [ 'PARAM', (param_id, len(items), None), attr.converters[i] ],
+                          desc, bool(attr.nullable)))
+        translator.order = [ [ 'DESC', item[0] ] if item[2] else item[0] for item in items ]
+        if param_id is None: return translator
+        directions = set(item[2] for item in items)
+        nullable = any(item[3] for item in items)
+        if len(items) > 1 and len(directions) == 1 and translator.row_value_syntax and not nullable:
+            op = 'LT' if items[0][2] else 'GT'
+            condition = [ op, [ 'ROW' ] + [ item[0] for item in items ], [ 'ROW' ] + [ item[1] for item in items ] ]
+        else:
+            conditions = []
+            prev_conditions = []
+            for i, (column_ast, param_ast, desc, nullable) in enumerate(items):
+                nulls_first = translator.nulls_sort_first != desc  # NULL placement is reversed by DESC
+                if i in null_positions:
+                    if nulls_first: conditions.append(sqland(prev_conditions + [ [ 'IS_NOT_NULL', column_ast ] ]))
+                    prev_conditions.append([ 'IS_NULL', column_ast ])
+                    continue
+                condition = [ 'LT' if desc else 'GT', column_ast, param_ast ]
+                if nullable and not nulls_first: condition = sqlor([ condition, [ 'IS_NULL', column_ast ] ])
+                conditions.append(sqland(prev_conditions + [ condition ]))
+                prev_conditions.append([ 'EQ', column_ast, param_ast ])
+            condition = sqlor(conditions)
+        translator.conditions = translator.conditions + [ condition ]
+        return translator
     def apply_kwfilters(translator, filterattrs, original_names=False):
         translator = deepcopy(translator)
         if original_names:
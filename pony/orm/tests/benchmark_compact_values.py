@@ -0,0 +1,48 @@
+from __future__ import absolute_import, print_function, division
+
+# Compares memory and attribute access time of entity instances with dict and compact value storage.
+# Run as: python -m pony.orm.tests.benchmark_compact_values
+
+import sys, timeit
+
+from pony.orm.core import *
+
+def define_entity(db, compact):
+    class Row(db.Entity):
+        _compact_values_ = compact
+        a = Required(int)
+        b = Required(int)
+        c = Optional(int)
+        d = Optional(unicode)
+        e = Optional(unicode)
+        f = Optional(float)
+        g = Optional(float)
+        h = Optional(bool)
+        i = Optional(int)
+    return Row
+
+def measure(compact, count=10000):
+    db = Database('sqlite', ':memory:')
+    Row = define_entity(db, compact)
+    db.generate_mapping(create_tables=True)
+    with db_session:
+        for i in range(count):
+            Row(a=i, b=i, c=i, d='d%d' % i, e='e', f=1.5, g=2.5, h=True, i=i)
+    with db_session:
+        objects = Row.select()[:]
+        size = sum(sys.getsizeof(obj._vals_) + sys.getsizeof(obj._dbvals_) for obj in objects) / count
+        obj = objects[0]
+        get_time = min(timeit.repeat(lambda: obj.d, number=100000, repeat=5)) * 10
+    def load():
+        with db_session: Row.select()[:]
+    load_time = min(timeit.repeat(load, number=1, repeat=3))
+    return size, get_time, load_time
+
+def main():
+    print('%-8s %16s %18s %16s' % ('storage', 'bytes per object', 'attribute get, us', 'load 10000, ms'))
+    for compact in (False, True):
+        size, get_time, load_time = measure(compact)
+        print('%-8s %16d %18.3f %16.1f' % ('compact' if compact else 'dict', size, get_time, load_time * 1000))
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,67 @@
+from __future__ import absolute_import, print_function, division
+
+# Measures Json attribute and to_json() speed with different JSON codecs on the fixture of test_json.py.
+# Run as: python -m pony.orm.tests.benchmark_json_codec [module_name ...]
+# Extra codecs should be modules with json-compatible dumps() and loads(), e.g. simplejson.
+
+import json, sys, timeit
+from importlib import import_module
+
+from pony.orm.core import *
+from pony.orm.ormtypes import Json
+
+info = {
+    'name': 'Apple iPad Air 2',
+    'display': {'size': 9.7, 'resolution': [2048, 1536], 'matrix-type': 'IPS', 'multi-touch': True},
+    'os': {'type': 'iOS', 'version': '8'},
+    'cpu': 'Apple A8X',
+    'ram': '8GB',
+    'colors': ['Gold', 'Silver', 'Space Gray'],
+    'models': [
+        {'name': 'Wi-Fi', 'capacity': ['16GB', '64GB'],
+         'height': 240, 'width': 169.5, 'depth': 6.1, 'weight': 437},
+        {'name': 'Wi-Fi + Cellular', 'capacity': ['16GB', '64GB'],
+         'height': 240, 'width': 169.5, 'depth': 6.1, 'weight': 444},
+    ],
+    'discontinued': False,
+    'videoUrl': None,
+    'non-ascii-attr': u'\u0442\u0435\u0441\u0442'
+}
+tags = ['Tablets', 'Apple', 'Retina']
+
+def measure(codec, count=2000):
+    db = Database('sqlite', ':memory:')
+    class Product(db.Entity):
+        name = Required(unicode)
+        info = Optional(Json)
+        tags = Optional(Json)
+    db.generate_mapping(create_tables=True)
+    db.set_json_codec(codec)
+    with db.set_perms_for(Product):
+        perm('view', group='anybody')
+    def save():
+        with db_session:
+            for i in range(count): Product(name='Apple iPad Air 2', info=info, tags=tags)
+    save_time = min(timeit.repeat(save, number=1, repeat=3))
+    def load():
+        with db_session:
+            for p in Product.select()[:count]: p.info, p.tags
+    load_time = min(timeit.repeat(load, number=1, repeat=3))
+    converter = Product.info.converters[0]
+    x = converter.val2dbval(info)
+    y = json.dumps(info)  # the same value stored with another formatting
+    compare_time = min(timeit.repeat(lambda: converter.dbvals_equal(x, y), number=count, repeat=3))
+    with db_session:
+        products = Product.select()[:count]
+        to_json_time = min(timeit.repeat(lambda: db.to_json(products, with_schema=False), number=1, repeat=3))
+    return save_time, load_time, compare_time, to_json_time
+
+def main(args):
+    codecs = [ ('json', json) ] + [ (name, import_module(name)) for name in args ]
+    print('%-12s %10s %10s %13s %12s' % ('codec', 'save, ms', 'load, ms', 'compare, ms', 'to_json, ms'))
+    for name, codec in codecs:
+        times = measure(codec)
+        print('%-12s %10.1f %10.1f %13.1f %12.1f' % ((name,) + tuple(t * 1000 for t in times)))
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,150 @@
+from __future__ import absolute_import, print_function, division
+
+import unittest
+
+from pony.orm.core import *
+from pony.orm.dbproviders.sqlite import SQLiteProvider
+from pony.orm.tests.testutils import *
+
+class IdAllocatingProvider(SQLiteProvider):
+    # emulates a sequence of the primary key, ids are returned in reverse order
+    bulk_id_allocation = True
+    def get_next_ids_sql(provider, table_name, column_name, count):
+        sql = ('WITH RECURSIVE ids(id, n) AS (SELECT coalesce(max(%s), 0) + ?, 1 FROM %s '
+               'UNION ALL SELECT id - 1, n + 1 FROM ids WHERE n < ?) SELECT id FROM ids'
+               % (provider.quote_name(column_name), provider.quote_name(table_name)))
+        return sql, (count, count)
+
+class NoSequenceProvider(SQLiteProvider):
+    bulk_id_allocation = True
+    def get_next_ids_sql(provider, table_name, column_name, count):
+        return 'SELECT NULL', ()
+
+class TestBulkInsert(unittest.TestCase):
+    def setUp(self):
+        db = self.db = Database('sqlite', ':memory:')
+        log = self.log = []
+
+        class Group(db.Entity):
+            number = PrimaryKey(int)
+            students = Set('Student')
+
+        class Student(db.Entity):
+            id = PrimaryKey(int)
+            name = Required(unicode)
+            email = Optional(unicode, unique=True)
+            group = Optional(Group)
+            def before_insert(self):
+                log.append(('before', self.id))
+            def after_insert(self):
+                log.append(('after', self.id))
+
+        class Mark(db.Entity):
+            value = Required(int)
+
+        db.generate_mapping(create_tables=True)
+
+    def tearDown(self):
+        self.db = None
+
+    def insert_count(self, entity):
+        return sum(stat.db_count for sql, stat in self.db.local_stats.items()
+                   if sql.startswith('INSERT INTO "%s"' % entity._table_))
+
+    def test_executemany(self):
+        db = self.db
+        with db_session:
+            db.merge_local_stats()
+            for i in range(10): db.Student(id=i+1, name='S%d' % i, email='s%d@example.com' % i)
+            flush()
+            self.assertEqual(self.insert_count(db.Student), 1)
+            self.assertEqual(db.Student.get(email='s5@example.com').name, 'S5')
+            self.assertTrue(all(s._status_ == 'inserted' for s in db.Student.select()))
+        with db_session:
+            self.assertEqual(count(s for s in db.Student), 10)
+
+    def test_different_attrs(self):
+        db = self.db
+        with db_session:
+            db.merge_local_stats()
+            db.Student(id=1, name='A')
+            db.Student(id=2, name='B')
+            db.Student(id=3, name='C', email='c@example.com')
+            db.Student(id=4, name='D', email='d@example.com')
+            flush()
+            self.assertEqual(self.insert_count(db.Student), 2)
+        with db_session:
+            self.assertEqual(select(s.id for s in db.Student if s.email is None)[:], [1, 2])
+
+    def test_unsaved_principal(self):
+        db = self.db
+        with db_session:
+            db.merge_local_stats()
+            s1 = db.Student(id=1, name='A')
+            g = db.Group(number=1)
+            s2 = db.Student(id=2, name='B', group=g)
+            s3 = db.Student(id=3, name='C', group=g)
+        with db_session:
+            self.assertEqual(select(s.id for s in db.Student if s.group.number == 1)[:], [2, 3])
+
+    def test_auto_pk_without_returning(self):
+        db = self.db
+        with db_session:
+            marks = [ db.Mark(value=i) for i in range(5) ]
+            flush()
+            self.assertEqual([ m.id for m in marks ], [1, 2, 3, 4, 5])
+
+    def test_hooks(self):
+        db = self.db
+        with db_session:
+            db.Student(id=1, name='A')
+            db.Student(id=2, name='B')
+        self.assertEqual(self.log, [('before', 1), ('before', 2), ('after', 1), ('after', 2)])
+
+    @raises_exception(TransactionIntegrityError)
+    def test_integrity_error(self):
+        db = self.db
+        with db_session:
+            db.Student(id=1, name='A', email='a@example.com')
+        with db_session:
+            db.Student(id=2, name='B')
+            db.Student(id=1, name='C')
+
+    def test_allocated_ids(self):
+        db = Database(IdAllocatingProvider, ':memory:')
+        class Mark(db.Entity):
+            value = Required(int)
+        db.generate_mapping(create_tables=True)
+        with db_session:
+            db.merge_local_stats()
+            marks = [ Mark(value=i) for i in range(5) ]
+            flush()
+            self.assertEqual(sum(stat.db_count for sql, stat in db.local_stats.items()
+                                 if sql.startswith('INSERT INTO')), 1)
+            self.assertEqual(sorted(m.id for m in marks), [1, 2, 3, 4, 5])
+            self.assertTrue(Mark[marks[0].id] is marks[0])
+        with db_session:
+            self.assertEqual(sorted((m.id, m.value) for m in marks),
+                             sorted(select((m.id, m.value) for m in Mark)[:]))
+
+    def test_no_sequence(self):
+        db = Database(NoSequenceProvider, ':memory:')
+        class Mark(db.Entity):
+            value = Required(int)
+        db.generate_mapping(create_tables=True)
+        with db_session:
+            marks = [ Mark(value=i) for i in range(3) ]
+            flush()
+            self.assertEqual([ m.id for m in marks ], [1, 2, 3])
+            self.assertFalse(Mark._bulk_id_allocation_)
+
+    def test_insert_many_sql(self):
+        db = self.db
+        Student = db.Student
+        columns, rows = Student._get_insert_columns_and_params_((Student.id, Student.name), 2)
+        sql, adapter = db._ast2sql([ 'INSERT_MANY', Student._table_, columns, rows ])
+        self.assertEqual(sql, 'INSERT INTO "Student" ("id", "name") VALUES (?, ?), (?, ?)')
+        self.assertEqual(adapter([1, 'A', 2, 'B']), (1, 'A', 2, 'B'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+from __future__ import absolute_import, print_function, division
+
+import unittest
+
+from pony.orm.core import *
+from pony.orm.tests.testutils import *
+
+class TestBulkUpdate(unittest.TestCase):
+    def setUp(self):
+        db = self.db = Database('sqlite', ':memory:')
+
+        class Account(db.Entity):
+            id = PrimaryKey(int)
+            name = Required(unicode)
+            balance = Required(int)
+
+        db.generate_mapping(create_tables=True)
+        with db_session:
+            for i in range(1, 11): Account(id=i, name='A%d' % i, balance=100)
+
+    def tearDown(self):
+        self.db = None
+
+    def update_count(self):
+        return sum(stat.db_count for sql, stat in self.db.local_stats.items() if sql.startswith('UPDATE'))
+
+    def test_executemany(self):
+        db = self.db
+        with db_session:
+            accounts = select(a for a in db.Account).order_by(db.Account.id)[:]
+            db.merge_local_stats()
+            for a in accounts: a.balance += a.id
+            flush()
+            self.assertEqual(self.update_count(), 1)
+            self.assertTrue(all(a._status_ == 'updated' for a in accounts))
+        with db_session:
+            self.assertEqual(select(a.balance for a in db.Account).order_by(1)[:], list(range(101, 111)))
+
+    def test_different_columns(self):
+        db = self.db
+        with db_session:
+            accounts = select(a for a in db.Account).order_by(db.Account.id)[:]
+            db.merge_local_stats()
+            for a in accounts[:5]: a.balance = 0
+            for a in accounts[5:]: a.name = 'X'
+            flush()
+            self.assertEqual(self.update_count(), 2)
+        with db_session:
+            self.assertEqual(count(a for a in db.Account if a.balance == 0), 5)
+            self.assertEqual(count(a for a in db.Account if a.name == 'X'), 5)
+
+    def test_optimistic_check(self):
+        db = self.db
+        with db_session:
+            accounts = select(a for a in db.Account).order_by(db.Account.id)[:]
+            db.execute('update Account set balance = 500 where id = 3')
+            for a in accounts: a.balance += 1
+            try: flush()
+            except OptimisticCheckError as e:
+                self.assertEqual(str(e), 'Object Account[3] was updated outside of current transaction. '
+                                         'Changes: balance (100 -> 500)')
+            else: self.fail('OptimisticCheckError expected')
+            rollback()
+        with db_session:
+            self.assertEqual(db.Account[1].balance, 100)
+            self.assertEqual(db.Account[3].balance, 100)
+
+    def test_optimistic_check_deleted(self):
+        db = self.db
+        with db_session:
+            accounts = select(a for a in db.Account).order_by(db.Account.id)[:]
+            db.execute('delete from Account where id = 10')
+            for a in accounts: a.name += '!'
+            try: flush()
+            except OptimisticCheckError as e:
+                self.assertEqual(str(e), 'Object Account[10] was deleted outside of current transaction')
+            else: self.fail('OptimisticCheckError expected')
+            rollback()
+
+    def test_failed_batch_is_repeated_row_by_row(self):
+        db = self.db
+        db.provider.max_update_batch_size = 3
+        with db_session:
+            accounts = select(a for a in db.Account).order_by(db.Account.id)[:]
+            db.execute('update Account set balance = 500 where id = 5')
+            db.merge_local_stats()
+            for a in accounts: a.balance += 1
+            try: flush()
+            except OptimisticCheckError as e:
+                self.assertEqual(str(e), 'Object Account[5] was updated outside of current transaction. '
+                                         'Changes: balance (100 -> 500)')
+            else: self.fail('OptimisticCheckError expected')
+            self.assertEqual(self.update_count(), 4)  # two batches and two rows of the second batch
+            self.assertEqual([ a._status_ for a in accounts[:4] ], ['updated'] * 4)
+            rollback()
+
+    def test_non_optimistic(self):
+        db = self.db
+        with db_session(optimistic=False):
+            accounts = select(a for a in db.Account).order_by(db.Account.id)[:]
+            db.merge_local_stats()
+            for a in accounts: a.balance = 1
+            flush()
+            self.assertEqual(self.update_count(), 1)
+        with db_session:
+            self.assertEqual(sum(a.balance for a in db.Account), 10)
+
+if __name__ == '__main__':
+    unittest.main()
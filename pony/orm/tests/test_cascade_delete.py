@@ -0,0 +1,114 @@
+from __future__ import absolute_import, print_function, division
+
+import unittest
+
+from pony.orm.core import *
+from pony.orm.tests.testutils import *
+
+db = Database('sqlite', ':memory:')
+
+class Customer(db.Entity):
+    name = Required(unicode)
+    orders = Set('Order')
+    notes = Set('Note', cascade_delete=False)
+
+class Order(db.Entity):
+    customer = Required(Customer)
+    lines = Set('OrderLine')
+
+class OrderLine(db.Entity):
+    order = Required(Order)
+    qty = Required(int)
+
+class Note(db.Entity):
+    customer = Required(Customer)
+    text = Required(unicode)
+
+class Category(db.Entity):
+    name = Required(unicode)
+    products = Set('Product')
+
+class Product(db.Entity):
+    category = Required(Category)
+    def before_delete(self):
+        deleted_products.append(self.id)
+
+deleted_products = []
+
+db.generate_mapping(create_tables=True)
+
+def populate():
+    for i in range(1, 4):
+        customer = Customer(id=i, name='C%d' % i)
+        for j in range(3):
+            order = Order(customer=customer)
+            for k in range(4): OrderLine(order=order, qty=k)
+    Note(customer=Customer[3], text='Note')
+    category = Category(id=1, name='Books')
+    for i in range(3): Product(category=category)
+
+class TestCascadeDelete(unittest.TestCase):
+    def setUp(self):
+        with db_session:
+            for entity in (OrderLine, Order, Note, Customer, Product, Category): entity.select().delete(bulk=True)
+            populate()
+        db.merge_local_stats()
+        del deleted_products[:]
+        rollback()
+        db_session.__enter__()
+    def tearDown(self):
+        rollback()
+        db_session.__exit__()
+    def select_count(self, table):
+        return sum(stat.db_count for sql, stat in db.local_stats.items()
+                   if sql.startswith('SELECT') and 'FROM "%s"' % table in sql)
+    def test_1(self):
+        Customer[1].delete()
+        commit()
+        self.assertEqual(self.select_count('Order'), 0)
+        self.assertEqual(self.select_count('OrderLine'), 0)
+        self.assertEqual(count(o for o in Order), 6)
+        self.assertEqual(count(l for l in OrderLine), 24)
+    def test_2(self):
+        line = OrderLine.select(lambda l: l.order.customer.id == 1).first()
+        order = line.order
+        Customer[1].delete()
+        self.assertEqual(line._status_, 'marked_to_delete')
+        self.assertEqual(order._status_, 'marked_to_delete')
+        commit()
+        self.assertEqual(line._status_, 'deleted')
+        self.assertEqual(order._status_, 'deleted')
+        self.assertEqual(count(l for l in OrderLine), 24)
+    def test_3(self):
+        Customer.select(lambda c: c.id < 3).delete()
+        db.merge_local_stats()
+        commit()
+        deletes = [ (sql, stat.db_count) for sql, stat in db.local_stats.items()
+                    if sql.startswith('DELETE FROM "OrderLine"') ]
+        self.assertEqual([ db_count for sql, db_count in deletes ], [ 1 ])
+        self.assertTrue('IN' in deletes[0][0])
+        self.assertEqual(count(o for o in Order), 3)
+        self.assertEqual(count(l for l in OrderLine), 12)
+    def test_4(self):
+        Customer[1].delete()
+        rollback()
+        self.assertEqual(count(l for l in OrderLine), 36)
+    @raises_exception(ConstraintError, 'Cannot delete object Customer[3], because it has non-empty set of notes, '
+                                       "and 'cascade_delete' option of Customer.notes is not set")
+    def test_5(self):
+        customer = Customer[3]
+        try: customer.delete()
+        finally:
+            self.assertEqual(customer._session_cache_.cascade_deletes, {})
+            self.assertEqual(customer._status_, 'loaded')
+    def test_6(self):
+        Category[1].delete()
+        commit()
+        self.assertEqual(len(deleted_products), 3)
+        self.assertEqual(count(p for p in Product), 0)
+    def test_7(self):
+        self.assertEqual(Order._get_cascade_delete_plan_(), ((Order.lines, ()),))
+        self.assertEqual(Product._get_cascade_delete_plan_(), None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+from __future__ import absolute_import, print_function, division
+
+import unittest
+
+from pony.orm.core import *
+from pony.orm.tests.testutils import *
+
+db = Database('sqlite', ':memory:')
+
+class Post(db.Entity):
+    title = Required(unicode)
+    comments = Set('Comment')
+    tags = Set('Tag')
+
+class Comment(db.Entity):
+    post = Required(Post)
+    text = Required(unicode)
+
+class Tag(db.Entity):
+    name = Required(unicode)
+    posts = Set(Post)
+
+db.generate_mapping(create_tables=True)
+
+with db_session:
+    tags = [ Tag(name='T%d' % i) for i in range(3) ]
+    for i in range(1, 11):
+        p = Post(id=i, title='P%d' % i, tags=tags[:i % 4])
+        for j in range(i % 3): Comment(post=p, text='C%d' % j)
+
+def query_count():
+    db.merge_local_stats()
+    return sum(stat.db_count for stat in db.global_stats.values())
+
+class TestCollectionCountBatching(unittest.TestCase):
+    def setUp(self):
+        db._global_stats.clear()
+        rollback()
+        db_session.__enter__()
+
+    def tearDown(self):
+        rollback()
+        db_session.__exit__()
+
+    def test_count_many(self):
+        posts = Post.select().order_by(Post.id)[:]
+        count = query_count()
+        result = Post.comments.count_many(posts)
+        self.assertEqual(query_count() - count, 1)
+        self.assertEqual([ result[p] for p in posts ], [ i % 3 for i in range(1, 11) ])
+        self.assertEqual([ p.comments.count() for p in posts ], [ i % 3 for i in range(1, 11) ])
+        self.assertEqual([ p.comments.is_empty() for p in posts ], [ i % 3 == 0 for i in range(1, 11) ])
+        self.assertEqual(query_count() - count, 1)
+        self.assertEqual(db.last_sql, '''SELECT "post", COUNT(*)
+FROM "Comment"
+WHERE "post" IN (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+GROUP BY "post"''')
+
+    def test_many_to_many(self):
+        posts = Post.select()[:]
+        result = Post.tags.count_many(posts)
+        self.assertEqual(dict((p.id, n) for p, n in result.items()), dict((i, i % 4) for i in range(1, 11)))
+
+    def test_unsaved_changes(self):
+        posts = Post.select().order_by(Post.id)[:]
+        Comment(post=posts[0], text='new')
+        posts[1].comments.clear()
+        result = Post.comments.count_many(posts[:3])
+        self.assertEqual([ result[p] for p in posts[:3] ], [ 2, 0, 0 ])
+
+    def test_automatic_batching(self):
+        posts = Post.select().order_by(Post.id)[:]
+        count = query_count()
+        counts = [ p.comments.count() for p in posts ]
+        self.assertEqual(counts, [ i % 3 for i in range(1, 11) ])
+        self.assertEqual(query_count() - count, 2)
+
+    def test_batches(self):
+        posts = Post.select()[:]
+        db.provider.max_params_count, max_params_count = 4, db.provider.max_params_count
+        try:
+            count = query_count()
+            Post.comments.count_many(posts)
+            self.assertEqual(query_count() - count, 3)
+        finally: db.provider.max_params_count = max_params_count
+
+    @raises_exception(TypeError, 'Object of Post type expected. Got: Tag[1]')
+    def test_wrong_type(self):
+        Post.comments.count_many([ Tag[1] ])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+from __future__ import absolute_import, print_function, division
+
+import unittest
+
+from pony.orm.core import *
+from pony.orm.core import CompactValues
+from pony.orm.tests.testutils import *
+
+db = Database('sqlite', ':memory:')
+
+class Person(db.Entity):
+    _compact_values_ = True
+    name = Required(unicode)
+    age = Optional(int)
+    notes = Optional(LongUnicode)
+    pets = Set('Pet')
+
+class Employee(Person):
+    salary = Optional(int)
+
+class Pet(db.Entity):
+    name = Required(unicode)
+    owner = Optional(Person)
+
+db.generate_mapping(create_tables=True)
+
+with db_session:
+    p1 = Person(id=1, name='John', age=30, notes='Some notes')
+    e1 = Employee(id=2, name='Mike', age=40, salary=1000)
+    Pet(id=1, name='Rex', owner=p1)
+    Pet(id=2, name='Tom', owner=p1)
+
+class TestCompactValues(unittest.TestCase):
+    def setUp(self):
+        rollback()
+        db_session.__enter__()
+
+    def tearDown(self):
+        rollback()
+        db_session.__exit__()
+
+    def test_storage(self):
+        p1 = Person[1]
+        self.assertTrue(isinstance(p1._vals_, CompactValues))
+        self.assertTrue(isinstance(p1._dbvals_, CompactValues))
+        self.assertFalse(isinstance(Pet[1]._vals_, CompactValues))
+        self.assertTrue(type(Person[2]._vals_) is type(p1._vals_) is Person._compact_values_class_)
+        self.assertEqual(list.__len__(p1._vals_), len(Person._value_attrs_))
+        self.assertEqual(p1._vals_.get(Person.notes), None)
+        self.assertFalse(Person.notes in p1._vals_)
+
+    def test_read(self):
+        p1 = Person[1]
+        self.assertEqual((p1.name, p1.age, p1.notes), ('John', 30, 'Some notes'))
+        self.assertEqual(set(pet.name for pet in p1.pets), {'Rex', 'Tom'})
+        self.assertEqual(Pet[1].owner, p1)
+
+    def test_update(self):
+        p1 = Person[1]
+        p1.age = 31
+        p1.notes = ''
+        self.assertEqual(p1._dbvals_[Person.age], 30)
+        commit()
+        rollback()
+        p1 = Person[1]
+        self.assertEqual((p1.age, p1.notes), (31, ''))
+        p1.age = 30
+        p1.notes = 'Some notes'
+        commit()
+
+    def test_subclass(self):
+        e1 = Person[2]
+        self.assertTrue(isinstance(e1, Employee))
+        self.assertEqual(e1.salary, 1000)
+        self.assertEqual(e1.to_dict(), dict(id=2, classtype='Employee', name='Mike', age=40, salary=1000))
+
+    def test_create_and_delete(self):
+        p = Person(name='Kate')
+        Pet(name='Max', owner=p)
+        commit()
+        self.assertEqual(p.pets.count(), 1)
+        p.pets.clear()
+        p.delete()
+        commit()
+        self.assertEqual(select(p for p in Person if p.name == 'Kate').count(), 0)
+
+    def test_protocol(self):
+        vals = Person[1]._vals_
+        self.assertEqual(dict(vals.items()), dict((attr, vals[attr]) for attr in vals))
+        copy = vals.copy()
+        self.assertEqual(copy, vals)
+        del copy[Person.age]
+        self.assertFalse(Person.age in copy)
+        self.assertTrue(Person.age in vals)
+        self.assertEqual(len(copy), len(vals) - 1)
+
+    @raises_exception(TypeError, 'Compact value storage can be configured for root entity Person only')
+    def test_subclass_option(self):
+        db = Database('sqlite', ':memory:')
+        class Person(db.Entity):
+            name = Required(unicode)
+        class Student(Person):
+            _compact_values_ = True
+
+    @raises_exception(TypeError, "_compact_values_ value should be True or False. Got: 'yes'")
+    def test_option_value(self):
+        db = Database('sqlite', ':memory:')
+        class Person(db.Entity):
+            _compact_values_ = 'yes'
+            name = Required(unicode)
+
+if __name__ == '__main__':
+    unittest.main()
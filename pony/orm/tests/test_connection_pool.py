@@ -0,0 +1,141 @@
+from __future__ import absolute_import, print_function, division
+
+import os, shutil, tempfile, threading, time, unittest
+
+from pony.orm.core import *
+from pony.orm.dbapiprovider import Pool
+from pony.orm.tests.testutils import *
+
+class FakeCursor(object):
+    def __init__(cursor, con):
+        cursor.con = con
+    def execute(cursor, sql):
+        if cursor.con.broken: raise IOError('connection is broken')
+    def fetchone(cursor):
+        return (1,)
+
+class FakeConnection(object):
+    def __init__(con):
+        con.closed = con.broken = False
+    def cursor(con):
+        return FakeCursor(con)
+    def rollback(con):
+        pass
+    def close(con):
+        con.closed = True
+
+class FakeDBAPIModule(object):
+    @staticmethod
+    def connect():
+        return FakeConnection()
+
+class TestSharedPool(unittest.TestCase):
+    def make_pool(self, **options):
+        pool = Pool(FakeDBAPIModule)
+        pool.configure(**options)
+        return pool
+    def test_reuse(self):
+        pool = self.make_pool(max_size=2)
+        con1 = pool.connect()
+        con2 = pool.connect()
+        self.assertIsNot(con1, con2)
+        pool.release(con1)
+        self.assertIs(pool.connect(), con1)
+        self.assertEqual(pool.stats, dict(size=2, idle=0, checked_out=2, waiting=0, created=2, dropped=0))
+    @raises_exception(PoolTimeoutError, 'Cannot get connection from the pool in 0.05 seconds: '
+                                        'all 1 connections are in use')
+    def test_timeout(self):
+        pool = self.make_pool(max_size=1, timeout=0.05)
+        pool.connect()
+        pool.connect()
+    def test_waiting(self):
+        pool = self.make_pool(max_size=1, timeout=5)
+        con = pool.connect()
+        result = []
+        thread = threading.Thread(target=lambda: result.append(pool.connect()))
+        thread.start()
+        for i in range(100):
+            if pool.stats['waiting']: break
+            time.sleep(0.01)
+        self.assertEqual(pool.stats['waiting'], 1)
+        pool.release(con)
+        thread.join()
+        self.assertEqual(result, [ con ])
+    def test_drop(self):
+        pool = self.make_pool(max_size=1, timeout=0)
+        con = pool.connect()
+        pool.drop(con)
+        self.assertTrue(con.closed)
+        self.assertIsNot(pool.connect(), con)
+        self.assertEqual(pool.stats['dropped'], 1)
+    def test_max_lifetime(self):
+        pool = self.make_pool(max_lifetime=0.01)
+        con = pool.connect()
+        time.sleep(0.02)
+        pool.release(con)
+        self.assertTrue(con.closed)
+        self.assertEqual(pool.stats['size'], 0)
+    def test_max_idle_time(self):
+        pool = self.make_pool(min_size=1, max_idle_time=0.01)
+        con1, con2, con3 = pool.connect(), pool.connect(), pool.connect()
+        pool.release(con1)
+        pool.release(con2)
+        time.sleep(0.02)
+        pool.release(con3)
+        self.assertTrue(con1.closed)
+        self.assertTrue(con2.closed)
+        self.assertFalse(con3.closed)
+        self.assertEqual(pool.stats['idle'], 1)
+    def test_pre_ping(self):
+        pool = self.make_pool(pre_ping=True)
+        con = pool.connect()
+        pool.release(con)
+        con.broken = True
+        con2 = pool.connect()
+        self.assertIsNot(con2, con)
+        self.assertTrue(con.closed)
+    def test_disconnect(self):
+        pool = self.make_pool()
+        con1, con2 = pool.connect(), pool.connect()
+        pool.release(con1)
+        pool.disconnect()
+        self.assertTrue(con1.closed)
+        self.assertFalse(con2.closed)
+    @raises_exception(ValueError, 'Pool min_size must be between 0 and max_size. Got: 3')
+    def test_min_size(self):
+        self.make_pool(min_size=3, max_size=2)
+
+class TestDatabasePool(unittest.TestCase):
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+    def test_threads(self):
+        db = Database('sqlite', os.path.join(self.dirname, 'test.sqlite'), create_db=True,
+                      pool_max_size=2, pool_timeout=10)
+
+        class Person(db.Entity):
+            name = Required(unicode)
+
+        db.generate_mapping(create_tables=True)
+        errors = []
+        def worker(i):
+            try:
+                with db_session: Person(name='P%d' % i)
+            except Exception as e: errors.append(e)
+        threads = [ threading.Thread(target=worker, args=(i,)) for i in range(8) ]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+        self.assertEqual(errors, [])
+        with db_session: self.assertEqual(count(p for p in Person), 8)
+        stats = db.pool_stats
+        self.assertTrue(stats['size'] <= 2)
+        self.assertEqual(stats['size'], stats['created'] - stats['dropped'])
+        self.assertEqual(stats['checked_out'], 0)
+        db.disconnect()
+    @raises_exception(TypeError, 'Connection pool options cannot be used with in-memory SQLite database')
+    def test_memory(self):
+        Database('sqlite', ':memory:', pool_max_size=2)
+
+if __name__ == '__main__':
+    unittest.main()
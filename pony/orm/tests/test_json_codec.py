@@ -0,0 +1,85 @@
+from __future__ import absolute_import, print_function, division
+
+import json, unittest
+
+from pony.orm.core import *
+from pony.orm.ormtypes import Json
+from pony.orm.serialization import to_json
+from pony.orm.tests.testutils import *
+
+db = Database('sqlite', ':memory:')
+
+class Product(db.Entity):
+    name = Required(unicode)
+    info = Optional(Json)
+
+db.generate_mapping(create_tables=True)
+
+with db.set_perms_for(Product):
+    perm('view', group='anybody')
+
+with db_session:
+    Product(id=1, name='Apple iPad Air 2', info={'display': {'size': 9.7, 'resolution': [2048, 1536]},
+                                                 'colors': ['Gold', 'Silver', 'Space Gray']})
+
+class CountingCodec(object):
+    def __init__(codec):
+        codec.dumps_count = codec.loads_count = 0
+    def dumps(codec, obj, **kwargs):
+        codec.dumps_count += 1
+        return json.dumps(obj, **kwargs)
+    def loads(codec, s):
+        codec.loads_count += 1
+        return json.loads(s)
+
+class TestJsonCodec(unittest.TestCase):
+    def setUp(self):
+        self.codec = CountingCodec()
+        db.set_json_codec(self.codec)
+        rollback()
+        db_session.__enter__()
+
+    def tearDown(self):
+        rollback()
+        db_session.__exit__()
+        db.set_json_codec(None)
+
+    def test_attribute(self):
+        p = Product[1]
+        self.assertEqual(p.info['display']['size'], 9.7)
+        self.assertEqual(self.codec.loads_count, 1)
+        p.info['colors'].append(Json(['Rose Gold']))
+        flush()
+        self.assertEqual(self.codec.dumps_count, 1)
+        self.assertEqual(db.get('select info from Product where id = 1'),
+                         '{"colors":["Gold","Silver","Space Gray",["Rose Gold"]],'
+                         '"display":{"resolution":[2048,1536],"size":9.7}}')
+
+    def test_to_json(self):
+        text = db.to_json(Product[1], with_schema=False)
+        self.assertTrue(self.codec.dumps_count > 0)
+        self.assertEqual(json.loads(text)['objects']['Product']['1']['name'], 'Apple iPad Air 2')
+        count = self.codec.dumps_count
+        self.assertEqual(json.loads(to_json(Product[1]))['Product']['1']['id'], 1)
+        self.assertTrue(self.codec.dumps_count > count)
+
+    def test_canonical_form(self):
+        converter = Product.info.converters[0]
+        x, y = '{"a":1,"b":[1,2]}', '{"b": [1, 2], "a": 1}'
+        self.assertTrue(converter.dbvals_equal(x, y))
+        self.assertFalse(converter.dbvals_equal(x, '{"a":1}'))
+        count = self.codec.loads_count
+        self.assertTrue(converter.dbvals_equal(x, y))
+        self.assertEqual(self.codec.loads_count, count)
+
+    def test_default_codec(self):
+        db.set_json_codec(None)
+        self.assertTrue(db.json_codec is json)
+        self.assertTrue(db.provider.json_codec is json)
+
+    @raises_exception(TypeError, "JSON codec should have dumps() and loads() functions. Got: 'json'")
+    def test_wrong_codec(self):
+        db.set_json_codec('json')
+
+if __name__ == '__main__':
+    unittest.main()
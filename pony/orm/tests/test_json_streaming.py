@@ -0,0 +1,126 @@
+from __future__ import absolute_import, print_function, division
+
+import json, unittest
+
+from pony.orm.core import *
+from pony.orm.serialization import Bag, json_converter
+from pony.orm.tests.testutils import *
+
+db = Database('sqlite', ':memory:')
+
+class Group(db.Entity):
+    number = PrimaryKey(int)
+    students = Set('Student')
+
+class Student(db.Entity):
+    name = Required(unicode)
+    group = Required(Group)
+    bio = Optional(LongUnicode)
+    marks = Set('Mark')
+
+class Subject(db.Entity):
+    name = PrimaryKey(unicode)
+    marks = Set('Mark')
+
+class Mark(db.Entity):
+    student = Required(Student)
+    subject = Required(Subject)
+    value = Required(int)
+    PrimaryKey(student, subject)
+
+class Secret(db.Entity):
+    text = Required(unicode)
+
+db.generate_mapping(create_tables=True)
+
+with db.set_perms_for(Group, Student, Subject, Mark):
+    perm('view', group='anybody')
+
+with db_session:
+    groups = [ Group(number=1), Group(number=2) ]
+    subjects = [ Subject(name='Math'), Subject(name='Physics') ]
+    for i in range(1, 11):
+        s = Student(id=i, name='S%d' % i, group=groups[i % 2], bio='Bio %d' % i)
+        for subject in subjects: Mark(student=s, subject=subject, value=i % 5 + 1)
+    Secret(id=1, text='secret')
+
+class Output(object):
+    def __init__(self):
+        self.chunks = []
+    def write(self, chunk):
+        self.chunks.append(chunk)
+    def getvalue(self):
+        return ''.join(self.chunks)
+
+def query_count():
+    db.merge_local_stats()
+    return sum(stat.db_count for stat in db.global_stats.values())
+
+class TestJsonStreaming(unittest.TestCase):
+    def setUp(self):
+        db._global_stats.clear()
+        rollback()
+        db_session.__enter__()
+
+    def tearDown(self):
+        rollback()
+        db_session.__exit__()
+
+    def test_objects(self):
+        marks = select(m for m in Mark if m.student.id == 1)[:]
+        result = json.loads(db.to_json(marks, with_schema=False))
+        self.assertEqual(result['data'], [ {'class': 'Mark', 'pk': [ 1, 'Math' ]},
+                                           {'class': 'Mark', 'pk': [ 1, 'Physics' ]} ])
+        self.assertEqual(result['objects'], {'Mark': {'1': {
+            'Math': {'student': 1, 'subject': 'Math', 'value': 2},
+            'Physics': {'student': 1, 'subject': 'Physics', 'value': 2}}}})
+
+    def test_include(self):
+        students = Student.select().order_by(Student.id)[:]
+        result = json.loads(db.to_json(students, include=[ Student.marks, Student.bio ], with_schema=False))
+        objects = result['objects']
+        self.assertEqual(sorted(objects), [ 'Mark', 'Student' ])
+        self.assertEqual(objects['Student']['3'], {'id': 3, 'name': 'S3', 'group': 2, 'bio': 'Bio 3',
+                                                   'marks': [ [ 3, 'Math' ], [ 3, 'Physics' ] ]})
+        self.assertEqual(sum(len(marks) for marks in objects['Mark'].values()), 20)
+
+    def test_batch_loading(self):
+        students = Student.select()[:]
+        count = query_count()
+        db.to_json(students, include=[ Student.marks, Student.bio, Mark.subject ])
+        self.assertEqual(query_count() - count, 3)  # marks, bio and subjects
+
+    def test_chunks(self):
+        students = Student.select()[:]
+        chunks = list(db.iter_json(students, include=[ Student.marks ]))
+        self.assertTrue(len(chunks) > 20)
+        fp = Output()
+        db.dump_json(students, fp, include=[ Student.marks ])
+        self.assertEqual(fp.getvalue(), ''.join(chunks))
+        self.assertEqual(fp.getvalue(), db.to_json(students, include=[ Student.marks ]))
+
+    def test_schema_hash(self):
+        result = json.loads(db.to_json([]))
+        self.assertEqual(sorted(result), [ 'data', 'objects', 'schema', 'schema_hash' ])
+        result = json.loads(db.to_json([], schema_hash=result['schema_hash']))
+        self.assertEqual(sorted(result), [ 'data', 'objects', 'schema_hash' ])
+
+    @raises_exception(PermissionError, 'The current user None which belongs to groups [\'anybody\'] '
+                                       'has no rights to see the object Secret[1] on the frontend')
+    def test_error_before_first_chunk(self):
+        db.iter_json([ Secret[1] ])
+
+    def test_bag(self):
+        bag = Bag(db)
+        bag.config(Student, with_lazy=True)
+        bag.put(Student.select()[:])
+        count = query_count()
+        text = bag.to_json()
+        self.assertEqual(query_count() - count, 3)  # bio, marks and groups
+        self.assertEqual(text, json.dumps(bag.to_dict(), default=json_converter, indent=2, sort_keys=True))
+        fp = Output()
+        bag.dump_json(fp)
+        self.assertEqual(fp.getvalue(), text)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+from __future__ import absolute_import, print_function, division
+
+import unittest
+
+from pony.orm.core import *
+from pony.orm.tests.testutils import *
+
+db = Database('sqlite', ':memory:')
+
+class Group(db.Entity):
+    number = PrimaryKey(int)
+    students = Set('Student')
+
+class Student(db.Entity):
+    name = Required(unicode)
+    age = Required(int)
+    group = Required(Group)
+    rating = Optional(int)
+
+db.generate_mapping(create_tables=True)
+
+with db_session:
+    groups = [ Group(number=i) for i in range(1, 4) ]
+    for i in range(20):
+        Student(name='S%d' % (i % 5), age=18 + i % 4, group=groups[i % 3], rating=None if i % 2 else i)
+
+class TestKeysetPagination(unittest.TestCase):
+    def setUp(self):
+        rollback()
+        db_session.__enter__()
+
+    def tearDown(self):
+        rollback()
+        db_session.__exit__()
+
+    def all_pages(self, query, pagesize, use_keys=False):
+        result = []
+        page = query.page_after(None, pagesize)
+        while page:
+            self.assertTrue(len(page) <= pagesize)
+            result.extend(page)
+            last = query.get_page_key(page[-1]) if use_keys else page[-1]
+            page = query.page_after(last, pagesize)
+        return result
+
+    def test_pk_order(self):
+        result = self.all_pages(Student.select(), 6)
+        self.assertEqual([ s.id for s in result ], list(range(1, 21)))
+
+    def test_mixed_directions(self):
+        query = Student.select().order_by(Student.name, desc(Student.age))
+        expected = sorted(Student.select()[:], key=lambda s: (s.name, -s.age, -s.id))
+        self.assertEqual(self.all_pages(query, 3), expected)
+        self.assertEqual(self.all_pages(query, 7, use_keys=True), expected)
+
+    def test_lambda_order(self):
+        query = select(s for s in Student if s.age > 18).order_by(lambda s: desc(s.age))
+        expected = sorted(query[:], key=lambda s: (-s.age, -s.id))
+        self.assertEqual(self.all_pages(query, 4), expected)
+
+    def test_reference_order(self):
+        query = Student.select().order_by(Student.group)
+        self.assertEqual(query.get_page_key(Student[5]), (2, 5))
+        expected = sorted(Student.select()[:], key=lambda s: (s.group.number, s.id))
+        self.assertEqual(self.all_pages(query, 5), expected)
+
+    def test_expanded_condition(self):
+        query = Student.select().order_by(Student.name)
+        query.page_after(('S1', 7), 5)
+        self.assertEqual(db.last_sql, '''SELECT "s"."id", "s"."name", "s"."age", "s"."group", "s"."rating"
+FROM "Student" "s"
+WHERE ("s"."name" > ? OR "s"."name" = ? AND "s"."id" > ?)
+ORDER BY "s"."name", "s"."id"
+LIMIT 5''')
+
+    def test_row_value_condition(self):
+        translator_cls = db.provider.translator_cls
+        translator_cls.row_value_syntax = True
+        try:
+            query = Student.select().order_by(desc(Student.age))
+            page = query.page_after((20, 15), 3)
+        finally: translator_cls.row_value_syntax = False
+        self.assertEqual(db.last_sql, '''SELECT "s"."id", "s"."name", "s"."age", "s"."group", "s"."rating"
+FROM "Student" "s"
+WHERE ("s"."age", "s"."id") < (?, ?)
+ORDER BY "s"."age" DESC, "s"."id" DESC
+LIMIT 3''')
+        self.assertEqual([ s.id for s in page ], [11, 7, 3])
+
+    @raises_exception(TypeError, 'Keyset pagination requires query to be ordered by attributes of entity Student')
+    def test_expression_order(self):
+        Student.select().order_by(lambda s: s.age + 1).page_after(None)
+
+    @raises_exception(TypeError, 'Keyset pagination is limited to queries which return simple list of objects')
+    def test_non_entity_query(self):
+        select(s.name for s in Student).page_after(None)
+
+    @raises_exception(TypeError, 'Page key should be a tuple of 2 values. Got: (1,)')
+    def test_key_length(self):
+        Student.select().order_by(Student.age).page_after((1,))
+
+    def test_nullable_order(self):
+        query = Student.select().order_by(Student.rating)
+        expected = sorted(Student.select()[:], key=lambda s: (s.rating is not None, s.rating, s.id))
+        self.assertEqual(self.all_pages(query, 3), expected)
+        query = Student.select().order_by(desc(Student.rating))
+        expected = sorted(Student.select()[:], key=lambda s: (s.rating is None, -(s.rating or 0), -s.id))
+        self.assertEqual(self.all_pages(query, 3, use_keys=True), expected)
+
+    def test_null_key_condition(self):
+        query = Student.select().order_by(Student.rating)
+        query.page_after((None, 2), 5)
+        self.assertEqual(db.last_sql, '''SELECT "s"."id", "s"."name", "s"."age", "s"."group", "s"."rating"
+FROM "Student" "s"
+WHERE ("s"."rating" IS NOT NULL OR "s"."rating" IS NULL AND "s"."id" > ?)
+ORDER BY "s"."rating", "s"."id"
+LIMIT 5''')
+
+    def test_nulls_sort_last(self):
+        translator_cls = db.provider.translator_cls
+        translator_cls.nulls_sort_first = False
+        try:
+            query = Student.select(lambda s: s.age > 0).order_by(Student.rating)  # not cached by other tests
+            query.page_after((4, 5), 5)
+            sql = db.last_sql
+            query.page_after((None, 2), 5)
+        finally: translator_cls.nulls_sort_first = True
+        self.assertEqual(sql, '''SELECT "s"."id", "s"."name", "s"."age", "s"."group", "s"."rating"
+FROM "Student" "s"
+WHERE "s"."age" > 0
+  AND ("s"."rating" > ? OR "s"."rating" IS NULL OR "s"."rating" = ? AND "s"."id" > ?)
+ORDER BY "s"."rating", "s"."id"
+LIMIT 5''')
+        self.assertEqual(db.last_sql, '''SELECT "s"."id", "s"."name", "s"."age", "s"."group", "s"."rating"
+FROM "Student" "s"
+WHERE "s"."age" > 0
+  AND "s"."rating" IS NULL
+  AND "s"."id" > ?
+ORDER BY "s"."rating", "s"."id"
+LIMIT 5''')
+
+    @raises_exception(ValueError, 'Page key value for non-nullable attribute Student.age cannot be None. Got: (None, 2)')
+    def test_null_key_for_required_attribute(self):
+        Student.select().order_by(Student.age).page_after((None, 2))
+
+if __name__ == '__main__':
+    unittest.main()
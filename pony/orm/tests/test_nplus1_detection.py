@@ -0,0 +1,106 @@
+from __future__ import absolute_import, print_function, division
+
+import unittest
+
+from pony import options
+from pony.orm.core import *
+from pony.orm.tests.testutils import *
+
+db = Database('sqlite', ':memory:')
+
+class Student(db.Entity):
+    name = Required(unicode)
+    bio = Optional(LongUnicode)
+    passport = Optional('Passport')
+    marks = Set('Mark', lazy=True)
+
+class Passport(db.Entity):
+    number = Required(unicode)
+    student = Required(Student)
+
+class Mark(db.Entity):
+    value = Required(int)
+    student = Required(Student)
+
+db.generate_mapping(create_tables=True)
+
+with db_session:
+    for i in range(1, 11):
+        s = Student(id=i, name='S%d' % i, bio='Bio %d' % i)
+        Passport(number='P%d' % i, student=s)
+        Mark(value=i, student=s)
+
+def query_count():
+    db.merge_local_stats()
+    return sum(stat.db_count for stat in db.global_stats.values())
+
+def read_bios(min_id=2):
+    return [ s.bio for s in select(s for s in Student if s.id > min_id) ]
+
+class TestNPlusOneDetection(unittest.TestCase):
+    def setUp(self):
+        options.NPLUS1_DETECTION = True
+        db.clear_nplus1_stats()
+        db._global_stats.clear()
+        rollback()
+        db_session.__enter__()
+
+    def tearDown(self):
+        rollback()
+        db_session.__exit__()
+        options.NPLUS1_DETECTION = False
+        options.AUTO_PREFETCH = False
+
+    def test_lazy_attribute_report(self):
+        read_bios()
+        report = db.nplus1_report()
+        self.assertEqual(len(report), 1)
+        stat = report[0]
+        self.assertEqual(stat.entity, Student)
+        self.assertEqual((stat.executions, stat.objects), (1, 8))
+        self.assertEqual(stat.nplus1_attrs, [ Student.bio ])
+        self.assertEqual(stat.loads[Student.bio], 8)
+
+    def test_reverse_one_to_one(self):
+        numbers = [ s.passport.number for s in Student.select() ]
+        self.assertEqual(len(numbers), 10)
+        self.assertEqual(db.nplus1_report()[0].nplus1_attrs, [ Student.passport ])
+
+    def test_lazy_collection(self):
+        for s in Student.select(): list(s.marks)
+        self.assertEqual(db.nplus1_report()[0].nplus1_attrs, [ Student.marks ])
+
+    def test_rare_loads_are_not_reported(self):
+        students = Student.select().order_by(Student.id)[:]
+        students[0].bio
+        self.assertEqual(db.nplus1_report(), [])
+
+    def test_detection_is_disabled(self):
+        rollback()
+        db_session.__exit__()
+        options.NPLUS1_DETECTION = False
+        db_session.__enter__()
+        read_bios()
+        self.assertEqual(db.nplus1_report(), [])
+
+    def test_auto_prefetch(self):
+        options.AUTO_PREFETCH = True
+        count = query_count()
+        self.assertEqual(read_bios(), [ 'Bio %d' % i for i in range(3, 11) ])
+        self.assertEqual(query_count() - count, 9)
+        rollback()
+        count = query_count()
+        self.assertEqual(read_bios(), [ 'Bio %d' % i for i in range(3, 11) ])
+        self.assertEqual(query_count() - count, 1)
+        self.assertEqual(db.nplus1_report()[0].prefetched, { Student.bio })
+
+    def test_auto_prefetch_with_other_filter_values(self):
+        options.AUTO_PREFETCH = True
+        read_bios()
+        rollback()
+        count = query_count()
+        self.assertEqual(len(read_bios(5)), 5)
+        self.assertEqual(query_count() - count, 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,196 @@
+from __future__ import absolute_import, print_function, division
+
+import unittest
+
+from pony.orm.core import *
+from pony.orm.core import can_view, can_edit
+from pony.orm.tests.testutils import *
+
+db = Database('sqlite', ':memory:')
+
+class User(db.Entity):
+    name = Required(unicode)
+    is_admin = Required(bool, default=False)
+    documents = Set('Document')
+
+class Document(db.Entity):
+    title = Required(unicode)
+    owner = Required(User)
+    secret = Optional(unicode)
+    is_public = Required(bool, default=False)
+
+class Log(db.Entity):
+    text = Required(unicode)
+
+class Memo(db.Entity):
+    text = Required(unicode)
+
+class Note(db.Entity):
+    text = Required(unicode)
+
+db.generate_mapping(create_tables=True)
+
+draft_title = 'D2'
+
+@user_groups_getter(User)
+def get_groups(user):
+    if user.is_admin: return 'admin'
+
+@user_roles_getter(User, Document)
+def get_roles(user, doc):
+    if doc.owner is user: return 'owner'
+
+@obj_labels_getter(Document)
+def get_labels(doc):
+    if doc.is_public: return 'public'
+
+user_role_condition(User, Document, 'owner', lambda doc: doc.owner == user)
+obj_label_condition(Document, 'public', 'lambda doc: doc.is_public')
+obj_label_condition(Document, 'draft', lambda doc: doc.title == draft_title)
+
+def make_text_condition(text):
+    return lambda note: note.text == text
+
+obj_label_condition(Note, 'first', make_text_condition('N1'))
+obj_label_condition(Note, 'second', make_text_condition('N2'))
+
+with db.set_perms_for(User, Document, Log):
+    perm('view', group='admin')
+    perm('edit', group='admin').exclude(Log)
+with db.set_perms_for(Document):
+    perm('view', label='public').exclude(Document.secret)
+    perm('view', label='draft').exclude(Document.secret)
+    perm('edit', role='owner')
+with db.set_perms_for(Memo):
+    perm('view', role='owner')
+with db.set_perms_for(Note):
+    perm('view', label='first')
+    perm('view', label='second')
+
+with db_session:
+    u1 = User(id=1, name='John', is_admin=True)
+    u2 = User(id=2, name='Mike')
+    Document(id=1, title='D1', owner=u1, secret='S1')
+    Document(id=2, title='D2', owner=u2, is_public=True)
+    Document(id=3, title='D3', owner=u1, is_public=True)
+    Log(text='L1')
+    for i in range(1, 4): Note(id=i, text='N%d' % i)
+
+class TestPermissions(unittest.TestCase):
+    def setUp(self):
+        rollback()
+        db_session.__enter__()
+
+    def tearDown(self):
+        rollback()
+        db_session.__exit__()
+
+    def test_entity(self):
+        admin, user = User[1], User[2]
+        self.assertTrue(has_perm(admin, 'edit', User))
+        self.assertFalse(has_perm(admin, 'edit', Log))
+        self.assertTrue(has_perm(user, 'view', Document))
+        self.assertFalse(has_perm(user, 'view', User))
+        self.assertFalse(has_perm(user, 'delete', Document))
+
+    def test_attribute(self):
+        admin, user = User[1], User[2]
+        self.assertTrue(has_perm(admin, 'view', Document.secret))
+        self.assertFalse(has_perm(user, 'view', Document.secret))
+        self.assertTrue(has_perm(user, 'view', Document.title))
+        self.assertFalse(has_perm(user, 'view', User.name))
+        self.assertTrue(has_perm(user, 'view', User.documents))  # reverse attribute Document.owner is viewable
+
+    def test_object(self):
+        admin, user = User[1], User[2]
+        d1, d2, d3 = Document[1], Document[2], Document[3]
+        self.assertEqual([ can_view(user, d) for d in (d1, d2, d3) ], [ False, True, True ])
+        self.assertEqual([ can_edit(user, d) for d in (d1, d2, d3) ], [ False, True, False ])
+        self.assertEqual([ can_edit(admin, d) for d in (d1, d2, d3) ], [ True, True, True ])
+        self.assertFalse(can_edit(admin, Log[1]))
+
+    def test_perm_cache(self):
+        user = User[2]
+        d1, d2 = Document[1], Document[2]
+        self.assertTrue(can_edit(user, d2))
+        self.assertFalse(can_edit(user, d1))
+        perm_cache = db._get_cache().perm_cache[user]['edit']
+        self.assertEqual(perm_cache, {d1: False, d2: True})
+
+    def test_perm_matrix(self):
+        user = User[2]
+        has_perm(user, 'view', Document)
+        entry = Document._perm_matrix_['view', get_user_groups(user)]
+        self.assertEqual(entry[0], True)
+        self.assertEqual(set(entry[2]), {(frozenset(), frozenset(['public'])),
+                                         (frozenset(), frozenset(['draft']))})
+        with db.set_perms_for(Log):
+            perm('view', group='nobody')
+        self.assertEqual(Document._perm_matrix_, {})
+
+    def test_filter_viewable(self):
+        admin, user = User[1], User[2]
+        objects = Document.select().order_by(Document.id)[:] + [ Log[1], admin ]
+        self.assertEqual([ obj.id for obj in filter_viewable(user, objects) ], [ 2, 3 ])
+        self.assertEqual(filter_viewable(admin, objects), objects)
+        self.assertEqual([ obj.id for obj in filter_viewable(None, objects) ], [ 2, 3 ])
+
+    @raises_exception(TypeError, 'Entity instance expected. Got: 1')
+    def test_filter_viewable_wrong_type(self):
+        filter_viewable(User[1], [ 1 ])
+
+class TestPermissionPushdown(unittest.TestCase):
+    def setUp(self):
+        rollback()
+        db_session.__enter__()
+
+    def tearDown(self):
+        set_current_user(None)
+        rollback()
+        db_session.__exit__()
+
+    def test_labels(self):
+        query = Document.select().filter_viewable(User[2]).order_by(Document.id)
+        self.assertEqual([ doc.id for doc in query ], [ 2, 3 ])
+        self.assertTrue('"is_public"' in db.last_sql)
+
+    def test_roles_and_labels(self):
+        global draft_title
+        query = select(d for d in Document).filter_viewable(User[1])
+        self.assertEqual(set(doc.id for doc in query), {1, 2, 3})  # admin
+        query = select(d for d in Document).filter_viewable(User[2]).order_by(Document.id)
+        self.assertEqual([ doc.id for doc in query ], [ 2, 3 ])
+        Document[3].is_public = False
+        self.assertEqual([ doc.id for doc in query ], [ 2 ])  # owner can edit the document
+        draft_title = 'D1'
+        try:
+            query = select(d for d in Document).filter_viewable(User[2]).order_by(Document.id)
+            self.assertEqual([ doc.id for doc in query ], [ 1, 2 ])
+        finally: draft_title = 'D2'
+
+    def test_current_user(self):
+        set_current_user(User[2])
+        self.assertEqual(Document.select().filter_viewable().count(), 2)
+
+    def test_closures_from_one_factory(self):
+        query = Note.select().filter_viewable(User[2]).order_by(Note.id)
+        self.assertEqual([ note.text for note in query ], [ 'N1', 'N2' ])
+
+    def test_nothing_is_viewable(self):
+        self.assertEqual(Log.select().filter_viewable(User[2])[:], [])
+
+    def test_everything_is_viewable(self):
+        query = Log.select()
+        self.assertTrue(query.filter_viewable(User[1]) is query)
+
+    @raises_exception(TypeError, "Role 'owner' cannot be checked in SQL for entity Memo. "
+                                 "Use user_role_condition() to declare it")
+    def test_undeclared_role(self):
+        Memo.select().filter_viewable(User[2])
+
+    @raises_exception(TypeError, 'filter_viewable() method can be applied only to query which returns entity instances')
+    def test_not_entity_query(self):
+        select(d.title for d in Document).filter_viewable(User[2])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+from __future__ import absolute_import, print_function, division
+
+import os, shutil, tempfile, unittest
+
+from pony.orm.core import *
+from pony.orm.querycache import LazyTranslator
+from pony.orm.tests.testutils import *
+
+def define_entities(db):
+    class Person(db.Entity):
+        name = Required(unicode)
+        age = Required(int)
+        group = Optional('Group')
+
+    class Group(db.Entity):
+        number = PrimaryKey(int)
+        persons = Set(Person)
+
+def populate(db):
+    with db_session:
+        g = db.Group(number=101)
+        db.Person(name='John', age=20, group=g)
+        db.Person(name='Mike', age=30, group=g)
+        db.Person(name='Mary', age=40)
+
+def adults_query(db, min_age):
+    return select(p for p in db.Person if p.age >= min_age).order_by(lambda p: p.name)
+
+class TestPersistentQueryCache(unittest.TestCase):
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dirname, 'queries.cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def make_db(self):
+        db = Database('sqlite', ':memory:')
+        define_entities(db)
+        db.generate_mapping(create_tables=True)
+        populate(db)
+        db.set_persistent_query_cache(self.filename, autosave=False)
+        return db
+
+    def test_reuse_after_restart(self):
+        db1 = self.make_db()
+        with db_session:
+            result1 = [ p.name for p in adults_query(db1, 25) ]
+            group = db1.Group[101]
+            self.assertEqual(select(p.name for p in db1.Person if p.group == group)[:], ['John', 'Mike'])
+        db1.persistent_query_cache.save()
+        self.assertTrue(os.path.exists(self.filename))
+
+        db2 = self.make_db()
+        with db_session:
+            result2 = [ p.name for p in adults_query(db2, 35) ]
+            group = db2.Group[101]
+            self.assertEqual(select(p.name for p in db2.Person if p.group == group)[:], ['John', 'Mike'])
+        self.assertEqual(result1, ['Mary', 'Mike'])
+        self.assertEqual(result2, ['Mary'])
+        self.assertEqual(db2.persistent_query_cache.hits, 2)
+        self.assertEqual(db2.persistent_query_cache.misses, 0)
+
+    def test_translation_is_skipped_after_restart(self):
+        db1 = self.make_db()
+        with db_session:
+            adults_query(db1, 25)[:]
+            select((p.name, p.age) for p in db1.Person if p.age > 25)[:]
+        db1.persistent_query_cache.save()
+
+        db2 = self.make_db()
+        with db_session:
+            query = adults_query(db2, 35)
+            self.assertEqual([ p.name for p in query ], ['Mary'])
+            self.assertTrue(isinstance(query._translator, LazyTranslator))
+            self.assertTrue(query._translator.real_translator is None)
+            query = select((p.name, p.age) for p in db2.Person if p.age > 25)
+            self.assertEqual(sorted(query), [('Mary', 40), ('Mike', 30)])
+            self.assertTrue(query._translator.real_translator is None)
+        self.assertEqual(db2.persistent_query_cache.translator_hits, 3)
+        self.assertEqual(db2.persistent_query_cache.translator_misses, 0)
+
+    def test_lazy_translator_is_built_on_demand(self):
+        db1 = self.make_db()
+        with db_session: adults_query(db1, 25)[:]
+        db1.persistent_query_cache.save()
+
+        db2 = self.make_db()
+        with db_session:
+            query = adults_query(db2, 25)
+            self.assertEqual(query.filter(lambda p: p.group.number == 101)[:], [db2.Person[2]])
+            self.assertTrue(query._translator.real_translator is not None)
+
+    def test_schema_change(self):
+        db1 = self.make_db()
+        with db_session: adults_query(db1, 25)[:]
+        db1.persistent_query_cache.save()
+
+        db2 = Database('sqlite', ':memory:')
+        define_entities(db2)
+        class Extra(db2.Entity):
+            name = Required(unicode)
+        db2.generate_mapping(create_tables=True)
+        populate(db2)
+        db2.set_persistent_query_cache(self.filename, autosave=False)
+        with db_session: self.assertEqual(len(adults_query(db2, 25)), 2)
+        self.assertEqual(db2.persistent_query_cache.hits, 0)
+        self.assertEqual(db2.persistent_query_cache.misses, 1)
+
+    def test_header_does_not_depend_on_permissions(self):
+        db1 = self.make_db()
+        with db_session: adults_query(db1, 25)[:]
+        db1.persistent_query_cache.save()
+
+        db2 = self.make_db()
+        with db2.set_perms_for(db2.Person):
+            perm('view', group='anybody')
+        self.assertEqual(db2.persistent_query_cache._get_header(), db1.persistent_query_cache.header)
+        with db_session: self.assertEqual(len(adults_query(db2, 25)), 2)
+        self.assertEqual(db2.persistent_query_cache.hits, 1)
+
+    def test_for_update_is_not_persisted(self):
+        db = self.make_db()
+        with db_session: adults_query(db, 25).for_update()[:]
+        self.assertFalse(db.persistent_query_cache.entries)
+        self.assertEqual(db.persistent_query_cache.misses, 0)
+
+if __name__ == '__main__':
+    unittest.main()
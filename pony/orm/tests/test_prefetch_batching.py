@@ -0,0 +1,107 @@
+from __future__ import absolute_import, print_function, division
+
+import unittest
+
+from pony.orm.core import *
+from pony.orm.tests.testutils import *
+
+db = Database('sqlite', ':memory:')
+
+class Customer(db.Entity):
+    name = Required(unicode)
+    address = Optional('Address')
+    orders = Set('Order')
+    notes = Optional(LongUnicode)
+
+class Address(db.Entity):
+    city = Required(unicode)
+    customer = Required(Customer)
+
+class Order(db.Entity):
+    customer = Required(Customer)
+    items = Set('Item')
+    tags = Set('Tag')
+
+class Item(db.Entity):
+    order = Required(Order)
+    price = Required(int)
+
+class Tag(db.Entity):
+    name = Required(unicode)
+    orders = Set(Order)
+
+db.generate_mapping(create_tables=True)
+
+with db_session:
+    tags = [ Tag(name='T%d' % i) for i in range(3) ]
+    for i in range(1, 31):
+        c = Customer(id=i, name='C%d' % i, notes='Notes %d' % i)
+        if i % 2: Address(city='City %d' % i, customer=c)
+        for j in range(2):
+            o = Order(customer=c, tags=tags[j:])
+            Item(order=o, price=i)
+
+def query_count():
+    db.merge_local_stats()
+    return sum(stat.db_count for stat in db.global_stats.values())
+
+class TestPrefetchBatching(unittest.TestCase):
+    def setUp(self):
+        db._global_stats.clear()
+        rollback()
+        db_session.__enter__()
+
+    def tearDown(self):
+        rollback()
+        db_session.__exit__()
+
+    def test_to_one_path(self):
+        count = query_count()
+        orders = Order.select().prefetch('customer.address')[:]
+        self.assertEqual(query_count() - count, 3)
+        self.assertEqual(len(orders), 60)
+        cities = [ o.customer.address.city if o.customer.address else None for o in orders ]
+        self.assertEqual(query_count() - count, 3)
+        self.assertEqual(cities[0], 'City 1')
+        self.assertEqual(cities[2], None)
+
+    def test_collections(self):
+        count = query_count()
+        customers = Customer.select().prefetch(Customer.orders, 'orders.items', Order.tags)[:]
+        self.assertEqual(query_count() - count, 5)
+        self.assertEqual(sum(item.price for c in customers for o in c.orders for item in o.items), 930)
+        self.assertEqual(sum(len(o.tags) for c in customers for o in c.orders), 150)
+        self.assertEqual(set(tag.name for c in customers for o in c.orders for tag in o.tags), {'T0', 'T1', 'T2'})
+        self.assertEqual(query_count() - count, 5)
+
+    def test_lazy_attribute(self):
+        count = query_count()
+        orders = Order.select().prefetch('customer.notes')[:]
+        self.assertEqual(query_count() - count, 3)
+        self.assertEqual(set(o.customer.notes for o in orders), set('Notes %d' % i for i in range(1, 31)))
+        self.assertEqual(query_count() - count, 3)
+
+    def test_batches(self):
+        db.provider.max_params_count, max_params_count = 7, db.provider.max_params_count
+        try:
+            count = query_count()
+            customers = Customer.select().prefetch(Customer.orders)[:]
+            self.assertEqual(query_count() - count, 1 + 5)
+        finally: db.provider.max_params_count = max_params_count
+        self.assertEqual(sum(len(c.orders) for c in customers), 60)
+
+    def test_prefetched_query_is_not_changed(self):
+        query = Order.select().prefetch(Order.customer)
+        query.prefetch('customer.address')
+        self.assertEqual(query._attrs_to_prefetch_dict[Customer], set())
+
+    @raises_exception(AttributeError, 'Entity Customer does not have attribute zip')
+    def test_unknown_attribute(self):
+        Order.select().prefetch('customer.zip')
+
+    @raises_exception(TypeError, "Attribute Customer.name in prefetch path 'customer.name.x' is not a relationship")
+    def test_non_relation_in_path(self):
+        Order.select().prefetch('customer.name.x')
+
+if __name__ == '__main__':
+    unittest.main()
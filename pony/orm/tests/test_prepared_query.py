@@ -0,0 +1,86 @@
+from __future__ import absolute_import, print_function, division
+
+import unittest
+
+from pony.orm.core import *
+from pony.orm.tests.testutils import *
+
+db = Database('sqlite', ':memory:')
+
+class Student(db.Entity):
+    name = Required(unicode)
+    age = Required(int)
+    group = Required('Group')
+
+class Group(db.Entity):
+    number = PrimaryKey(int)
+    students = Set(Student)
+
+db.generate_mapping(create_tables=True)
+
+with db_session:
+    g1 = Group(number=1)
+    g2 = Group(number=2)
+    Student(id=1, name='A', age=20, group=g1)
+    Student(id=2, name='B', age=22, group=g1)
+    Student(id=3, name='C', age=24, group=g2)
+
+def students_of(group):
+    return select(s for s in Student if s.group == group)
+
+class TestPreparedQuery(unittest.TestCase):
+    def setUp(self):
+        rollback()
+        db_session.__enter__()
+    def tearDown(self):
+        rollback()
+        db_session.__exit__()
+    def test_simple(self):
+        q = db.compile(lambda min_age: select(s.name for s in Student if s.age >= min_age).order_by(1))
+        self.assertEqual(q(21), ['B', 'C'])
+        self.assertEqual(q(min_age=23), ['C'])
+        self.assertEqual(q(25), [])
+        self.assertTrue(q._extractors is not None)
+    def test_filter(self):
+        q = db.compile(lambda x, y: select(s for s in Student if s.age > x).filter(lambda s: s.name != y).order_by(Student.id))
+        self.assertEqual(q(19, 'A'), [Student[2], Student[3]])
+        self.assertEqual(q(19, 'C'), [Student[1], Student[2]])
+        self.assertEqual(q(y='B', x=20), [Student[3]])
+    def test_default_and_closure(self):
+        delta = 1
+        q = db.compile(lambda age=20: select(s.name for s in Student if s.age == age + delta))
+        self.assertEqual(q(), [])
+        self.assertEqual(q(21), ['B'])
+    def test_entity_param(self):
+        q = db.compile(lambda g: select(s.name for s in Student if s.group == g).order_by(1))
+        self.assertEqual(q(Group[1]), ['A', 'B'])
+        self.assertEqual(q(Group[2]), ['C'])
+    def test_type_change(self):
+        q = db.compile(lambda x: select(s.name for s in Student if s.age in x).order_by(1))
+        self.assertEqual(q([20, 24]), ['A', 'C'])
+        self.assertEqual(q([22]), ['B'])
+        self.assertEqual(q(x=(20, 22, 24)), ['A', 'B', 'C'])
+    def test_query_outside_of_function(self):
+        q = db.compile(lambda g: students_of(g))
+        self.assertEqual(set(q(Group[1])), {Student[1], Student[2]})
+        self.assertEqual(q._extractors, None)
+        self.assertEqual(q(Group[2]), [Student[3]])
+    def test_get_query(self):
+        q = db.compile(lambda x: select(s for s in Student if s.age > x))
+        self.assertEqual(q.get_query(21).count(), 2)
+        self.assertEqual(q.get_query(22).count(), 1)
+    @raises_exception(TypeError, "Missing value for argument 'x'")
+    def test_missing_argument(self):
+        q = db.compile(lambda x: select(s for s in Student if s.age > x))
+        q()
+    @raises_exception(TypeError, "Unexpected keyword argument 'z'")
+    def test_unexpected_argument(self):
+        q = db.compile(lambda x: select(s for s in Student if s.age > x))
+        q(1, z=2)
+    @raises_exception(TypeError, 'Prepared query function must return Query object. Got: 1')
+    def test_not_a_query(self):
+        q = db.compile(lambda x: 1)
+        q(1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+from __future__ import absolute_import, print_function, division
+
+import unittest
+from decimal import Decimal
+
+from pony.orm.core import *
+from pony.orm.tests.testutils import *
+
+db = Database('sqlite', ':memory:')
+
+class Group(db.Entity):
+    number = PrimaryKey(int)
+    students = Set('Student')
+
+class Student(db.Entity):
+    name = Required(unicode)
+    age = Required(int)
+    gpa = Optional(Decimal, 3, 1)
+    group = Required(Group)
+
+db.generate_mapping(create_tables=True)
+
+with db_session:
+    g1 = Group(number=1)
+    g2 = Group(number=2)
+    Student(id=1, name='S1', age=20, gpa=Decimal('3.1'), group=g1)
+    Student(id=2, name='S2', age=21, gpa=Decimal('3.5'), group=g1)
+    Student(id=3, name='S3', age=21, group=g2)
+    Student(id=4, name='S4', age=23, gpa=Decimal('4.0'), group=g2)
+
+class TestQueryAggregate(unittest.TestCase):
+    def setUp(self):
+        rollback()
+        db_session.__enter__()
+
+    def tearDown(self):
+        rollback()
+        db_session.__exit__()
+
+    def test_single_round_trip(self):
+        query = select(s.age for s in Student if s.age > 20)
+        db.merge_local_stats()
+        result = query.aggregate(n=count, total=sum, lo=min, hi=max, mean=avg)
+        self.assertEqual(sum(stat.db_count for stat in db.local_stats.values()), 1)
+        self.assertEqual(result._fields, ('hi', 'lo', 'mean', 'n', 'total'))
+        self.assertEqual((result.n, result.total), (2, 65))
+        self.assertEqual(result.n, query.count())
+        self.assertEqual(result.total, query.sum())
+        self.assertEqual((result.lo, result.hi), (query.min(), query.max()))
+        self.assertEqual(result.mean, query.avg())
+
+    def test_string_names(self):
+        result = select(s.gpa for s in Student).aggregate(hi='max', lo='MIN')
+        self.assertEqual(result, (Decimal('4.0'), Decimal('3.1')))
+        self.assertEqual(type(result.hi), Decimal)
+
+    def test_entity_count(self):
+        result = Student.select(lambda s: s.group.number == 2).aggregate(n=count)
+        self.assertEqual(result.n, 2)
+        self.assertEqual(db.last_sql, '''SELECT COUNT(*)
+FROM "Student" "s"
+WHERE "s"."group" = 2''')
+
+    def test_tuple_elements(self):
+        result = select((s.name, s.age) for s in Student).aggregate(n=count, total=(sum, 2), names=(count, 1))
+        self.assertEqual(result, (4, 4, 85))
+
+    def test_grouped_query(self):
+        query = select((s.group, count(s), sum(s.age)) for s in Student)
+        result = query.aggregate(groups=count, total=(sum, 3), largest=(max, 2))
+        self.assertEqual(result, (2, 2, 85))
+
+    def test_empty_result(self):
+        result = select(s.age for s in Student if s.age > 100).aggregate(n=count, total=sum, hi=max)
+        self.assertEqual(result, (None, 0, 0))
+
+    def test_query_results_cache(self):
+        query = select(s.age for s in Student)
+        result = query.aggregate(n=count, total=sum)
+        db.merge_local_stats()
+        self.assertEqual(query.aggregate(n=count, total=sum), result)
+        stats = db.local_stats
+        self.assertEqual(sum(stat.db_count for stat in stats.values()), 0)
+        self.assertEqual(sum(stat.cache_count for stat in stats.values()), 0)
+        Student[1].age = 30
+        self.assertEqual(query.aggregate(n=count, total=sum).total, 95)
+
+    @raises_exception(TypeError, "'sum' is valid for numeric attributes only")
+    def test_non_numeric(self):
+        select(s.name for s in Student).aggregate(total=sum)
+
+    @raises_exception(TypeError, "Attribute should be specified for 'max' aggregate function")
+    def test_entity_max(self):
+        Student.select().aggregate(hi=max)
+
+    @raises_exception(TypeError, "Aggregate function should be one of count, sum, avg, min or max. Got: x=%r" % len)
+    def test_unknown_function(self):
+        Student.select().aggregate(x=len)
+
+    @raises_exception(IndexError, 'Invalid element number 3 (query result is list of tuples with only 2 elements in each)')
+    def test_invalid_element(self):
+        select((s.name, s.age) for s in Student).aggregate(total=(sum, 3))
+
+    @raises_exception(TypeError, 'aggregate() method requires at least one keyword argument')
+    def test_no_arguments(self):
+        Student.select().aggregate()
+
+if __name__ == '__main__':
+    unittest.main()
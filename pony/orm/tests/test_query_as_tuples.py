@@ -0,0 +1,106 @@
+from __future__ import absolute_import, print_function, division
+
+import unittest
+from datetime import date
+from decimal import Decimal
+
+from pony.orm.core import *
+from pony.orm.tests.testutils import *
+
+db = Database('sqlite', ':memory:')
+
+class Group(db.Entity):
+    number = PrimaryKey(int)
+    students = Set('Student')
+
+class Student(db.Entity):
+    name = Required(unicode)
+    gpa = Optional(Decimal, 3, 1)
+    dob = Optional(date)
+    group = Optional(Group)
+    bio = Optional(LongUnicode)
+    marks = Set('Mark')
+
+class Mark(db.Entity):
+    student = Required(Student)
+    subject = Required(unicode)
+    value = Required(int)
+    PrimaryKey(student, subject)
+
+class Product(db.Entity):
+    name = Required(unicode)
+    info = Optional(Json)
+
+db.generate_mapping(create_tables=True)
+
+with db_session:
+    g1 = Group(number=1)
+    g2 = Group(number=2)
+    s1 = Student(id=1, name='S1', gpa=Decimal('3.1'), dob=date(2000, 1, 1), group=g1, bio='Long text')
+    s2 = Student(id=2, name='S2', group=g1)
+    s3 = Student(id=3, name='S3', gpa=Decimal('4.0'), group=g2)
+    Mark(student=s1, subject='Math', value=5)
+    Mark(student=s2, subject='Math', value=4)
+    Product(id=1, name='P1', info={'colors': ['red', 'green'], 'size': 10})
+    Product(id=2, name='P2')
+
+class TestQueryAsTuples(unittest.TestCase):
+    def setUp(self):
+        rollback()
+        db_session.__enter__()
+
+    def tearDown(self):
+        rollback()
+        db_session.__exit__()
+
+    def test_values(self):
+        rows = select(s for s in Student).order_by(Student.id).as_tuples()[:]
+        self.assertEqual(rows[0]._fields, ('id', 'name', 'gpa', 'dob', 'group'))
+        self.assertEqual(rows[0], (1, 'S1', Decimal('3.1'), date(2000, 1, 1), 1))
+        self.assertEqual(rows[1], (2, 'S2', None, None, 1))
+        self.assertEqual(type(rows[0].gpa), Decimal)
+        self.assertEqual(rows[2].group, 2)
+
+    def test_json_values(self):
+        rows = Product.select().order_by(Product.id).as_tuples()[:]
+        self.assertEqual(rows[0].info, {'colors': ['red', 'green'], 'size': 10})
+        self.assertEqual(rows[0].info, Product[1].info)
+        self.assertEqual(rows[1].info, None)
+
+    def test_session_cache_is_not_used(self):
+        rows = select(s for s in Student if s.gpa > 3).as_tuples()[:]
+        self.assertEqual(sorted(row.name for row in rows), ['S1', 'S3'])
+        cache = db._get_cache()
+        self.assertEqual(cache.objects, set())
+        self.assertEqual(cache.seeds[Student._pk_attrs_], set())
+
+    def test_composite_primary_key(self):
+        rows = Mark.select().order_by(Mark.value).as_tuples()[:]
+        self.assertEqual(rows, [ (2, 'Math', 4), (1, 'Math', 5) ])
+
+    def test_lazy_attribute_prefetch(self):
+        row = Student.select(lambda s: s.id == 1).prefetch(Student.bio).as_tuples()[:][0]
+        self.assertEqual(row.bio, 'Long text')
+
+    def test_primary_key_only_query(self):
+        rows = select(g for g in Group if count(g.students) > 1).as_tuples()[:]
+        self.assertEqual(rows, [ (1,) ])
+        self.assertEqual(db._get_cache().objects, set())
+
+    def test_objects_and_tuples(self):
+        query = select(s for s in Student if s.id == 2)
+        self.assertEqual(query.as_tuples()[:][0].name, 'S2')
+        self.assertEqual(query[:], [ Student[2] ])
+        self.assertEqual(query.as_tuples().first().name, 'S2')
+
+    def test_stream(self):
+        names = [ row.name for row in Student.select().order_by(Student.id).as_tuples().stream(chunk_size=2) ]
+        self.assertEqual(names, ['S1', 'S2', 'S3'])
+        self.assertEqual(db._get_cache().objects, set())
+
+    @raises_exception(TypeError, 'as_tuples() method can be applied only to queries which return entity objects')
+    def test_non_entity_query(self):
+        select(s.name for s in Student).as_tuples()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+from __future__ import absolute_import, print_function, division
+
+import unittest
+
+from pony.orm.core import *
+from pony.orm.tests.testutils import *
+from pony.utils import LRUCache
+
+class TestLRUCache(unittest.TestCase):
+    def test_eviction(self):
+        cache = LRUCache(2)
+        cache['a'] = 1
+        cache['b'] = 2
+        self.assertEqual(cache.get('a'), 1)
+        cache['c'] = 3
+        self.assertEqual(len(cache), 2)
+        self.assertTrue('a' in cache)
+        self.assertFalse('b' in cache)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.stats, dict(size=2, maxsize=2, hits=1, misses=1, evictions=1))
+    def test_resize(self):
+        cache = LRUCache()
+        for i in range(10): cache[i] = i
+        cache.resize(3)
+        self.assertEqual(list(cache), [7, 8, 9])
+        self.assertEqual(cache.evictions, 7)
+    def test_zero_size(self):
+        cache = LRUCache(0)
+        cache['a'] = 1
+        self.assertEqual(len(cache), 0)
+        self.assertRaises(KeyError, lambda: cache['a'])
+    @raises_exception(ValueError, 'Cache size cannot be negative: -1')
+    def test_negative_size(self):
+        LRUCache(-1)
+
+class TestQueryCache(unittest.TestCase):
+    def setUp(self):
+        self.db = Database('sqlite', ':memory:')
+
+        class Person(self.db.Entity):
+            name = Required(unicode)
+            age = Required(int)
+
+        self.db.generate_mapping(create_tables=True)
+        with db_session:
+            for i in range(5): Person(name='P%d' % i, age=20 + i)
+
+    def tearDown(self):
+        self.db = None
+
+    @db_session
+    def test_limits(self):
+        db = self.db
+        Person = db.Person
+        db.set_query_cache_size(translator_cache_size=2, sql_cache_size=2)
+        for i in range(5):
+            self.assertEqual(select(p for p in Person).order_by(Person.id)[i:i+1][0].name, 'P%d' % i)
+        stats = db.query_cache_stats
+        self.assertEqual(stats['sql_cache']['size'], 2)
+        self.assertEqual(stats['sql_cache']['evictions'], 3)
+        self.assertTrue(stats['translator_cache']['size'] <= 2)
+
+    @db_session
+    def test_hits(self):
+        db = self.db
+        Person = db.Person
+        for i in range(3):
+            self.assertEqual(count(p for p in Person if p.age > 21), 3)
+        stats = db.query_cache_stats
+        self.assertEqual(stats['sql_cache']['misses'], 1)
+        self.assertEqual(stats['sql_cache']['hits'], 2)
+
+    @db_session
+    def test_clear(self):
+        db = self.db
+        Person = db.Person
+        select(p for p in Person)[:]
+        self.assertTrue(db.query_cache_stats['translator_cache']['size'] > 0)
+        db.clear_query_caches()
+        stats = db.query_cache_stats
+        self.assertEqual(stats['translator_cache']['size'], 0)
+        self.assertEqual(stats['sql_cache']['size'], 0)
+        self.assertEqual(stats['ast_cache']['size'], 0)
+        self.assertEqual(len(select(p for p in Person)[:]), 5)
+
+    @raises_exception(TypeError, "Unknown query cache option: 'foo'")
+    def test_unknown_option(self):
+        self.db.set_query_cache_size(foo=1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+from __future__ import absolute_import, print_function, division
+
+import unittest
+from datetime import date
+from decimal import Decimal
+
+from pony.orm.core import *
+from pony.orm.tests.testutils import *
+
+try: import numpy
+except ImportError: numpy = None
+
+db = Database('sqlite', ':memory:')
+
+class Group(db.Entity):
+    number = PrimaryKey(int)
+    students = Set('Student')
+
+class Student(db.Entity):
+    name = Required(unicode)
+    age = Required(int)
+    gpa = Optional(float)
+    dob = Optional(date)
+    scholarship = Optional(Decimal, 10, 2)
+    group = Optional(Group)
+
+class Product(db.Entity):
+    name = Required(unicode)
+    info = Optional(Json)
+
+db.generate_mapping(create_tables=True)
+
+with db_session:
+    g1 = Group(number=1)
+    g2 = Group(number=2)
+    Student(id=1, name='S1', age=20, gpa=3.1, dob=date(2000, 1, 1), scholarship=Decimal('100.50'), group=g1)
+    Student(id=2, name='S2', age=21, group=g1)
+    Student(id=3, name='S3', age=22, gpa=4.0, group=g2)
+    Product(id=1, name='P1', info={'colors': ['red', 'green'], 'size': 10})
+    Product(id=2, name='P2')
+
+class TestQueryColumns(unittest.TestCase):
+    def setUp(self):
+        rollback()
+        db_session.__enter__()
+
+    def tearDown(self):
+        rollback()
+        db_session.__exit__()
+
+    def test_entity_columns(self):
+        columns = Student.select().order_by(Student.id).to_columns(batch_size=2)
+        self.assertEqual(list(columns), ['id', 'name', 'age', 'gpa', 'dob', 'scholarship', 'group'])
+        self.assertEqual(columns['name'], ['S1', 'S2', 'S3'])
+        self.assertEqual(columns['gpa'], [3.1, None, 4.0])
+        self.assertEqual(columns['dob'], [date(2000, 1, 1), None, None])
+        self.assertEqual(columns['scholarship'], [Decimal('100.50'), None, None])
+        self.assertEqual(columns['group'], [1, 1, 2])
+        self.assertEqual(db._get_cache().objects, set())
+
+    def test_json_columns(self):
+        expected = [ {'colors': ['red', 'green'], 'size': 10}, None ]
+        columns = Product.select().order_by(Product.id).to_columns()
+        self.assertEqual(columns['info'], expected)
+        columns = select((p.name, p.info) for p in Product).order_by(1).to_columns()
+        self.assertEqual(columns['p.info'], expected)
+
+    def test_expression_columns(self):
+        columns = select((s.group, s.name, s.age * 2) for s in Student).order_by(2).to_columns()
+        self.assertEqual(list(columns), ['s.group', 's.name', 's.age * 2'])
+        self.assertEqual(columns['s.group'], [1, 1, 2])
+        self.assertEqual(columns['s.age * 2'], [40, 42, 44])
+
+    def test_duplicate_names(self):
+        columns = select((s.age, s.age) for s in Student if s.id == 1).to_columns()
+        self.assertEqual(columns, {'s.age': [20], 's.age_1': [20]})
+
+    def test_primary_key_only_query(self):
+        columns = select(g for g in Group if count(g.students) > 1).to_columns()
+        self.assertEqual(columns, {'number': [1]})
+
+    def test_blocking_cursor(self):
+        db.provider.server_side_cursor_blocks_connection = True
+        try:
+            columns = Student.select().order_by(Student.id).to_columns(batch_size=2)
+            self.assertEqual(columns['name'], ['S1', 'S2', 'S3'])
+            columns = select(g for g in Group if count(g.students) > 0).order_by(Group.number).to_columns(batch_size=1)
+            self.assertEqual(columns, {'number': [1, 2]})
+            self.assertEqual(db._get_cache().blocking_cursor, None)
+        finally: db.provider.server_side_cursor_blocks_connection = False
+
+    def test_plain_columns_are_not_converted(self):
+        converter = Student.name.converters[0]
+        converter.sql2py = None  # would fail if called
+        try: self.assertEqual(Student.select().order_by(Student.id).to_columns()['name'], ['S1', 'S2', 'S3'])
+        finally: del converter.sql2py
+
+    def test_empty_result(self):
+        columns = select(s.name for s in Student if s.age > 100).to_columns()
+        self.assertEqual(columns, {'s.name': []})
+
+    @raises_exception(TypeError, 'Batch size must be positive integer. Got: 0')
+    def test_batch_size(self):
+        Student.select().to_columns(batch_size=0)
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def test_arrays(self):
+        arrays = Student.select().order_by(Student.id).to_arrays(batch_size=2)
+        self.assertEqual(arrays['age'].dtype, numpy.int64)
+        self.assertEqual(arrays['age'].tolist(), [20, 21, 22])
+        self.assertEqual(arrays['gpa'].dtype, numpy.float64)
+        self.assertTrue(numpy.isnan(arrays['gpa'][1]))
+        self.assertEqual(arrays['dob'].dtype, numpy.dtype('datetime64[D]'))
+        self.assertTrue(numpy.isnat(arrays['dob'][2]))
+        self.assertEqual(arrays['name'].dtype, object)
+        self.assertEqual(arrays['scholarship'][0], Decimal('100.50'))
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def test_empty_arrays(self):
+        arrays = select(s.age for s in Student if s.age > 100).to_arrays()
+        self.assertEqual(len(arrays['s.age']), 0)
+        self.assertEqual(arrays['s.age'].dtype, numpy.int64)
+
+    @unittest.skipIf(numpy is not None, 'NumPy is installed')
+    @raises_exception(ImportError, 'NumPy package is required for query.to_arrays() method')
+    def test_arrays_without_numpy(self):
+        Student.select().to_arrays()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+from __future__ import absolute_import, print_function, division
+
+import unittest
+from time import sleep
+
+from pony.orm.core import *
+from pony.orm.tests.testutils import *
+
+class TestQueryResultCache(unittest.TestCase):
+    def setUp(self):
+        db = self.db = Database('sqlite', ':memory:')
+
+        class Group(db.Entity):
+            number = PrimaryKey(int)
+            students = Set('Student')
+
+        class Student(db.Entity):
+            name = Required(unicode)
+            age = Required(int)
+            group = Required(Group)
+            courses = Set('Course')
+
+        class Course(db.Entity):
+            name = PrimaryKey(unicode)
+            students = Set(Student)
+
+        db.generate_mapping(create_tables=True)
+        with db_session:
+            g1 = Group(number=1)
+            g2 = Group(number=2)
+            c1 = Course(name='Math')
+            c2 = Course(name='Physics')
+            Student(name='A', age=20, group=g1, courses=[c1])
+            Student(name='B', age=21, group=g1, courses=[c1, c2])
+            Student(name='C', age=22, group=g2)
+
+    def tearDown(self):
+        self.db = None
+
+    def executed(self, func):
+        db = self.db
+        db.merge_local_stats()
+        with db_session: result = func()
+        count = sum(stat.db_count for stat in db.local_stats.values())
+        db.merge_local_stats()
+        return result, count
+
+    def names(self, min_age):
+        Student = self.db.Student
+        return sorted(s.name for s in select(s for s in Student if s.age >= min_age).cache())
+
+    def test_hit_in_other_session(self):
+        self.assertEqual(self.executed(lambda: self.names(21)), (['B', 'C'], 1))
+        self.assertEqual(self.executed(lambda: self.names(21)), (['B', 'C'], 0))
+        self.assertEqual(self.executed(lambda: self.names(22)), (['C'], 1))
+        self.assertEqual(self.db.query_cache_stats['result_cache']['size'], 2)
+
+    def test_not_cached_without_option(self):
+        Student = self.db.Student
+        func = lambda: select(s for s in Student if s.age >= 21).count()
+        self.assertEqual(self.executed(func), (2, 1))
+        self.assertEqual(self.executed(func), (2, 1))
+
+    def test_invalidation_on_commit(self):
+        self.executed(lambda: self.names(21))
+        with db_session: self.db.Student[1].age = 30
+        self.assertEqual(self.executed(lambda: self.names(21)), (['A', 'B', 'C'], 1))
+        self.assertEqual(self.executed(lambda: self.names(21)), (['A', 'B', 'C'], 0))
+
+    def test_other_table_write_keeps_result(self):
+        self.executed(lambda: self.names(21))
+        with db_session: self.db.Group(number=3)
+        self.assertEqual(self.executed(lambda: self.names(21)), (['B', 'C'], 0))
+
+    def test_own_changes_are_visible(self):
+        self.executed(lambda: self.names(21))
+        with db_session:
+            self.db.Student[1].age = 30
+            self.assertEqual(self.names(21), ['A', 'B', 'C'])
+            rollback()
+        self.assertEqual(self.executed(lambda: self.names(21)), (['B', 'C'], 0))
+
+    def test_aggregate(self):
+        Student = self.db.Student
+        func = lambda: select(s for s in Student if s.group.number == 1).cache().count()
+        self.assertEqual(self.executed(func), (2, 1))
+        self.assertEqual(self.executed(func), (2, 0))
+        with db_session: Student(name='D', age=23, group=1)
+        self.assertEqual(self.executed(func), (3, 1))
+
+    def test_many_to_many_invalidation(self):
+        Student = self.db.Student
+        func = lambda: select(s.name for s in Student if 'Physics' in s.courses.name).cache()[:]
+        self.assertEqual(self.executed(func), (['B'], 1))
+        self.assertEqual(self.executed(func), (['B'], 0))
+        with db_session: Student[1].courses.add(self.db.Course['Physics'])
+        self.assertEqual(sorted(self.executed(func)[0]), ['A', 'B'])
+
+    def test_bulk_delete_invalidation(self):
+        self.executed(lambda: self.names(21))
+        with db_session: self.db.Student.select(lambda s: s.age == 22).delete(bulk=True)
+        self.assertEqual(self.executed(lambda: self.names(21)), (['B'], 1))
+
+    def test_raw_sql_invalidation(self):
+        self.executed(lambda: self.names(21))
+        with db_session: self.db.execute('update "Group" set "number" = "number"')
+        self.assertEqual(self.executed(lambda: self.names(21)), (['B', 'C'], 1))
+
+    def test_ttl(self):
+        Student = self.db.Student
+        func = lambda: select(s.name for s in Student if s.age == 20).cache(ttl=0.2)[:]
+        self.assertEqual(self.executed(func), (['A'], 1))
+        self.assertEqual(self.executed(func), (['A'], 0))
+        sleep(0.3)
+        self.assertEqual(self.executed(func), (['A'], 1))
+
+    def test_clear(self):
+        self.executed(lambda: self.names(21))
+        self.db.clear_query_caches(global_caches=False)
+        self.assertEqual(self.executed(lambda: self.names(21)), (['B', 'C'], 1))
+
+    @raises_exception(TypeError, 'Cache ttl must be positive number of seconds. Got: 0')
+    def test_invalid_ttl(self):
+        with db_session: select(s for s in self.db.Student).cache(ttl=0)
+
+    @raises_exception(TypeError, 'Query with for_update() option cannot be cached')
+    def test_for_update(self):
+        with db_session: select(s for s in self.db.Student).for_update().cache()
+
+    @raises_exception(TypeError, 'Query with for_update() option cannot be cached')
+    def test_cache_then_for_update(self):
+        with db_session: select(s for s in self.db.Student).cache().for_update()
+
+    @raises_exception(TranslationError, 'SQLite provider does not support SELECT FOR UPDATE NOWAIT syntax')
+    def test_for_update_nowait(self):
+        with db_session: select(s for s in self.db.Student).for_update(nowait=True)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+from __future__ import absolute_import, print_function, division
+
+import unittest
+
+from pony.orm.core import *
+from pony.orm.tests.testutils import *
+
+db = Database('sqlite', ':memory:')
+
+class Person(db.Entity):
+    name = Required(unicode, unique=True)
+    age = Required(int)
+    group = Optional('Group')
+
+class Group(db.Entity):
+    number = PrimaryKey(int)
+    persons = Set(Person)
+
+db.generate_mapping(create_tables=True)
+
+with db_session:
+    g = Group(number=1)
+    for i in range(10): Person(id=i+1, name='P%d' % i, age=20+i, group=g if i % 2 else None)
+
+class TestQueryStreaming(unittest.TestCase):
+    def setUp(self):
+        rollback()
+        db_session.__enter__()
+    def tearDown(self):
+        rollback()
+        db_session.__exit__()
+    def test_iter_chunks(self):
+        chunks = list(select(p for p in Person).order_by(Person.id).iter_chunks(4))
+        self.assertEqual([ len(chunk) for chunk in chunks ], [4, 4, 2])
+        self.assertEqual([ p.id for chunk in chunks for p in chunk ], list(range(1, 11)))
+    def test_stream_tuples(self):
+        result = list(select((p.name, p.age) for p in Person if p.age > 25).order_by(1).stream(chunk_size=3))
+        self.assertEqual(result, [('P6', 26), ('P7', 27), ('P8', 28), ('P9', 29)])
+    def test_stream_attribute(self):
+        result = list(select(p.age for p in Person if p.age < 23).stream(2))
+        self.assertEqual(sorted(result), [20, 21, 22])
+    def test_evict(self):
+        cache = db._get_cache()
+        names = []
+        for p in select(p for p in Person).order_by(Person.id).stream(chunk_size=3, evict=True):
+            names.append(p.name)
+            self.assertTrue(len(cache.objects) <= 4)  # current chunk and group object
+        self.assertEqual(len(names), 10)
+        self.assertEqual(Person.get(name='P0').age, 20)
+    def test_evict_keeps_modified(self):
+        cache = db._get_cache()
+        for chunk in select(p for p in Person).order_by(Person.id).iter_chunks(5, evict=True):
+            chunk[0].age += 100
+        self.assertEqual(len([ obj for obj in cache.objects if isinstance(obj, Person) ]), 2)
+        flush()
+        self.assertEqual(select(p.id for p in Person if p.age > 100)[:], [1, 6])
+    def test_evicted_object_is_detached(self):
+        objects = list(select(p for p in Person if p.id == 1).stream(evict=True))
+        p = objects[0]
+        self.assertEqual(p._session_cache_, None)
+        self.assertEqual(p.name, 'P0')
+        self.assertFalse(Person[1] is p)
+    def test_blocking_cursor(self):
+        db.provider.server_side_cursor_blocks_connection = True
+        try:
+            for chunk in select(p for p in Person).order_by(Person.id).iter_chunks(5):
+                with self.assertRaises(TransactionError) as cm: Group[1].persons.count()
+                self.assertTrue(cm.exception.args[0].startswith('Cannot execute SQL command while results '
+                                                                'of a streaming query are being read'))
+                self.assertRaises(TransactionError, commit)
+            self.assertEqual(db._get_cache().blocking_cursor, None)
+            self.assertEqual(Group[1].persons.count(), 5)
+        finally: db.provider.server_side_cursor_blocks_connection = False
+    def test_blocking_cursor_primary_key_query(self):
+        db.provider.server_side_cursor_blocks_connection = True
+        try:
+            chunks = list(select(g for g in Group if count(g.persons) > 1).iter_chunks(1))
+            self.assertEqual(chunks, [[Group[1]]])
+            self.assertEqual(db._get_cache().blocking_cursor, None)
+        finally: db.provider.server_side_cursor_blocks_connection = False
+    @raises_exception(TypeError, 'prefetch() cannot be combined with streaming on SQLite, because related objects '
+                                 'cannot be loaded while the server-side cursor is open')
+    def test_blocking_cursor_prefetch(self):
+        db.provider.server_side_cursor_blocks_connection = True
+        try: next(select(p for p in Person).prefetch(Person.group).stream())
+        finally: db.provider.server_side_cursor_blocks_connection = False
+    @raises_exception(TypeError, 'Chunk size must be positive integer. Got: 0')
+    def test_incorrect_size(self):
+        select(p for p in Person).iter_chunks(0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+from __future__ import absolute_import, print_function, division
+
+import unittest, warnings
+
+from pony.orm.core import *
+from pony.orm.tests.testutils import *
+
+db = Database('sqlite', ':memory:')
+
+class Person(db.Entity):
+    name = Required(unicode)
+    age = Optional(int)
+    enrollments = Set('Enrollment')
+
+class Student(Person):
+    gpa = Optional(float)
+
+class Course(db.Entity):
+    title = Required(unicode)
+    enrollments = Set('Enrollment')
+
+class Enrollment(db.Entity):
+    person = Required(Person)
+    course = Required(Course)
+    grade = Optional(int, py_check=lambda val: 1 <= val <= 5)
+    PrimaryKey(person, course)
+
+db.generate_mapping(create_tables=True)
+
+with db_session:
+    p1 = Person(id=1, name='John', age=40)
+    s1 = Student(id=2, name='Mike', gpa=4.5)
+    c1 = Course(id=1, title='Math')
+    Enrollment(person=p1, course=c1, grade=5)
+    Enrollment(person=s1, course=c1)
+
+class CaseInsensitiveDiscriminator(Discriminator):
+    def validate(attr, val, obj=None, entity=None, from_db=False):
+        if from_db: return val.upper()
+        return Discriminator.validate(attr, val, obj, entity, from_db)
+
+db2 = Database('sqlite', ':memory:')
+
+class Animal(db2.Entity):
+    kind = CaseInsensitiveDiscriminator(unicode)
+    _discriminator_ = 'ANIMAL'
+    name = Required(unicode)
+
+class Dog(Animal):
+    _discriminator_ = 'DOG'
+
+db2.generate_mapping(create_tables=True)
+
+class TestRowParser(unittest.TestCase):
+    def setUp(self):
+        rollback()
+        db_session.__enter__()
+
+    def tearDown(self):
+        rollback()
+        db_session.__exit__()
+
+    def test_parser_is_reused(self):
+        Person.select()[:]
+        parsers = dict(Person._row_parsers_)
+        self.assertTrue(parsers)
+        rollback()
+        Person.select()[:]
+        self.assertEqual(Person._row_parsers_, parsers)
+
+    def test_inheritance(self):
+        persons = Person.select().order_by(Person.id)[:]
+        self.assertEqual([ p.__class__ for p in persons ], [ Person, Student ])
+        self.assertEqual(persons[1].gpa, 4.5)
+        self.assertEqual(persons[1]._discriminator_, 'Student')
+
+    def test_discriminator_is_converted(self):
+        with db_session:
+            db2.execute("insert into Animal (id, kind, name) values (1, 'dog', 'Rex')")
+            animals = Animal.select_by_sql('select * from Animal')
+            self.assertEqual([ a.__class__ for a in animals ], [ Dog ])
+            rollback()
+
+    def test_unknown_discriminator(self):
+        db.execute("update Person set classtype = 'Teacher' where id = 1")
+        with self.assertRaises(KeyError) as cm: Person.select_by_sql('select * from Person')
+        self.assertEqual(cm.exception.args, ('Teacher',))
+
+    def test_composite_key(self):
+        enrollments = Enrollment.select().order_by(Enrollment.person)[:]
+        self.assertEqual([ e._pkval_ for e in enrollments ], [ (Person[1], Course[1]), (Person[2], Course[1]) ])
+        self.assertEqual([ e.grade for e in enrollments ], [ 5, None ])
+
+    def test_empty_required_value(self):
+        db.execute("update Person set name = '' where id = 1")
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            self.assertEqual(Person[1].name, '')
+        self.assertEqual([ x.category for x in w ], [ DatabaseContainsIncorrectEmptyValue ])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+from __future__ import absolute_import, print_function, division
+
+import time, unittest
+
+from pony.orm.core import *
+from pony.orm.entitycache import LocalCacheBackend, SerializingCacheBackend
+from pony.orm.tests.testutils import *
+
+class TestLocalCacheBackend(unittest.TestCase):
+    def test_ttl(self):
+        backend = LocalCacheBackend()
+        backend.set('a', 1, ttl=0.01)
+        backend.set('b', 2)
+        self.assertEqual(backend.get_many([ 'a', 'b', 'c' ]), { 'a': 1, 'b': 2 })
+        time.sleep(0.02)
+        self.assertEqual(backend.get('a'), None)
+        self.assertEqual(backend.get('b'), 2)
+    def test_maxsize(self):
+        backend = LocalCacheBackend(maxsize=2)
+        for i in range(3): backend.set(i, i)
+        self.assertEqual(backend.get(0), None)
+        self.assertEqual(backend.stats['evictions'], 1)
+    def test_serializing(self):
+        backend = SerializingCacheBackend()
+        value = [ 1, 2 ]
+        backend.set(('Tenant', 1), value)
+        result = backend.get(('Tenant', 1))
+        self.assertEqual(result, value)
+        self.assertIsNot(result, value)
+
+class TestSecondLevelCache(unittest.TestCase):
+    def setUp(self):
+        db = self.db = Database('sqlite', ':memory:')
+
+        class Tenant(db.Entity):
+            _second_level_cache_ = True
+            name = Required(unicode)
+            users = Set('User')
+
+        class User(db.Entity):
+            tenant = Required(Tenant)
+            name = Required(unicode)
+
+        db.generate_mapping(create_tables=True)
+        with db_session:
+            for i in range(1, 4): Tenant(id=i, name='T%d' % i)
+            for i in range(1, 4): User(id=i, tenant=Tenant[1], name='U%d' % i)
+        db.set_second_level_cache(SerializingCacheBackend())
+        with db_session: select(t for t in Tenant)[:]
+        db.merge_local_stats()
+    def tearDown(self):
+        self.db = None
+    def tenant_selects(self):
+        return sum(stat.db_count for sql, stat in self.db.local_stats.items()
+                   if sql.startswith('SELECT') and 'FROM "Tenant"' in sql)
+    def test_get(self):
+        db = self.db
+        with db_session:
+            self.assertEqual(db.Tenant[2].name, 'T2')
+        self.assertEqual(self.tenant_selects(), 0)
+        self.assertEqual(db.second_level_cache.hits, 1)
+    def test_load_seeds(self):
+        db = self.db
+        with db_session:
+            self.assertEqual(set(u.tenant.name for u in db.User.select()), { 'T1' })
+        self.assertEqual(self.tenant_selects(), 0)
+    @raises_exception(ObjectNotFound, 'Tenant[4]')
+    def test_missing(self):
+        with db_session: self.db.Tenant[4]
+    def test_update(self):
+        db = self.db
+        with db_session: db.Tenant[1].name = 'X'
+        with db_session: self.assertEqual(db.Tenant[1].name, 'X')
+        self.assertEqual(self.tenant_selects(), 1)
+        with db_session: self.assertEqual(db.Tenant[1].name, 'X')
+        self.assertEqual(self.tenant_selects(), 1)
+    def test_delete(self):
+        db = self.db
+        with db_session: db.Tenant[3].delete()
+        with db_session: self.assertEqual(db.Tenant.get(id=3), None)
+    def test_rollback(self):
+        db = self.db
+        with db_session:
+            db.Tenant[1].name = 'X'
+            flush()
+            select(t for t in db.Tenant)[:]
+            rollback()
+        with db_session: self.assertEqual(db.Tenant[1].name, 'T1')
+    def test_rollback_publishes_nothing(self):
+        db = self.db
+        db.second_level_cache.clear()
+        with db_session:
+            select(t for t in db.Tenant)[:]
+            rollback()
+        self.assertEqual(db.second_level_cache.stats['backend']['size'], 0)
+    def test_row_invalidated_after_read(self):
+        db = self.db
+        second_level_cache = db.second_level_cache
+        second_level_cache.clear()
+        with db_session:
+            self.assertEqual(db.Tenant[1].name, 'T1')
+            db.Tenant[2].name
+            # another session commits a change of Tenant[1] after it was read here
+            second_level_cache.delete_many([ db.Tenant._get_second_level_key_((1,)) ])
+        self.assertEqual(second_level_cache.stats['skipped'], 1)
+        self.assertEqual(second_level_cache.stats['backend']['size'], 1)
+        db.merge_local_stats()
+        with db_session: db.Tenant[1].name
+        self.assertEqual(self.tenant_selects(), 1)
+    def test_raw_sql(self):
+        db = self.db
+        with db_session: db.execute("update Tenant set name = 'X' where id = 1")
+        with db_session: self.assertEqual(db.Tenant[1].name, 'X')
+    def test_bulk_delete(self):
+        db = self.db
+        with db_session: select(t for t in db.Tenant if t.id > 1).delete(bulk=True)
+        self.assertEqual(db.second_level_cache.stats['backend']['size'], 0)
+        with db_session: self.assertEqual(count(t for t in db.Tenant), 1)
+    def test_ttl(self):
+        db = self.db
+        db.second_level_cache.ttl = 0.01
+        db.second_level_cache.clear()
+        with db_session: select(t for t in db.Tenant)[:]
+        time.sleep(0.02)
+        with db_session: db.Tenant[1].name
+        self.assertEqual(self.tenant_selects(), 2)
+    @raises_exception(TypeError, 'Second-level cache can be configured for root entity Tenant only')
+    def test_subclass(self):
+        class Tenant(Database().Entity):
+            _second_level_cache_ = True
+            name = Required(unicode)
+        class SpecialTenant(Tenant):
+            _second_level_cache_ = False
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,195 @@
+from __future__ import absolute_import, print_function, division
+
+import unittest
+
+from pony.orm.core import *
+from pony.orm.core import local, get_user_roles
+from pony.orm.tests.testutils import *
+
+db = Database('sqlite', ':memory:')
+
+class Group(db.Entity):
+    number = PrimaryKey(int)
+    major = Required(unicode)
+    students = Set('Student')
+
+class Student(db.Entity):
+    name = Required(unicode)
+    group = Required(Group)
+    courses = Set('Course')
+
+class Course(db.Entity):
+    name = Required(unicode)
+    students = Set(Student)
+
+db.generate_mapping(create_tables=True)
+
+with db_session:
+    g1 = Group(number=1, major='Math')
+    g2 = Group(number=2, major='Physics')
+    c1 = Course(name='C1')
+    for i in range(1, 21):
+        Student(id=i, name='S%d' % i, group=g1 if i % 2 else g2, courses=[c1] if i <= 3 else [])
+
+db2 = Database('sqlite', ':memory:')
+
+class Person(db2.Entity):
+    name = Required(unicode)
+    marks = Set('Mark')
+
+class Subject(db2.Entity):
+    marks = Set('Mark')
+
+class Mark(db2.Entity):
+    person = Required(Person)
+    subject = Required(Subject)
+    value = Optional(int)
+    PrimaryKey(person, subject)
+
+db2.generate_mapping(create_tables=True)
+
+with db_session:
+    Mark(person=Person(id=1, name='P1'), subject=Subject(id=1), value=5)
+
+class TestSessionEviction(unittest.TestCase):
+    def setUp(self):
+        rollback()
+        db_session.__enter__()
+        self.cache = db._get_cache()
+
+    def tearDown(self):
+        rollback()
+        db_session.__exit__()
+
+    def test_evict(self):
+        s1 = Student[1]
+        self.assertTrue(self.cache.evict(s1))
+        self.assertEqual(s1._session_cache_, None)
+        self.assertEqual(s1.name, 'S1')
+        self.assertFalse(s1 in self.cache.objects)
+        self.assertFalse(Student[1] is s1)
+
+    def test_modified_object_is_not_evicted(self):
+        s1 = Student[1]
+        s1.name = 'New name'
+        self.assertFalse(self.cache.evict(s1))
+        flush()
+        self.assertEqual(Student[1].name, 'New name')
+
+    def test_user_roles_are_evicted(self):
+        s1, s2 = Student[1], Student[2]
+        self.assertEqual(get_user_roles(s1, s2), frozenset())
+        self.assertEqual(get_user_roles(s2, s2), frozenset(['self']))
+        self.cache.evict(s2)
+        self.assertFalse(s2 in local.user_roles_cache[s1])
+        self.assertFalse(s2 in local.user_roles_cache)
+
+    def test_evict_entity(self):
+        students = Student.select()[:]
+        students[0].name = 'New name'
+        self.assertEqual(self.cache.evict_entity(Student), 19)
+        self.assertEqual([ obj for obj in self.cache.objects if isinstance(obj, Student) ], [ students[0] ])
+
+    def test_loaded_collection(self):
+        g1 = Group[1]
+        self.assertEqual(len(g1.students), 10)
+        s1 = Student[1]
+        self.cache.evict(s1)
+        self.assertFalse(g1._vals_[Group.students].is_fully_loaded)
+        students = set(g1.students)
+        self.assertEqual(len(students), 10)
+        self.assertTrue(Student[1] in students)
+        self.assertFalse(s1 in students)
+
+    def test_many_to_many_collection(self):
+        c1 = Course[1]
+        self.assertEqual(len(c1.students), 3)
+        s1 = Student[1]
+        self.cache.evict(s1)
+        self.assertFalse(s1 in c1._vals_[Course.students])
+        self.assertEqual(set(s.id for s in c1.students), {1, 2, 3})
+
+    def test_evicted_reference(self):
+        s1 = Student[1]
+        g1 = s1.group
+        self.assertEqual(g1.major, 'Math')
+        self.cache.evict(g1)
+        g = s1.group
+        self.assertFalse(g is g1)
+        self.assertTrue(g._session_cache_ is self.cache)
+        self.assertEqual(g.major, 'Math')
+        s1.name = 'New name'
+        flush()
+
+    def test_reselect_referrer_of_evicted_object(self):
+        s1 = Student[1]
+        g1 = s1.group
+        self.cache.evict(g1)
+        self.assertFalse(s1._vals_[Student.group] is g1)
+        self.assertFalse(s1._dbvals_[Student.group] is g1)
+        students = select(s for s in Student if s.id < 3)[:]
+        self.assertTrue(s1 in students)
+        self.assertEqual(s1.group.major, 'Math')
+
+    def test_reselect_after_evict_entity(self):
+        students = Student.select()[:]
+        self.assertEqual(set(s.group.number for s in students), {1, 2})
+        self.assertEqual(self.cache.evict_entity(Group), 2)
+        self.assertEqual(len(Student.select()[:]), 20)
+        self.assertEqual(set(s.group.major for s in students), {'Math', 'Physics'})
+        students[0].name = 'New name'
+        flush()
+
+    def test_evicted_part_of_primary_key(self):
+        mark = Mark.select()[:][0]
+        person = mark.person
+        db2._get_cache().evict(person)
+        self.assertEqual(Mark.select()[:], [ mark ])
+        self.assertTrue(Mark[Person[1], Subject[1]] is mark)
+        self.assertFalse(mark.person is person)
+
+    def test_query_results_are_not_reused(self):
+        query = select(s for s in Student if s.id < 3)
+        s1 = query[:][0]
+        self.cache.evict(s1)
+        self.assertFalse(s1 in query[:])
+
+class TestMaxObjects(unittest.TestCase):
+    @raises_exception(TypeError, "'max_objects' parameter of db_session must be positive integer. Got: 0")
+    def test_incorrect_value(self):
+        db_session(max_objects=0)
+
+    def test_bounded_session(self):
+        with db_session(max_objects=5):
+            cache = db._get_cache()
+            for i in range(1, 21):
+                s = Student[i]
+                self.assertEqual(s.name, 'S%d' % i)
+                self.assertTrue(len(cache.objects) <= 6)  # object with its group
+            self.assertEqual(Student[20].group.major, 'Physics')
+
+    def test_modified_objects_are_kept(self):
+        with db_session(max_objects=5):
+            cache = db._get_cache()
+            modified = []
+            for s in select(s for s in Student).order_by(Student.id).stream(chunk_size=4):
+                if s.id % 5 == 0:
+                    s.name += '!'
+                    modified.append(s)
+            for s in modified: self.assertTrue(s in cache.objects)
+            self.assertTrue(len(cache.objects) <= len(modified) + 5)
+        with db_session:
+            self.assertEqual(select(s.id for s in Student if s.name.endswith('!'))[:], [ 5, 10, 15, 20 ])
+            for s in Student.select(lambda s: s.name.endswith('!')): s.name = s.name[:-1]
+
+    def test_query_result(self):
+        with db_session(max_objects=3):
+            students = select(s for s in Student if s.id <= 10)[:]
+            cache = db._get_cache()
+            self.assertTrue(all(s in cache.objects for s in students))
+            select(s for s in Student if s.id > 15)[:]
+            self.assertEqual(len([ s for s in students if s in cache.objects ]), 0)
+            self.assertEqual(students[0].name, 'S1')
+
+if __name__ == '__main__':
+    unittest.main()
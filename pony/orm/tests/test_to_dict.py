@@ -174,6 +174,40 @@ class TestObjectToDict(unittest.TestCase):
         d = c.to_dict()  # should do flush and get c.id from the database
         self.assertEqual(d, dict(id=4, name='New Course'))
 
+    def test25(self):
+        s1 = Student[1]
+        s1.to_dict(with_collections=True)
+        s2 = Student[2]
+        s2.to_dict(with_collections=True)
+        attrs = Student._get_attrs_(with_collections=True)
+        self.assertEqual([ key for key in Student._serializers_ if key[0] == attrs ], [ (attrs, False) ])
+
+    def test26(self):
+        s1 = Student[1]
+        s1.to_dict()
+        self.assertTrue(s1._rbits_ & Student._bits_[Student.name])
+        self.assertFalse(s1._rbits_ & Student._bits_[Student.biography])
+
+    def test27(self):
+        s1 = Student[1]
+        self.assertTrue(Student.biography not in s1._vals_)
+        d = s1.to_dict(only='id biography')
+        self.assertEqual(d, dict(id=1, biography='some text'))
+
+    def test28(self):
+        s1 = Student[1]
+        g1 = s1.group
+        db._get_cache().evict(g1)
+        self.assertEqual(s1.to_dict(only='group', related_objects=True), dict(group=Group[1]))
+        self.assertFalse(Group[1] is g1)
+
+    @raises_exception(OperationWithDeletedObjectError, 'Student[4] was deleted')
+    def test29(self):
+        s4 = Student[4]
+        s4.delete()
+        flush()
+        s4.to_dict()
+
 class TestSerializationToDict(unittest.TestCase):
     def setUp(self):
         rollback()
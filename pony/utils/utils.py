@@ -7,7 +7,7 @@ from datetime import datetime
 from itertools import count as _count
 from inspect import isfunction
 from time import strptime
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from functools import update_wrapper, wraps
 from xml.etree import cElementTree
 from copy import deepcopy
@@ -21,6 +21,8 @@ from pony.thirdparty.decorator import decorator as _decorator
 if pony.MODE.startswith('GAE-'): localbase = object
 else: from threading import local as localbase
 
+from threading import Lock
+
 
 class PonyDeprecationWarning(DeprecationWarning):
     pass
@@ -423,3 +425,63 @@ class HashableDict(dict):
     popitem = _hashable_wrap(dict.popitem)
     setdefault = _hashable_wrap(dict.setdefault)
     update = _hashable_wrap(dict.update)
+
+_missing = object()
+
+class LRUCache(object):
+    def __init__(cache, maxsize=None):
+        if maxsize is not None and maxsize < 0: throw(ValueError, 'Cache size cannot be negative: %r' % maxsize)
+        cache.maxsize = maxsize
+        cache._data = OrderedDict()
+        cache._lock = Lock()
+        cache.hits = cache.misses = cache.evictions = 0
+    def __len__(cache):
+        return len(cache._data)
+    def __contains__(cache, key):
+        return key in cache._data
+    def __iter__(cache):
+        return iter(list(cache._data))
+    def __getitem__(cache, key):
+        result = cache.get(key, _missing)
+        if result is _missing: raise KeyError(key)
+        return result
+    def get(cache, key, default=None):
+        data = cache._data
+        with cache._lock:
+            try: value = data.pop(key)
+            except KeyError:
+                cache.misses += 1
+                return default
+            data[key] = value
+            cache.hits += 1
+            return value
+    def __setitem__(cache, key, value):
+        data = cache._data
+        with cache._lock:
+            data.pop(key, None)
+            data[key] = value
+            cache._evict()
+    def __delitem__(cache, key):
+        with cache._lock: del cache._data[key]
+    def pop(cache, key, default=None):
+        with cache._lock: return cache._data.pop(key, default)
+    def _evict(cache):
+        maxsize = cache.maxsize
+        if maxsize is None: return
+        data = cache._data
+        while len(data) > maxsize:
+            data.popitem(last=False)
+            cache.evictions += 1
+    def resize(cache, maxsize):
+        if maxsize is not None and maxsize < 0: throw(ValueError, 'Cache size cannot be negative: %r' % maxsize)
+        with cache._lock:
+            cache.maxsize = maxsize
+            cache._evict()
+    def clear(cache):
+        with cache._lock: cache._data.clear()
+    def reset_stats(cache):
+        cache.hits = cache.misses = cache.evictions = 0
+    @property
+    def stats(cache):
+        return dict(size=len(cache._data), maxsize=cache.maxsize,
+                    hits=cache.hits, misses=cache.misses, evictions=cache.evictions)